@@ -0,0 +1,28 @@
+"""Add token_version to users
+
+Revision ID: 3b9c2f1d7a4e
+Revises: ff723d01685e
+Create Date: 2026-10-17 10:12:03.418227
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3b9c2f1d7a4e'
+down_revision: Union[str, Sequence[str], None] = 'ff723d01685e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('users', sa.Column('token_version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('users', 'token_version')
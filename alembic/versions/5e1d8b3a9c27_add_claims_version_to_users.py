@@ -0,0 +1,28 @@
+"""Add claims_version to users
+
+Revision ID: 5e1d8b3a9c27
+Revises: a7c3e9d2f614
+Create Date: 2026-10-17 18:41:26.530114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e1d8b3a9c27'
+down_revision: Union[str, Sequence[str], None] = 'a7c3e9d2f614'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('users', sa.Column('claims_version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('users', 'claims_version')
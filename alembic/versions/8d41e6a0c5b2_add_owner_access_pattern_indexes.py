@@ -0,0 +1,73 @@
+"""Add per-owner composite and partial indexes
+
+Revision ID: 8d41e6a0c5b2
+Revises: 3b9c2f1d7a4e
+Create Date: 2026-10-17 11:02:47.130942
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d41e6a0c5b2'
+down_revision: Union[str, Sequence[str], None] = '3b9c2f1d7a4e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Keep only the most recently started active task per owner so the
+    # partial unique index below can be built.
+    op.execute(
+        """
+        UPDATE tasks SET is_active = false, start_time = NULL
+        WHERE is_active AND id NOT IN (
+            SELECT DISTINCT ON (owner_id) id FROM tasks
+            WHERE is_active
+            ORDER BY owner_id, start_time DESC NULLS LAST, id DESC
+        )
+        """
+    )
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction.
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_tasks_owner_id_created_at', 'tasks',
+            ['owner_id', sa.text('created_at DESC'), sa.text('id DESC')],
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            'uq_tasks_owner_id_active', 'tasks', ['owner_id'],
+            unique=True,
+            postgresql_where=sa.text('is_active'),
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            'ix_tasks_open_inactive', 'tasks', ['id'],
+            postgresql_where=sa.text("status IN ('TO_DO', 'IN_PROGRESS') AND NOT is_active"),
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            'ix_notes_owner_id_created_at', 'notes',
+            ['owner_id', sa.text('created_at DESC'), sa.text('id DESC')],
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            'ix_habits_owner_id_created_at', 'habits',
+            ['owner_id', sa.text('created_at DESC'), sa.text('id DESC')],
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_habits_owner_id_created_at', table_name='habits', postgresql_concurrently=True)
+        op.drop_index('ix_notes_owner_id_created_at', table_name='notes', postgresql_concurrently=True)
+        op.drop_index('ix_tasks_open_inactive', table_name='tasks', postgresql_concurrently=True)
+        op.drop_index('uq_tasks_owner_id_active', table_name='tasks', postgresql_concurrently=True)
+        op.drop_index('ix_tasks_owner_id_created_at', table_name='tasks', postgresql_concurrently=True)
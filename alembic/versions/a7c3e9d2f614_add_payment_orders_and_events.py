@@ -0,0 +1,65 @@
+"""Add payment_orders and payment_events (Kashier webhook inbox)
+
+Revision ID: a7c3e9d2f614
+Revises: e2f80b7c4d19
+Create Date: 2026-10-17 16:02:44.118230
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7c3e9d2f614'
+down_revision: Union[str, Sequence[str], None] = 'e2f80b7c4d19'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'payment_orders',
+        sa.Column('order_id', sa.String(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('plan', sa.String(), nullable=True),
+        sa.Column('amount', sa.String(), nullable=True),
+        sa.Column('currency', sa.String(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='SET NULL'),
+        sa.PrimaryKeyConstraint('order_id'),
+    )
+    op.create_index(op.f('ix_payment_orders_user_id'), 'payment_orders', ['user_id'])
+
+    op.create_table(
+        'payment_events',
+        sa.Column('event_id', sa.String(), nullable=False),
+        sa.Column('event_type', sa.String(), nullable=True),
+        sa.Column('order_id', sa.String(), nullable=True),
+        sa.Column('payload', sa.Text(), nullable=False),
+        sa.Column('status', sa.String(), server_default='pending', nullable=False),
+        sa.Column('attempts', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('received_at', sa.DateTime(), nullable=False),
+        sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+        sa.Column('processed_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('event_id'),
+    )
+    op.create_index(op.f('ix_payment_events_order_id'), 'payment_events', ['order_id'])
+    op.create_index(
+        'ix_payment_events_pending',
+        'payment_events',
+        ['next_attempt_at'],
+        postgresql_where=sa.text("status = 'pending'"),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_payment_events_pending', table_name='payment_events')
+    op.drop_index(op.f('ix_payment_events_order_id'), table_name='payment_events')
+    op.drop_table('payment_events')
+    op.drop_index(op.f('ix_payment_orders_user_id'), table_name='payment_orders')
+    op.drop_table('payment_orders')
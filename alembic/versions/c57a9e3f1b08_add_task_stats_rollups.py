@@ -0,0 +1,48 @@
+"""Add task_stats_rollups table
+
+Revision ID: c57a9e3f1b08
+Revises: 8d41e6a0c5b2
+Create Date: 2026-10-17 12:20:15.774301
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c57a9e3f1b08'
+down_revision: Union[str, Sequence[str], None] = '8d41e6a0c5b2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'task_stats_rollups',
+        sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('month', sa.Date(), nullable=False),
+        sa.Column('category', sa.String(), nullable=False),
+        sa.Column('total_count', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('completed_count', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('estimated_hours', sa.Float(), server_default='0', nullable=False),
+        sa.PrimaryKeyConstraint('user_id', 'month', 'category'),
+    )
+    # Backfill from the existing tasks (same query as `python -m app.cli rebuild-rollups`).
+    op.execute(
+        """
+        INSERT INTO task_stats_rollups (user_id, month, category, total_count, completed_count, estimated_hours)
+        SELECT owner_id, date_trunc('month', created_at)::date, coalesce(category, ''),
+               count(*), sum(CASE WHEN completed THEN 1 ELSE 0 END), coalesce(sum(estimated_hours), 0)
+        FROM tasks
+        WHERE owner_id IS NOT NULL AND created_at IS NOT NULL
+        GROUP BY 1, 2, 3
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('task_stats_rollups')
@@ -0,0 +1,32 @@
+"""Add timezone and last_rollover_date to users
+
+Revision ID: e2f80b7c4d19
+Revises: c57a9e3f1b08
+Create Date: 2026-10-17 13:41:09.552810
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2f80b7c4d19'
+down_revision: Union[str, Sequence[str], None] = 'c57a9e3f1b08'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('users', sa.Column('timezone', sa.String(), server_default='UTC', nullable=False))
+    op.add_column('users', sa.Column('last_rollover_date', sa.Date(), nullable=True))
+    op.create_index('ix_users_timezone_last_rollover_date', 'users', ['timezone', 'last_rollover_date'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_users_timezone_last_rollover_date', table_name='users')
+    op.drop_column('users', 'last_rollover_date')
+    op.drop_column('users', 'timezone')
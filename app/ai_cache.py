@@ -0,0 +1,171 @@
+# app/ai_cache.py
+# ذاكرة نتائج تحليل Gemini: المستخدمون يعيدون إرسال نفس النص كثيراً، وكل استدعاء
+# يكلف ثواني وحصة من الـ API. المفتاح هو بصمة النص بعد توحيده مع إصدار قالب الـ prompt،
+# فتغيير القالب يُبطل النتائج القديمة تلقائياً.
+import hashlib
+import importlib
+import json
+import os
+import re
+import unicodedata
+from abc import ABC, abstractmethod
+from typing import Awaitable, Callable, List, Optional
+
+from dotenv import load_dotenv
+from fastapi.concurrency import run_in_threadpool
+
+from .cache import SingleFlight, TTLCache
+
+load_dotenv()
+
+AI_CACHE_MAXSIZE = int(os.getenv("AI_CACHE_MAXSIZE", 2000))
+AI_CACHE_TTL_SECONDS = float(os.getenv("AI_CACHE_TTL_SECONDS", 24 * 3600))
+# النتائج الأكبر من هذا الحد لا تُخزن حتى لا يستهلك نص طويل واحد الذاكرة
+AI_CACHE_MAX_ENTRY_BYTES = int(os.getenv("AI_CACHE_MAX_ENTRY_BYTES", 64 * 1024))
+# "redis" (مشترك بين العمليات، يستخدم REDIS_URL) أو مسار صنف بديل بصيغة "package.module:ClassName"
+AI_CACHE_BACKEND = os.getenv("AI_CACHE_BACKEND")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """توحيد أشكال الحروف (NFKC) والمسافات حتى تتطابق النصوص شبه المتطابقة."""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text)).strip()
+
+
+class AICacheBackend(ABC):
+    """واجهة مخزن النتائج. القيم نصوص JSON حتى يمكن مشاركتها بين العمليات."""
+
+    # المخازن الشبكية تُستدعى من المسارات غير المتزامنة عبر threadpool
+    blocking = False
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[str]:
+        ...
+
+    @abstractmethod
+    def set(self, key: str, value: str, ttl: float) -> None:
+        ...
+
+    def stats(self) -> dict:
+        return {}
+
+
+class InProcessAICacheBackend(AICacheBackend):
+    """المخزن الافتراضي داخل العملية (TTL + LRU)."""
+
+    def __init__(self, maxsize: int = AI_CACHE_MAXSIZE, ttl: float = AI_CACHE_TTL_SECONDS):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def get(self, key: str) -> Optional[str]:
+        return self._cache.get(key)
+
+    def set(self, key: str, value: str, ttl: float) -> None:
+        self._cache.set(key, value, ttl=ttl)
+
+    def stats(self) -> dict:
+        return self._cache.stats()
+
+
+class RedisAICacheBackend(AICacheBackend):
+    """
+    مخزن مشترك بين العمليات في Redis (يتطلب حزمة redis). كل عنصر ينتهي بمدة الصلاحية،
+    والحد الأقصى للحجم والإخراج بترتيب LRU مسؤولية خادم Redis (maxmemory + allkeys-lru).
+    """
+
+    blocking = True
+
+    def __init__(self, url: str = REDIS_URL, prefix: str = "ai_cache:", client=None):
+        if client is None:
+            import redis
+
+            client = redis.Redis.from_url(url)
+        self._redis = client
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[str]:
+        raw = self._redis.get(self.prefix + key)
+        if raw is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return raw.decode("utf-8") if isinstance(raw, bytes) else raw
+
+    def set(self, key: str, value: str, ttl: float) -> None:
+        self._redis.set(self.prefix + key, value, px=int(ttl * 1000))
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "backend": "redis",
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total) if total else 0.0,
+        }
+
+
+class AIResponseCache:
+    def __init__(self, backend: AICacheBackend, ttl: float = AI_CACHE_TTL_SECONDS, max_entry_bytes: int = AI_CACHE_MAX_ENTRY_BYTES):
+        self.backend = backend
+        self.ttl = ttl
+        self.max_entry_bytes = max_entry_bytes
+        self.flight = SingleFlight()
+        self.oversized = 0
+
+    @staticmethod
+    def key(text: str, prompt_version: str) -> str:
+        normalized = normalize_text(text)
+        return hashlib.sha256(f"{prompt_version}\n{normalized}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[List[dict]]:
+        value = self.backend.get(key)
+        return json.loads(value) if value is not None else None
+
+    def set(self, key: str, items: List[dict]) -> None:
+        value = json.dumps(items, ensure_ascii=False)
+        if len(value.encode("utf-8")) > self.max_entry_bytes:
+            self.oversized += 1
+            return
+        self.backend.set(key, value, self.ttl)
+
+    async def aget(self, key: str) -> Optional[List[dict]]:
+        if self.backend.blocking:
+            return await run_in_threadpool(self.get, key)
+        return self.get(key)
+
+    async def aset(self, key: str, items: List[dict]) -> None:
+        if self.backend.blocking:
+            await run_in_threadpool(self.set, key, items)
+        else:
+            self.set(key, items)
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[List[dict]]]) -> List[dict]:
+        """من الذاكرة، وإلا استدعاء واحد مشترك لكل الطلبات المتزامنة بنفس المفتاح."""
+        cached = await self.aget(key)
+        if cached is not None:
+            return cached
+
+        async def fill() -> List[dict]:
+            items = await compute()
+            await self.aset(key, items)
+            return items
+
+        return await self.flight.do(key, fill)
+
+    def stats(self) -> dict:
+        return {**self.backend.stats(), **self.flight.stats(), "oversized": self.oversized}
+
+
+def _load_backend() -> AICacheBackend:
+    if not AI_CACHE_BACKEND:
+        return InProcessAICacheBackend()
+    if AI_CACHE_BACKEND == "redis":
+        return RedisAICacheBackend()
+    module_name, _, class_name = AI_CACHE_BACKEND.partition(":")
+    return getattr(importlib.import_module(module_name), class_name)()
+
+
+ai_cache = AIResponseCache(_load_backend())
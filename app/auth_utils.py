@@ -1,27 +1,54 @@
 # app/auth_utils.py - الكود النهائي باستخدام PBKDF2-SHA256
 
 import os
+import time
+import asyncio
+import hashlib
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta, timezone
-from typing import Optional
+from typing import Optional, Tuple
 
 from passlib.context import CryptContext
 from jose import JWTError, jwt
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer
 from dotenv import load_dotenv
 
 load_dotenv()
 
+from .cache import TTLCache
+
 # --- إعدادات JWT (بدون تغيير) ---
 SECRET_KEY = os.getenv("SECRET_KEY", "default_secret_key")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
 
+# إصدار صيغة التوكن: الصيغة 2 تحمل بيانات المستخدم كاملة داخل الـ claims
+TOKEN_FORMAT_VERSION = 2
+
 # --- إعداد تجزئة كلمة المرور ---
 # تغيير Scheme إلى pbkdf2_sha256
 # هذه الخوارزمية لا تفرض قيود 72 بايت وأكثر استقرارًا على Windows/Linux.
-pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
+# عدد الجولات قابل للضبط؛ أي تجزئة بعدد جولات مختلف يُعاد حسابها عند تسجيل الدخول.
+PBKDF2_ROUNDS = int(os.getenv("PBKDF2_ROUNDS", 29000))
+pwd_context = CryptContext(
+    schemes=["pbkdf2_sha256"],
+    deprecated="auto",
+    pbkdf2_sha256__default_rounds=PBKDF2_ROUNDS,
+    pbkdf2_sha256__min_rounds=PBKDF2_ROUNDS,
+    pbkdf2_sha256__max_rounds=PBKDF2_ROUNDS,
+)
+
+# عدد العمليات المخصصة للتجزئة (0 = استخدام threadpool، مناسب لبيئة Vercel)
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", 0 if os.getenv("VERCEL") else (os.cpu_count() or 1)))
+# الحد الأقصى لعمليات التجزئة المعلقة لكل عامل قبل أن تنتظر الطلبات الجديدة
+PASSWORD_HASH_QUEUE_PER_WORKER = int(os.getenv("PASSWORD_HASH_QUEUE_PER_WORKER", 4))
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token")
+# للمسارات التي تقبل الطلبات بدون تسجيل دخول (يعيد None بدلاً من 401)
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token", auto_error=False)
 
 # --- دوال المصادقة المصححة ---
 
@@ -38,19 +65,112 @@ def get_password_hash(password: str) -> str:
     # لا نحتاج لتقييد الطول هنا
     return pwd_context.hash(password)
 
+def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """التحقق من كلمة المرور وإرجاع تجزئة جديدة إذا تغيّر عدد الجولات المضبوط."""
+    try:
+        return pwd_context.verify_and_update(plain_password, hashed_password)
+    except:
+        return False, None
+
+# --- تنفيذ التجزئة خارج عمال الطلبات ---
+
+_hash_executor: Optional[ProcessPoolExecutor] = None
+_hash_executor_lock = threading.Lock()
+_hash_slots: Optional[asyncio.Semaphore] = None
+
+def _get_hash_executor() -> Optional[ProcessPoolExecutor]:
+    global _hash_executor, _hash_slots
+    if PASSWORD_HASH_WORKERS <= 0:
+        return None
+    with _hash_executor_lock:
+        if _hash_executor is None:
+            # spawn بدلاً من fork: العمال لا يرثون مقبس الاستماع ولا اتصالات قاعدة البيانات من
+            # عملية الخادم، فلا يبقى عامل يتيم يحجز المنفذ بعد إيقافها
+            _hash_executor = ProcessPoolExecutor(
+                max_workers=PASSWORD_HASH_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+            _hash_slots = asyncio.Semaphore(PASSWORD_HASH_WORKERS * PASSWORD_HASH_QUEUE_PER_WORKER)
+    return _hash_executor
+
+def shutdown_hash_executor():
+    global _hash_executor
+    with _hash_executor_lock:
+        if _hash_executor is not None:
+            # الانتظار حتى يستلم كل عامل إشارة الخروج؛ التجزئات الجارية تستغرق أجزاء من الثانية
+            _hash_executor.shutdown(wait=True, cancel_futures=True)
+            _hash_executor = None
+
+async def _run_hashing(func, *args):
+    executor = _get_hash_executor()
+    if executor is None:
+        return await run_in_threadpool(func, *args)
+    async with _hash_slots:
+        return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await _run_hashing(verify_password, plain_password, hashed_password)
+
+async def verify_and_update_password_async(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    return await _run_hashing(verify_and_update_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    return await _run_hashing(get_password_hash, password)
+
 # --- وظائف JWT (بدون تغيير) ---
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     expire = datetime.now(timezone.utc) + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
     
-    to_encode.update({"exp": expire, "sub": "access"})
+    to_encode.update({"exp": expire})
+    to_encode.setdefault("sub", "access")
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def create_user_access_token(user, expires_delta: Optional[timedelta] = None):
+    """إصدار توكن مكتفٍ ذاتياً يحمل الحقول التي تحتاجها المسارات، لتجنب جلب المستخدم من القاعدة."""
+    claims = {
+        "sub": user.email,
+        "fmt": TOKEN_FORMAT_VERSION,
+        "tv": user.token_version or 0,
+        "cv": user.claims_version or 0,
+        "email": user.email,
+        "user_id": user.id,
+        "name": user.name,
+        "is_active": bool(user.is_active),
+        "is_unlocked": bool(user.is_unlocked),
+        "plan": user.plan,
+        "subscription_id": user.subscription_id,
+        "expires_at": user.expires_at.isoformat() if user.expires_at else None,
+        "timezone": user.timezone or "UTC",
+    }
+    return create_access_token(claims, expires_delta=expires_delta)
+
+# --- ذاكرة التوكنات التي تم التحقق منها ---
+# نفس التوكن يُرسل عدة مرات عند تحميل لوحة التحكم؛ نتجنب إعادة التحقق من HMAC في كل مرة.
+# لا تُخزَّن إلا التوكنات الصالحة، وينتهي كل عنصر عند exp الخاص بالتوكن نفسه.
+TOKEN_CACHE_MAXSIZE = int(os.getenv("TOKEN_CACHE_MAXSIZE", 10000))
+TOKEN_CACHE_TTL_SECONDS = float(os.getenv("TOKEN_CACHE_TTL_SECONDS", 300))
+
+token_cache = TTLCache(maxsize=TOKEN_CACHE_MAXSIZE, ttl=TOKEN_CACHE_TTL_SECONDS)
+
 def decode_access_token(token: str):
+    token_digest = hashlib.sha256(token.encode()).digest()
+    cached = token_cache.get(token_digest)
+    if cached is not None:
+        payload, expires_at = cached
+        if expires_at > time.time():
+            return dict(payload)
+        token_cache.delete(token_digest)
+
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
     except JWTError:
-        return None
\ No newline at end of file
+        return None
+
+    exp = payload.get("exp")
+    if isinstance(exp, (int, float)):
+        remaining = exp - time.time()
+        if remaining > 0:
+            token_cache.set(token_digest, (dict(payload), exp), ttl=min(remaining, TOKEN_CACHE_TTL_SECONDS))
+    return payload
\ No newline at end of file
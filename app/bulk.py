@@ -0,0 +1,65 @@
+# app/bulk.py
+# التحقق المشترك لمسارات العمليات الجماعية (/tasks/bulk, /notes/bulk, /habits/bulk):
+# كل عنصر يُتحقق منه بنفس مخطط العملية المفردة، والعناصر غير الصالحة تُعاد كأخطاء
+# بموضعها في الطلب دون إفشال بقية الدفعة.
+from typing import Any, List, Tuple, Type
+
+from fastapi import HTTPException, status
+from pydantic import BaseModel, ValidationError
+
+from . import crud
+from .schemas import BulkItemError
+
+
+def check_size(count: int) -> None:
+    if count > crud.BULK_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {crud.BULK_MAX_ITEMS} items per request.",
+        )
+
+
+def validate_items(raw_items: List[Any], schema: Type[BaseModel], with_id: bool = False) -> Tuple[list, List[BulkItemError]]:
+    """
+    يعيد (العناصر الصالحة كـ (index, model) أو (index, id, model) عند with_id, أخطاء لكل عنصر).
+    """
+    check_size(len(raw_items))
+    valid, errors = [], []
+    for index, raw in enumerate(raw_items):
+        if not isinstance(raw, dict):
+            errors.append(BulkItemError(index=index, detail="Item must be an object"))
+            continue
+        item_id = None
+        if with_id:
+            raw = dict(raw)
+            item_id = raw.pop("id", None)
+            if not isinstance(item_id, int) or isinstance(item_id, bool):
+                errors.append(BulkItemError(index=index, detail="id is required"))
+                continue
+        try:
+            model = schema.model_validate(raw)
+        except ValidationError as e:
+            errors.append(BulkItemError(index=index, id=item_id, detail=[
+                {"loc": list(err["loc"]), "msg": err["msg"], "type": err["type"]} for err in e.errors()
+            ]))
+            continue
+        valid.append((index, item_id, model) if with_id else (index, model))
+    return valid, errors
+
+
+def created_items(valid: list, created: list) -> List[dict]:
+    """ربط الصفوف المنشأة (بترتيب الإدخال) بموضع كل عنصر في الطلب."""
+    return [{"index": index, "item": obj} for (index, _), obj in zip(valid, created)]
+
+
+def updated_items(updated: List[Tuple[int, Any]]) -> List[dict]:
+    return [{"index": index, "item": obj} for index, obj in updated]
+
+
+def not_found_errors(missing: List[Tuple[int, int]]) -> List[BulkItemError]:
+    return [BulkItemError(index=index, id=item_id, detail="Not found") for index, item_id in missing]
+
+
+def deleted_errors(ids: List[int], deleted: List[int]) -> List[BulkItemError]:
+    found = set(deleted)
+    return [BulkItemError(index=index, id=item_id, detail="Not found") for index, item_id in enumerate(ids) if item_id not in found]
@@ -0,0 +1,136 @@
+# app/cache.py
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# قيمة خاصة للتمييز بين "غير موجود" والقيمة None المخزنة
+_MISSING = object()
+
+
+class TTLCache:
+    """ذاكرة تخزين مؤقت داخل العملية بحد أقصى للحجم (LRU) ومدة صلاحية (TTL) لكل عنصر.
+
+    آمنة للاستخدام من عدة خيوط (threads) لأن المسارات المتزامنة تعمل على threadpool.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                self.misses += 1
+                return default
+            value, expires_at = item
+            if expires_at <= now:
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        if self.maxsize <= 0:
+            return
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        """عدادات الإصابة والإخفاق للتأكد من فعالية الذاكرة المؤقتة."""
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": (self.hits / total) if total else 0.0,
+        }
+
+
+class SingleFlight:
+    """دمج الطلبات المتزامنة بنفس المفتاح في استدعاء واحد داخل حلقة الأحداث.
+
+    الاستدعاء يعمل في مهمة مستقلة، فإلغاء الطلب الأول (انقطاع العميل) لا يلغيه على البقية.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.calls = 0
+        self.shared = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(fn())
+            self._inflight[key] = future
+            self.calls += 1
+            future.add_done_callback(lambda done: self._finish(key, done))
+        else:
+            self.shared += 1
+        return await asyncio.shield(future)
+
+    def _finish(self, key: Hashable, future: asyncio.Future) -> None:
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+        # قراءة الاستثناء حتى لا يُسجل "never retrieved" إذا أُلغي كل المنتظرين
+        if not future.cancelled():
+            future.exception()
+
+    def stats(self) -> dict:
+        return {"calls": self.calls, "shared": self.shared, "inflight": len(self._inflight)}
+
+
+# --- ذاكرة المستخدمين المصادق عليهم (مفتاحها البريد الإلكتروني من التوكن) ---
+USER_CACHE_MAXSIZE = int(os.getenv("USER_CACHE_MAXSIZE", 10000))
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", 60))
+
+user_cache = TTLCache(maxsize=USER_CACHE_MAXSIZE, ttl=USER_CACHE_TTL_SECONDS)
+
+
+def invalidate_user(email: Optional[str]) -> None:
+    """يجب استدعاؤها بعد أي تعديل على بيانات المستخدم."""
+    if email:
+        user_cache.delete(email)
+
+
+# --- إصدارات التوكن لكل مستخدم (user_id -> (token_version, claims_version)) ---
+# هل يعمل التطبيق في عدة عمليات بذاكرة منفصلة؟ (Vercel أو عدة workers)
+MULTI_PROCESS = bool(os.getenv("VERCEL")) or int(os.getenv("WEB_CONCURRENCY", 1)) > 1
+# كل عملية تحدث ذاكرتها فقط عند الكتابة، فالعمليات الأخرى تقبل التوكن الملغى (تغيير كلمة المرور)
+# حتى تنتهي صلاحية العنصر: مع عدة عمليات تُقصر المدة إلى ثوانٍ، وهي نافذة الإلغاء القصوى
+TOKEN_VERSION_CACHE_TTL_SECONDS = float(os.getenv("TOKEN_VERSION_CACHE_TTL_SECONDS", 5 if MULTI_PROCESS else 300))
+
+token_version_cache = TTLCache(maxsize=USER_CACHE_MAXSIZE, ttl=TOKEN_VERSION_CACHE_TTL_SECONDS)
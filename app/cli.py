@@ -0,0 +1,148 @@
+# app/cli.py
+# أوامر الصيانة التي تعمل خارج عملية الويب (cron / scheduler):
+#   python -m app.cli rebuild-rollups [--user-id N]
+#   python -m app.cli check-rollups [--user-id N]
+#   python -m app.cli end-of-day-cleanup [--batch-size N] [--start-after-id ID]
+#   python -m app.cli rollover [--dry-run] [--concurrency N] [--shard-size N]
+#   python -m app.cli expire-timers [--batch-size N]
+#   python -m app.cli process-payment-events [--batch-size N]
+#   python -m app.cli replay-payment-events [--event-id ID ...]
+import argparse
+import sys
+
+from .database import SessionLocal
+from . import crud, rollover, rollups
+
+
+def _rebuild_rollups(args) -> int:
+    with SessionLocal() as db:
+        count = rollups.rebuild_rollups(db, user_id=args.user_id)
+    print(f"Rebuilt {count} rollup rows.")
+    return 0
+
+
+def _check_rollups(args) -> int:
+    with SessionLocal() as db:
+        mismatches = rollups.check_rollups(db, user_id=args.user_id)
+    for row in mismatches:
+        print(row)
+    print(f"{len(mismatches)} mismatched rollup rows.")
+    return 1 if mismatches else 0
+
+
+def _end_of_day_cleanup(args) -> int:
+    def report(last_id: int, rows: int):
+        # last_id يمكن تمريره إلى --start-after-id للاستئناف بعد أي انقطاع
+        print(f"batch: {rows} rows updated (last_id={last_id})", flush=True)
+
+    with SessionLocal() as db:
+        result = crud.end_of_day_cleanup(
+            db,
+            batch_size=args.batch_size,
+            start_after_id=args.start_after_id,
+            on_batch=report,
+        )
+    print(f"Done: {result['updated']} tasks marked INCOMPLETE (last_id={result['last_id']}).")
+    return 0
+
+
+def _rollover(args) -> int:
+    def report(shard):
+        action = "would touch" if shard.dry_run else "updated"
+        print(f"{shard.timezone} {shard.local_date}: {shard.users} users, {action} {shard.tasks} tasks", flush=True)
+
+    reports = rollover.run_rollover(
+        concurrency=args.concurrency,
+        shard_size=args.shard_size,
+        batch_size=args.batch_size,
+        dry_run=args.dry_run,
+        on_shard=report,
+    )
+    print(f"Done: {len(reports)} shards, {sum(r['tasks'] for r in reports)} tasks.")
+    return 0
+
+
+def _expire_timers(args) -> int:
+    # بديل محرك الانتهاء الخلفي عند التشغيل بدون عملية دائمة (Vercel)
+    total = 0
+    with SessionLocal() as db:
+        while True:
+            tasks = crud.expire_due_timers(db, limit=args.batch_size)
+            total += len(tasks)
+            if len(tasks) < args.batch_size:
+                break
+    print(f"Done: {total} timers expired.")
+    return 0
+
+
+def _process_payment_events(args) -> int:
+    totals = {"processed": 0, "ignored": 0, "retried": 0, "failed": 0}
+    with SessionLocal() as db:
+        while True:
+            result = crud.process_payment_events(db, batch_size=args.batch_size)
+            for key in totals:
+                totals[key] += result[key]
+            if result["batch"] < args.batch_size:
+                break
+    print(f"Done: {totals}")
+    return 0
+
+
+def _replay_payment_events(args) -> int:
+    # بدون --event-id تُعاد كل الإشعارات الفاشلة (status=failed) إلى الطابور
+    with SessionLocal() as db:
+        count = crud.replay_payment_events(db, event_ids=args.event_id)
+    print(f"Requeued {count} payment events.")
+    if count and args.process:
+        return _process_payment_events(args)
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description="TaskAI maintenance commands")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    rebuild = subparsers.add_parser("rebuild-rollups", help="Rebuild task_stats_rollups from tasks")
+    rebuild.add_argument("--user-id", type=int, default=None)
+    rebuild.set_defaults(func=_rebuild_rollups)
+
+    check = subparsers.add_parser("check-rollups", help="Compare task_stats_rollups with tasks")
+    check.add_argument("--user-id", type=int, default=None)
+    check.set_defaults(func=_check_rollups)
+
+    cleanup = subparsers.add_parser("end-of-day-cleanup", help="Mark open, inactive tasks as INCOMPLETE")
+    cleanup.add_argument("--batch-size", type=int, default=crud.CLEANUP_BATCH_SIZE)
+    cleanup.add_argument("--start-after-id", type=int, default=0)
+    cleanup.set_defaults(func=_end_of_day_cleanup)
+
+    roll = subparsers.add_parser("rollover", help="Per-timezone day rollover for users past local midnight")
+    roll.add_argument("--dry-run", action="store_true")
+    roll.add_argument("--concurrency", type=int, default=rollover.ROLLOVER_CONCURRENCY)
+    roll.add_argument("--shard-size", type=int, default=rollover.ROLLOVER_SHARD_SIZE)
+    roll.add_argument("--batch-size", type=int, default=crud.CLEANUP_BATCH_SIZE)
+    roll.set_defaults(func=_rollover)
+
+    expire = subparsers.add_parser("expire-timers", help="Stop running timers whose remaining time has elapsed")
+    expire.add_argument("--batch-size", type=int, default=crud.EXPIRY_BATCH_SIZE)
+    expire.set_defaults(func=_expire_timers)
+
+    payments = subparsers.add_parser("process-payment-events", help="Apply pending Kashier webhook events")
+    payments.add_argument("--batch-size", type=int, default=crud.PAYMENT_BATCH_SIZE)
+    payments.set_defaults(func=_process_payment_events)
+
+    replay = subparsers.add_parser("replay-payment-events", help="Requeue failed (or specific) Kashier webhook events")
+    replay.add_argument("--event-id", action="append", default=None)
+    replay.add_argument("--process", action="store_true", help="Apply the requeued events immediately")
+    replay.add_argument("--batch-size", type=int, default=crud.PAYMENT_BATCH_SIZE)
+    replay.set_defaults(func=_replay_payment_events)
+
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,117 +1,283 @@
 # app/crud.py
+import json
+import os
+from decimal import Decimal, InvalidOperation
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
-from typing import List, Optional
+from typing import Callable, Dict, List, Optional, Tuple
 from pydantic import BaseModel # <--- تم إضافة هذا السطر لحل مشكلة الاسم
-from sqlalchemy import func
+from sqlalchemy import DateTime, Integer, case, cast, delete, func, insert, inspect, literal, or_, select, tuple_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 
 from . import models, schemas
 from .auth_utils import get_password_hash, verify_password
+from .cache import invalidate_user, token_version_cache
 from app.models import Task
+from .pagination import Cursor
+from .timer_registry import active_timers
+from .events import event_hub
+from .timer_expiry import expiry_engine
 
 # --- عمليات المستخدم (User CRUD) ---
 def get_active_task(db: Session, user_id: int):
     return db.query(Task).filter(Task.owner_id == user_id, Task.is_active == True).first()
 
+def _refresh_if_expired(db: Session, obj):
+    # مع DB_EXPIRE_ON_COMMIT=false (ومع AsyncSession) تبقى الحقول المكتوبة محمّلة بعد commit،
+    # والقيم المولدة في الخادم (id والقيم الافتراضية) تصل عبر RETURNING أثناء flush، فلا حاجة إلى SELECT
+    if inspect(obj).expired_attributes:
+        db.refresh(obj)
+    return obj
+
+def _detach(db: Session, obj):
+    # إخراج الكائن من الجلسة قبل commit: حقوله محمّلة من RETURNING ولا داعي لإبطالها وإعادة تحميلها
+    if obj is not None:
+        db.expunge(obj)
+    return obj
+
+# انتقالات المؤقت: كل انتقال عبارة UPDATE ... RETURNING شرطية واحدة، فلا يمكن لطلبين
+# متزامنين أن يمرا معاً من نفس الشرط. الفهرس الفريد uq_tasks_owner_id_active يضمن
+# مهمة نشطة واحدة لكل مستخدم حتى لو بدأ طلبان مهمتين مختلفتين في نفس اللحظة.
 def start_task_timer(db: Session, task_id: int, user_id: int):
-    task = db.query(Task).filter(Task.id == task_id, Task.owner_id == user_id).first()
+    now = datetime.utcnow()
+    other_active = select(Task.id).where(
+        Task.owner_id == user_id, Task.is_active == True, Task.id != task_id
+    ).exists()
+    stmt = (
+        update(Task)
+        .where(
+            Task.id == task_id,
+            Task.owner_id == user_id,
+            Task.status != "COMPLETED", # لا يمكن بدء مهمة مكتملة
+            ~other_active,
+        )
+        .values(
+            is_active=True,
+            start_time=now,
+            status="IN_PROGRESS",
+            last_run_date=now,
+            # تحديد المدة المتبقية الجديدة (تُقيَّم على القيم قبل التحديث)
+            remaining_time_seconds=case(
+                # كل مرة تبدأ مهمة غير مكتملة تبدأ من ساعة واحدة فقط
+                (Task.status == "INCOMPLETE", 3600),
+                # بدء مهمة جديدة: استخدام المدة الأصلية
+                (or_(Task.status == "TO_DO", Task.remaining_time_seconds <= 0), Task.initial_duration_seconds),
+                # استئناف مهمة قيد التقدم تم إيقافها مؤقتاً
+                else_=Task.remaining_time_seconds,
+            ),
+        )
+        .returning(Task)
+        .execution_options(synchronize_session=False, populate_existing=True)
+    )
+    try:
+        task = db.execute(stmt).scalars().first()
+        _detach(db, task)
+        db.commit()
+    except IntegrityError:
+        # طلب متزامن بدأ مهمة أخرى لنفس المستخدم
+        db.rollback()
+        return {"error": "Another task is already running."}
+
+    if task is None:
+        return _start_failure(db, task_id, user_id)
+    active_timers.record(user_id, task)
+    expiry_engine.schedule(task.id, task.start_time + timedelta(seconds=task.remaining_time_seconds))
+    event_hub.publish(user_id, "timer.started", task)
+    return task
+
+def _start_failure(db: Session, task_id: int, user_id: int):
+    """تحديد سبب رفض البدء (يُستدعى فقط عند الفشل)."""
+    task = get_task(db, task_id, user_id)
     if not task:
         return None
-
     active_task = get_active_task(db, user_id)
     if active_task and active_task.id != task_id:
         # سيتم التعامل مع هذا الخطأ في الواجهة الأمامية لمنع البدء
         return {"error": "Another task is already running."}
-    
-    # 2. تحديد المدة المتبقية الجديدة
-    if task.status == "COMPLETED":
-        # لا يمكن بدء مهمة مكتملة
-        return {"error": "لا يمكن بدء مهمة مكتملة."}
-    if task.status == "INCOMPLETE":
-        # كل مرة تبدأ مهمة غير مكتملة تبدأ من ساعة واحدة فقط
-        new_remaining_time = 3600
-    elif task.status == "TO_DO" or task.remaining_time_seconds <= 0:
-        # بدء مهمة جديدة: استخدام المدة الأصلية
-        new_remaining_time = task.initial_duration_seconds
-    else:
-        # استئناف مهمة قيد التقدم تم إيقافها مؤقتاً
-        new_remaining_time = task.remaining_time_seconds
-        
-    # 3. تحديث حالة المهمة
-    task.is_active = True
-    task.start_time = datetime.utcnow()
-    task.status = "IN_PROGRESS"
-    task.remaining_time_seconds = new_remaining_time
-    task.last_run_date = datetime.utcnow()
-    
-    db.commit()
-    db.refresh(task)
-    return task
+    return {"error": "لا يمكن بدء مهمة مكتملة."}
 
 # دالة إيقاف المؤقت وحفظ التقدم (مستخدمة للإيقاف المؤقت أو عند انتهاء الوقت)
 def stop_task_timer(db: Session, task_id: int, user_id: int):
-    task = db.query(Task).filter(Task.id == task_id, Task.owner_id == user_id).first()
-    if not task or not task.is_active:
+    # حساب المدة المنقضية داخل قاعدة البيانات من start_time المخزن
+    elapsed = cast(func.floor(func.extract("epoch", literal(datetime.utcnow(), DateTime) - Task.start_time)), Integer)
+    stmt = (
+        update(Task)
+        .where(Task.id == task_id, Task.owner_id == user_id, Task.is_active == True)
+        .values(
+            time_spent_seconds=Task.time_spent_seconds + elapsed,
+            remaining_time_seconds=func.greatest(0, Task.remaining_time_seconds - elapsed),
+            # إيقاف الحالة النشطة
+            is_active=False,
+            start_time=None,
+        )
+        .returning(Task)
+        .execution_options(synchronize_session=False, populate_existing=True)
+    )
+    task = db.execute(stmt).scalars().first()
+    _detach(db, task)
+    db.commit()
+    if task is not None:
+        active_timers.record_none(user_id)
+        expiry_engine.cancel(task.id)
+        event_hub.publish(user_id, "timer.stopped", task)
+    return task
+
+def _set_task_outcome(db: Session, task_id: int, user_id: int, status: str, completed: bool, progress_details: Optional[str]):
+    # CTE تقرأ قيمة completed السابقة (مع قفل الصف) لتحديث ملخص الإحصائيات في نفس المعاملة
+    previous = (
+        select(Task.id, Task.completed.label("was_completed"))
+        .where(Task.id == task_id, Task.owner_id == user_id)
+        .with_for_update()
+        .cte("previous_task")
+    )
+    values = {"status": status, "completed": completed}
+    if progress_details is not None:
+        values["progress_details"] = progress_details
+    stmt = (
+        update(Task)
+        .where(Task.id == previous.c.id)
+        .values(**values)
+        .returning(Task, previous.c.was_completed)
+        .execution_options(synchronize_session=False, populate_existing=True)
+    )
+    row = db.execute(stmt).first()
+    if row is None:
+        db.rollback()
         return None
 
-    # حساب المدة المنقضية وحفظها
-    elapsed_time = (datetime.utcnow() - task.start_time).total_seconds()
-    task.time_spent_seconds += int(elapsed_time)
-    task.remaining_time_seconds = max(0, task.remaining_time_seconds - int(elapsed_time))
-    
-    # إيقاف الحالة النشطة
-    task.is_active = False
-    task.start_time = None 
-    
+    task, was_completed = row
+    after = _rollup_snapshot(task)
+    if after is not None:
+        _update_rollups(db, after[:3] + (bool(was_completed),) + after[4:], after)
+    _detach(db, task)
     db.commit()
-    db.refresh(task)
+    active_timers.sync(user_id, task)
     return task
 
 # دالة إكمال المهمة (تستخدم بعد stop_task_timer)
 def complete_task(db: Session, task_id: int, user_id: int, progress_details: str = None):
-    task = db.query(Task).filter(Task.id == task_id, Task.owner_id == user_id).first()
-    if not task: return None
-
-    task.status = "COMPLETED"
-    task.completed = True
-    if progress_details is not None:
-        task.progress_details = progress_details
-    db.commit()
-    db.refresh(task)
+    task = _set_task_outcome(db, task_id, user_id, "COMPLETED", True, progress_details)
+    if task is not None:
+        event_hub.publish(user_id, "task.completed", task)
     return task
 
 # دالة وسم المهمة كغير مكتملة (تستخدم بعد stop_task_timer)
 def mark_task_incomplete(db: Session, task_id: int, user_id: int, progress_details: str = None):
-    task = db.query(Task).filter(Task.id == task_id, Task.owner_id == user_id).first()
-    if not task: return None
-
-    task.status = "INCOMPLETE"
-    task.completed = False
     # عند إعادة فتح مهمة غير مكتملة، المؤقت سيبدأ من ساعة واحدة فقط (يتم ذلك في start_task_timer)
-    if progress_details is not None:
-        task.progress_details = progress_details
-    db.commit()
-    db.refresh(task)
+    task = _set_task_outcome(db, task_id, user_id, "INCOMPLETE", False, progress_details)
+    if task is not None:
+        event_hub.publish(user_id, "task.incomplete", task)
     return task
 
-# دالة تنظيف المهام التي لم تنجز في نهاية اليوم
-def end_of_day_cleanup(db: Session):
-    # تحديد المهام التي لم يتم إكمالها وتاريخ استحقاقها قد فات
-    tasks_to_mark_incomplete = db.query(Task).filter(
-        Task.status.in_(["TO_DO", "IN_PROGRESS"]), # المهام التي لم تكتمل بعد
-        Task.is_active == False # ليست قيد التشغيل حالياً (تم إيقافها أو لم تبدأ)
+# --- انتهاء المؤقتات على الخادم ---
+EXPIRY_BATCH_SIZE = 500
+
+def _timer_deadline():
+    # start_time + remaining_time_seconds ثانية
+    return Task.start_time + func.make_interval(0, 0, 0, 0, 0, 0, Task.remaining_time_seconds)
+
+def get_running_timers(db: Session) -> List[tuple]:
+    """(id, owner_id, start_time, remaining_time_seconds) لكل المؤقتات النشطة، لاستعادة الجدولة عند البدء."""
+    return db.query(Task.id, Task.owner_id, Task.start_time, Task.remaining_time_seconds).filter(
+        Task.is_active == True, Task.start_time.isnot(None)
     ).all()
-    
-    for task in tasks_to_mark_incomplete:
-        # نستخدم دالة stop_task_timer لإيقاف أي مهمة قد تكون نشطة (للتأكد)
-        if task.is_active:
-             stop_task_timer(db, task.id, task.owner_id)
-             
-        task.status = "INCOMPLETE"
-        db.add(task)
-        
+
+def expire_due_timers(db: Session, task_ids: Optional[List[int]] = None, now: Optional[datetime] = None, limit: int = EXPIRY_BATCH_SIZE) -> List[models.Task]:
+    """
+    إيقاف المؤقتات التي تجاوزت موعد انتهائها في عبارة UPDATE واحدة.
+    الشرط على الموعد يُعاد فحصه في قاعدة البيانات، فلا تتأثر مهمة أُوقفت أو أُعيد تشغيلها بعد الجدولة.
+    """
+    now = now or datetime.utcnow()
+    due = [Task.is_active == True, _timer_deadline() <= now]
+    if task_ids is not None:
+        due.append(Task.id.in_(task_ids))
+    else:
+        due.append(Task.id.in_(select(Task.id).where(*due).order_by(Task.id).limit(limit).scalar_subquery()))
+    stmt = (
+        update(Task)
+        .where(*due)
+        .values(
+            time_spent_seconds=Task.time_spent_seconds + Task.remaining_time_seconds,
+            remaining_time_seconds=0,
+            is_active=False,
+            start_time=None,
+        )
+        .returning(Task)
+        .execution_options(synchronize_session=False, populate_existing=True)
+    )
+    tasks = db.execute(stmt).scalars().all()
+    for task in tasks:
+        _detach(db, task)
     db.commit()
-    return {"message": f"تم نقل {len(tasks_to_mark_incomplete)} مهمة إلى المهام غير المكتملة."}
+    for task in tasks:
+        active_timers.record_none(task.owner_id)
+        event_hub.publish(task.owner_id, "timer.expired", task)
+    return tasks
+
+# دالة تنظيف المهام التي لم تنجز في نهاية اليوم
+CLEANUP_BATCH_SIZE = 1000
+
+def _rollover_conditions(owner_ids: Optional[List[int]] = None, created_before: Optional[datetime] = None) -> list:
+    conditions = [
+        Task.status.in_(["TO_DO", "IN_PROGRESS"]), # المهام التي لم تكتمل بعد
+        Task.is_active == False, # ليست قيد التشغيل حالياً (تم إيقافها أو لم تبدأ)
+    ]
+    if owner_ids is not None:
+        conditions.append(Task.owner_id.in_(owner_ids))
+    if created_before is not None:
+        conditions.append(Task.created_at < created_before)
+    return conditions
+
+def count_rollover_tasks(db: Session, owner_ids: Optional[List[int]] = None, created_before: Optional[datetime] = None) -> int:
+    return db.query(func.count(Task.id)).filter(*_rollover_conditions(owner_ids, created_before)).scalar() or 0
+
+def end_of_day_cleanup(
+    db: Session,
+    batch_size: int = CLEANUP_BATCH_SIZE,
+    start_after_id: int = 0,
+    on_batch: Optional[Callable[[int, int], None]] = None,
+    owner_ids: Optional[List[int]] = None,
+    created_before: Optional[datetime] = None,
+):
+    """
+    نقل المهام المفتوحة غير النشطة إلى INCOMPLETE عبر UPDATE جماعي على دفعات حسب id.
+    كل دفعة معاملة مستقلة، لذا يمكن استئناف العملية من آخر id مُبلّغ عنه (start_after_id)،
+    وإعادة التشغيل من البداية آمنة لأن الصفوف المعالجة لم تعد تطابق الشرط.
+    on_batch(last_id, rows) تُستدعى بعد كل دفعة.
+    owner_ids / created_before يحصران العملية في مستخدمين محددين (الترحيل حسب المنطقة الزمنية).
+    """
+    open_inactive = _rollover_conditions(owner_ids, created_before)
+    last_id = start_after_id
+    total = 0
+    while True:
+        batch_ids = db.execute(
+            select(Task.id).where(Task.id > last_id, *open_inactive).order_by(Task.id).limit(batch_size)
+        ).scalars().all()
+        if not batch_ids:
+            db.commit()
+            break
+        # إعادة الشرط في UPDATE نفسه لأن المهمة قد تبدأ بين الاختيار والتحديث
+        stmt = (
+            update(Task)
+            .where(Task.id.in_(batch_ids), *open_inactive)
+            .values(status="INCOMPLETE")
+            .returning(Task.id)
+            .execution_options(synchronize_session=False)
+        )
+        updated = len(db.execute(stmt).scalars().all())
+        db.commit()
+        # التقدم حسب نافذة الاختيار لا الصفوف المحدثة: دفعة تغيرت كل صفوفها أثناء المعالجة ليست نهاية الجدول
+        last_id = batch_ids[-1]
+        total += updated
+        if on_batch:
+            on_batch(last_id, updated)
+
+    return {
+        "message": f"تم نقل {total} مهمة إلى المهام غير المكتملة.",
+        "updated": total,
+        "last_id": last_id,
+    }
 
 def get_user_by_email(db: Session, email: str) -> Optional[models.User]:
     return db.query(models.User).filter(models.User.email == email).first()
@@ -119,8 +285,32 @@ def get_user_by_email(db: Session, email: str) -> Optional[models.User]:
 def get_user_by_id(db: Session, user_id: int) -> Optional[models.User]:
     return db.query(models.User).filter(models.User.id == user_id).first()
 
-def create_user(db: Session, user: schemas.UserCreate) -> models.User:
-    hashed_password = get_password_hash(user.password)
+def get_user_token_versions(db: Session, user_id: int) -> Optional[Tuple[int, int]]:
+    """(token_version, claims_version) الحاليان للمستخدم، من الذاكرة المؤقتة إن وُجدا."""
+    versions = token_version_cache.get(user_id)
+    if versions is None:
+        row = db.query(models.User.token_version, models.User.claims_version).filter(models.User.id == user_id).first()
+        if row is None:
+            return None
+        versions = (row[0], row[1])
+        token_version_cache.set(user_id, versions)
+    return versions
+
+def _bump_token_version(db_user: models.User):
+    # أي توكن صادر قبل هذا التعديل يصبح غير صالح
+    db_user.token_version = (db_user.token_version or 0) + 1
+
+def _bump_claims_version(db_user: models.User):
+    # التوكنات الصادرة سابقاً تبقى صالحة لكن حقولها قديمة: يُعاد إصدارها عبر /auth/refresh
+    db_user.claims_version = (db_user.claims_version or 0) + 1
+
+def _after_user_write(db_user: models.User):
+    invalidate_user(db_user.email)
+    token_version_cache.set(db_user.id, (db_user.token_version, db_user.claims_version))
+
+def create_user(db: Session, user: schemas.UserCreate, hashed_password: Optional[str] = None) -> models.User:
+    if hashed_password is None:
+        hashed_password = get_password_hash(user.password)
     db_user = models.User(
         email=user.email,
         name=user.name,
@@ -128,49 +318,454 @@ def create_user(db: Session, user: schemas.UserCreate) -> models.User:
     )
     db.add(db_user)
     db.commit()
-    db.refresh(db_user)
+    _refresh_if_expired(db, db_user)
     return db_user
 
 
+# المستدعي يزيد claims_version مرة واحدة لكل كتابة (_bump_claims_version)
+def _apply_unlocked(db_user: models.User, unlocked: bool):
+    db_user.is_unlocked = unlocked
+
+def _apply_subscription(db_user: models.User, subscription: schemas.SubscriptionUpdate):
+    db_user.plan = subscription.plan
+    db_user.subscription_id = subscription.subscription_id
+    db_user.expires_at = subscription.expires_at
+
 def set_user_unlocked(db: Session, user_id: int, unlocked: bool = True) -> Optional[models.User]:
     db_user = get_user_by_id(db, user_id)
     if not db_user:
         return None
-    db_user.is_unlocked = unlocked
+    _apply_unlocked(db_user, unlocked)
+    _bump_claims_version(db_user)
     db.commit()
-    db.refresh(db_user)
+    _refresh_if_expired(db, db_user)
+    _after_user_write(db_user)
     return db_user
 
 def update_subscription(db: Session, user_id: int, subscription: schemas.SubscriptionUpdate) -> Optional[models.User]:
     db_user = get_user_by_id(db, user_id)
     if not db_user:
         return None
-    db_user.plan = subscription.plan
-    db_user.subscription_id = subscription.subscription_id
-    db_user.expires_at = subscription.expires_at
+    _apply_subscription(db_user, subscription)
+    _bump_claims_version(db_user)
+    db.commit()
+    _refresh_if_expired(db, db_user)
+    _after_user_write(db_user)
+    return db_user
+
+def update_timezone(db: Session, db_user: models.User, timezone: str) -> models.User:
+    db_user.timezone = timezone
+    # المنطقة الزمنية محمولة في التوكن
+    _bump_claims_version(db_user)
+    db.commit()
+    _refresh_if_expired(db, db_user)
+    _after_user_write(db_user)
+    return db_user
+
+def change_password(db: Session, db_user: models.User, hashed_password: str) -> models.User:
+    db_user.hashed_password = hashed_password
+    _bump_token_version(db_user)
+    db.commit()
+    _after_user_write(db_user)
+    return db_user
+
+def update_password_hash(db: Session, db_user: models.User, hashed_password: str) -> models.User:
+    # إعادة تجزئة نفس كلمة المرور بتكلفة جديدة: لا حاجة لإبطال التوكنات
+    db_user.hashed_password = hashed_password
+    db.commit()
+    return db_user
+
+# --- المدفوعات (Kashier) ---
+PAYMENT_BATCH_SIZE = int(os.getenv("PAYMENT_BATCH_SIZE", 100))
+PAYMENT_MAX_ATTEMPTS = int(os.getenv("PAYMENT_MAX_ATTEMPTS", 8))
+# مدة الاشتراك لكل خطة بالأيام (الخطط غير المعروفة تأخذ المدة الافتراضية)
+PLAN_DURATION_DAYS = {"monthly": 30, "quarterly": 90, "yearly": 365}
+PAYMENT_DEFAULT_PLAN_DAYS = int(os.getenv("PAYMENT_DEFAULT_PLAN_DAYS", 30))
+# الأسعار تُحدد في الخادم فقط: PAYMENT_PLAN_PRICES='{"monthly": "99.00", "yearly": "999.00"}'
+# الخطة غير المسعرة هنا لا يمكن شراؤها، ومبلغ العميل يُتجاهل دائماً
+PAYMENT_CURRENCY = os.getenv("PAYMENT_CURRENCY", "EGP")
+
+def _parse_amount(value) -> Optional[Decimal]:
+    try:
+        return Decimal(str(value)).quantize(Decimal("0.01"))
+    except (InvalidOperation, ValueError):
+        return None
+
+PLAN_PRICES: Dict[str, Decimal] = {
+    plan: _parse_amount(price)
+    for plan, price in json.loads(os.getenv("PAYMENT_PLAN_PRICES", "{}")).items()
+    if plan in PLAN_DURATION_DAYS and _parse_amount(price) is not None
+}
+
+class PaymentOrderConflict(Exception):
+    """رقم الطلب مستخدم لمستخدم آخر أو لخطة أخرى."""
+
+def create_payment_order(db: Session, order_id: str, user_id: int, plan: str, amount: Decimal, currency: str) -> None:
+    """
+    ربط رقم الطلب المرسل إلى Kashier بالمستخدم والخطة والسعر قبل إنشاء رابط الدفع.
+    إعادة نفس الطلب لنفس المستخدم والخطة تعيد الصف الموجود؛ غير ذلك PaymentOrderConflict.
+    """
+    stmt = pg_insert(models.PaymentOrder).values(
+        order_id=str(order_id),
+        user_id=user_id,
+        plan=plan,
+        amount=str(amount),
+        currency=currency,
+        created_at=datetime.utcnow(),
+    ).on_conflict_do_nothing(index_elements=["order_id"]).returning(models.PaymentOrder.order_id)
+    if db.execute(stmt).first() is None:
+        existing = db.get(models.PaymentOrder, str(order_id))
+        if existing is None or existing.user_id != user_id or existing.plan != plan:
+            db.rollback()
+            raise PaymentOrderConflict(str(order_id))
+    db.commit()
+
+def record_payment_event(db: Session, event_id: str, event_type: Optional[str], order_id: Optional[str], payload: str) -> bool:
+    """
+    حفظ الإشعار في صندوق الوارد. False إذا كان مكرراً (إعادة إرسال من Kashier).
+    INSERT واحد فقط حتى يُرد على Kashier فوراً؛ التطبيق يتم في العامل الخلفي.
+    """
+    now = datetime.utcnow()
+    stmt = (
+        pg_insert(models.PaymentEvent)
+        .values(
+            event_id=event_id,
+            event_type=event_type,
+            order_id=order_id,
+            payload=payload,
+            received_at=now,
+            next_attempt_at=now,
+        )
+        .on_conflict_do_nothing(index_elements=["event_id"])
+        .returning(models.PaymentEvent.event_id)
+    )
+    inserted = db.execute(stmt).first() is not None
     db.commit()
-    db.refresh(db_user)
+    return inserted
+
+class PaymentEventIgnored(Exception):
+    """إشعار صالح لا يتطلب أي تعديل (حالة غير ناجحة، طلب غير معروف، ...)."""
+
+def _apply_payment_event(db: Session, event: models.PaymentEvent, now: datetime) -> Optional[models.User]:
+    body = json.loads(event.payload)
+    data = body.get("data") or {}
+    if event.event_type != "pay" or str(data.get("status", "")).upper() != "SUCCESS":
+        raise PaymentEventIgnored(f"event={event.event_type} status={data.get('status')}")
+
+    order = db.get(models.PaymentOrder, event.order_id) if event.order_id else None
+    if order is None or order.user_id is None:
+        raise PaymentEventIgnored(f"unknown order {event.order_id}")
+    # المبلغ المدفوع فعلاً يجب أن يطابق سعر الخطة المحفوظ عند إنشاء الطلب
+    paid = _parse_amount(data.get("amount"))
+    currency = str(data.get("currency") or "").upper()
+    if paid is None or paid != _parse_amount(order.amount) or currency != (order.currency or "").upper():
+        raise PaymentEventIgnored(f"amount mismatch: paid {data.get('amount')} {data.get('currency')}, expected {order.amount} {order.currency}")
+    db_user = db.query(models.User).filter(models.User.id == order.user_id).with_for_update().first()
+    if db_user is None:
+        raise PaymentEventIgnored(f"user {order.user_id} not found")
+
+    # التجديد قبل انتهاء الاشتراك يُضاف إلى المدة المتبقية
+    start = db_user.expires_at if db_user.expires_at and db_user.expires_at > now else now
+    days = PLAN_DURATION_DAYS.get(order.plan or "", PAYMENT_DEFAULT_PLAN_DAYS)
+    _apply_subscription(db_user, schemas.SubscriptionUpdate(
+        plan=order.plan or db_user.plan or "default",
+        subscription_id=str(data.get("transactionId") or event.event_id),
+        expires_at=start + timedelta(days=days),
+    ))
+    _apply_unlocked(db_user, True)
+    _bump_claims_version(db_user)
     return db_user
 
+def process_payment_events(db: Session, batch_size: int = PAYMENT_BATCH_SIZE, max_attempts: int = PAYMENT_MAX_ATTEMPTS) -> dict:
+    """
+    تطبيق دفعة من الإشعارات المعلقة في معاملة واحدة. FOR UPDATE SKIP LOCKED يسمح بتشغيل
+    عدة عمال (أو عمليات) دون معالجة نفس الإشعار مرتين. الإشعار الفاشل يُعاد لاحقاً
+    بتأخير متزايد حتى max_attempts ثم يُعلَّم failed (يمكن إعادته بأمر replay-payment-events).
+    """
+    now = datetime.utcnow()
+    events = (
+        db.query(models.PaymentEvent)
+        .filter(models.PaymentEvent.status == "pending", models.PaymentEvent.next_attempt_at <= now)
+        .order_by(models.PaymentEvent.next_attempt_at)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+    result = {"processed": 0, "ignored": 0, "retried": 0, "failed": 0}
+    users = {}
+    for event in events:
+        event.attempts += 1
+        try:
+            with db.begin_nested():
+                db_user = _apply_payment_event(db, event, now)
+            users[db_user.id] = db_user
+            event.status = "processed"
+            event.processed_at = now
+            event.last_error = None
+            result["processed"] += 1
+        except PaymentEventIgnored as e:
+            event.status = "ignored"
+            event.processed_at = now
+            event.last_error = str(e)
+            result["ignored"] += 1
+        except Exception as e:
+            event.last_error = f"{type(e).__name__}: {e}"
+            if event.attempts >= max_attempts:
+                event.status = "failed"
+                result["failed"] += 1
+            else:
+                event.next_attempt_at = now + timedelta(seconds=min(3600, 30 * 2 ** (event.attempts - 1)))
+                result["retried"] += 1
+    db.commit()
+    for db_user in users.values():
+        _after_user_write(db_user)
+    result["batch"] = len(events)
+    return result
+
+def replay_payment_events(db: Session, event_ids: Optional[List[str]] = None, include_failed: bool = True) -> int:
+    """إعادة إشعارات محددة (أو كل الفاشلة) إلى الطابور."""
+    query = update(models.PaymentEvent)
+    if event_ids:
+        query = query.where(models.PaymentEvent.event_id.in_(event_ids))
+    elif include_failed:
+        query = query.where(models.PaymentEvent.status == "failed")
+    else:
+        return 0
+    result = db.execute(
+        query.values(status="pending", attempts=0, next_attempt_at=datetime.utcnow(), last_error=None)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return result.rowcount
+
+def count_pending_payment_events(db: Session) -> dict:
+    rows = db.query(models.PaymentEvent.status, func.count()).group_by(models.PaymentEvent.status).all()
+    return {status: count for status, count in rows}
+
 # --- وظيفة مساعدة لتحديث أي نموذج ---
 # BaseModel هنا يشير إلى أي نموذج Pydantic (مثل TaskUpdate, NoteUpdate, HabitUpdate)
-def update_item(db: Session, db_item: models.Base, item_in: BaseModel):
+def _apply_update(db_item: models.Base, item_in: BaseModel):
     update_data = item_in.model_dump(exclude_unset=True) 
     for key, value in update_data.items():
         # التأكد من أن الحقل موجود في نموذج قاعدة البيانات قبل التحديث
         if hasattr(db_item, key):
              setattr(db_item, key, value)
-        
+
+def update_item(db: Session, db_item: models.Base, item_in: BaseModel):
+    _apply_update(db_item, item_in)
     db.commit()
-    db.refresh(db_item)
+    _refresh_if_expired(db, db_item)
     return db_item
 
+# --- ملخص إحصائيات المهام (task_stats_rollups) ---
+# كل كتابة تغيّر الفئة أو الإكمال أو الساعات تطرح مساهمة المهمة القديمة وتضيف الجديدة
+# داخل نفس المعاملة، فيصبح التقرير قراءة مباشرة لعدد قليل من الصفوف.
+
+def _rollup_snapshot(task: models.Task) -> Optional[tuple]:
+    if task.owner_id is None or task.created_at is None:
+        return None
+    return (
+        task.owner_id,
+        task.created_at.date().replace(day=1),
+        task.category or "",
+        bool(task.completed),
+        float(task.estimated_hours or 0),
+    )
+
+def _update_rollups_many(db: Session, changes: List[Tuple[Optional[tuple], Optional[tuple]]]):
+    """
+    تطبيق عدة تغييرات (قبل، بعد) في عبارة upsert واحدة: الفروقات تُجمع أولاً لكل
+    (user_id, month, category) فلا يتكرر نفس الصف داخل INSERT ... ON CONFLICT.
+    """
+    totals = {}
+    for before, after in changes:
+        if before == after:
+            continue
+        for snapshot, sign in ((before, -1), (after, 1)):
+            if snapshot is None:
+                continue
+            user_id, month, category, completed, hours = snapshot
+            entry = totals.setdefault((user_id, month, category), [0, 0, 0.0])
+            entry[0] += sign
+            entry[1] += sign if completed else 0
+            entry[2] += sign * hours
+    rows = [
+        {
+            "user_id": user_id,
+            "month": month,
+            "category": category,
+            "total_count": total,
+            "completed_count": completed,
+            "estimated_hours": hours,
+        }
+        # ترتيب ثابت حتى تقفل الدفعات المتزامنة صفوف الملخص بنفس الترتيب (لا deadlock)
+        for (user_id, month, category), (total, completed, hours) in sorted(totals.items(), key=lambda entry: entry[0])
+        if total or completed or hours
+    ]
+    if not rows:
+        return
+    table = models.TaskStatsRollup.__table__
+    stmt = pg_insert(table).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.user_id, table.c.month, table.c.category],
+        set_={
+            "total_count": table.c.total_count + stmt.excluded.total_count,
+            "completed_count": table.c.completed_count + stmt.excluded.completed_count,
+            "estimated_hours": table.c.estimated_hours + stmt.excluded.estimated_hours,
+        },
+    )
+    db.execute(stmt)
+
+def _update_rollups(db: Session, before: Optional[tuple], after: Optional[tuple]):
+    _update_rollups_many(db, [(before, after)])
+
+# --- ترقيم الصفحات ---
+# الترتيب (created_at DESC, id DESC) يطابق فهارس owner_id المركبة؛
+# مع المؤشر (cursor) تبقى كلفة أي صفحة ثابتة، ويبقى skip كخيار احتياطي.
+def _paginate(query, model, skip: int, limit: int, cursor: Optional[Cursor]):
+    query = query.order_by(model.created_at.desc(), model.id.desc())
+    if cursor is not None:
+        query = query.filter(tuple_(model.created_at, model.id) < tuple_(*cursor))
+    elif skip:
+        query = query.offset(skip)
+    return query.limit(limit).all()
+
+# --- العمليات الجماعية (Bulk) ---
+# دفعة كاملة في معاملة واحدة: INSERT/DELETE متعدد الصفوف مع RETURNING، وتحديثات
+# مجمعة (executemany) بعد قراءة واحدة للصفوف المملوكة للمستخدم. الكائنات تُخرج من
+# الجلسة قبل commit لأن حقولها محمّلة بالفعل، فلا حاجة إلى refresh لكل صف.
+BULK_MAX_ITEMS = int(os.getenv("BULK_MAX_ITEMS", 1000))
+
+def _bulk_insert(db: Session, model, rows: List[dict]) -> list:
+    if not rows:
+        return []
+    # RETURNING مع executemany لا يضمن ترتيب الصفوف إلا مع sort_by_parameter_order
+    objects = db.scalars(insert(model).returning(model, sort_by_parameter_order=True), rows).all()
+    for obj in objects:
+        _detach(db, obj)
+    return objects
+
+def _bulk_load_owned(db: Session, model, ids: List[int], user_id: int, for_update: bool = False) -> Dict[int, object]:
+    query = db.query(model).filter(model.id.in_(set(ids)), model.owner_id == user_id)
+    if for_update:
+        query = query.with_for_update()
+    return {obj.id: obj for obj in query}
+
+def _bulk_update(db: Session, model, items: List[tuple], user_id: int, snapshot: Optional[Callable] = None):
+    """
+    items: (index, id, schema). يعيد ((index, الكائن المحدث), (index, id) غير الموجودة, تغييرات (قبل، بعد)).
+    عند تمرير snapshot تُقفل الصفوف (FOR UPDATE) حتى تبقى لقطات الملخص متسقة.
+    """
+    owned = _bulk_load_owned(db, model, [item_id for _, item_id, _ in items], user_id, for_update=snapshot is not None)
+    updated, missing, changes = [], [], []
+    for index, item_id, item_in in items:
+        obj = owned.get(item_id)
+        if obj is None:
+            missing.append((index, item_id))
+            continue
+        before = snapshot(obj) if snapshot else None
+        _apply_update(obj, item_in)
+        if snapshot:
+            changes.append((before, snapshot(obj)))
+        updated.append((index, obj))
+    db.flush()
+    for obj in {id(obj): obj for _, obj in updated}.values():
+        _detach(db, obj)
+    return updated, missing, changes
+
+def _bulk_delete(db: Session, model, ids: List[int], user_id: int, *columns) -> list:
+    stmt = (
+        delete(model)
+        .where(model.id.in_(set(ids)), model.owner_id == user_id)
+        .returning(model.id, *columns)
+        .execution_options(synchronize_session=False)
+    )
+    return db.execute(stmt).all()
+
+def bulk_create_tasks(db: Session, tasks: List[schemas.TaskCreate], user_id: int) -> List[models.Task]:
+    now = datetime.utcnow()
+    rows = []
+    for task in tasks:
+        initial_duration_seconds = int(task.estimated_hours * 3600)
+        rows.append({
+            **task.model_dump(),
+            "owner_id": user_id,
+            "created_at": now,
+            "initial_duration_seconds": initial_duration_seconds,
+            "remaining_time_seconds": initial_duration_seconds,
+        })
+    created = _bulk_insert(db, models.Task, rows)
+    _update_rollups_many(db, [(None, _rollup_snapshot(task)) for task in created])
+    db.commit()
+    return created
+
+def bulk_update_tasks(db: Session, items: List[tuple], user_id: int):
+    updated, missing, changes = _bulk_update(db, Task, items, user_id, snapshot=_rollup_snapshot)
+    _update_rollups_many(db, changes)
+    db.commit()
+    for task in {task.id: task for _, task in updated}.values():
+        active_timers.sync(user_id, task)
+        if task.is_active and task.start_time is not None:
+            expiry_engine.schedule(task.id, task.start_time + timedelta(seconds=task.remaining_time_seconds))
+        else:
+            expiry_engine.cancel(task.id)
+    return updated, missing
+
+def bulk_delete_tasks(db: Session, task_ids: List[int], user_id: int) -> List[int]:
+    rows = _bulk_delete(
+        db, Task, task_ids, user_id,
+        Task.owner_id, Task.created_at, Task.category, Task.completed, Task.estimated_hours, Task.is_active,
+    )
+    _update_rollups_many(db, [(_rollup_snapshot(row), None) for row in rows])
+    db.commit()
+    for row in rows:
+        if row.is_active:
+            active_timers.record_none(user_id)
+            expiry_engine.cancel(row.id)
+    return [row.id for row in rows]
+
+def bulk_create_notes(db: Session, notes: List[schemas.NoteCreate], user_id: int) -> List[models.Note]:
+    now = datetime.utcnow()
+    created = _bulk_insert(db, models.Note, [{**note.model_dump(), "owner_id": user_id, "created_at": now} for note in notes])
+    db.commit()
+    return created
+
+def bulk_update_notes(db: Session, items: List[tuple], user_id: int):
+    updated, missing, _ = _bulk_update(db, models.Note, items, user_id)
+    db.commit()
+    return updated, missing
+
+def bulk_delete_notes(db: Session, note_ids: List[int], user_id: int) -> List[int]:
+    rows = _bulk_delete(db, models.Note, note_ids, user_id)
+    db.commit()
+    return [row.id for row in rows]
+
+def bulk_create_habits(db: Session, habits: List[schemas.HabitCreate], user_id: int) -> List[models.Habit]:
+    now = datetime.utcnow()
+    created = _bulk_insert(db, models.Habit, [{**habit.model_dump(), "owner_id": user_id, "created_at": now} for habit in habits])
+    db.commit()
+    return created
+
+def bulk_update_habits(db: Session, items: List[tuple], user_id: int):
+    updated, missing, _ = _bulk_update(db, models.Habit, items, user_id)
+    db.commit()
+    return updated, missing
+
+def bulk_delete_habits(db: Session, habit_ids: List[int], user_id: int) -> List[int]:
+    rows = _bulk_delete(db, models.Habit, habit_ids, user_id)
+    db.commit()
+    return [row.id for row in rows]
+
 # --- عمليات المهام (Task CRUD) ---
-def get_tasks(db: Session, user_id: int, skip: int = 0, limit: int = 100) -> List[models.Task]:
-    return db.query(models.Task).filter(models.Task.owner_id == user_id).offset(skip).limit(limit).all()
+def get_tasks(db: Session, user_id: int, skip: int = 0, limit: int = 100, cursor: Optional[Cursor] = None) -> List[models.Task]:
+    return _paginate(db.query(models.Task).filter(models.Task.owner_id == user_id), models.Task, skip, limit, cursor)
 
-def get_task(db: Session, task_id: int, user_id: int) -> Optional[models.Task]:
-    return db.query(models.Task).filter(models.Task.id == task_id, models.Task.owner_id == user_id).first()
+def get_task(db: Session, task_id: int, user_id: int, for_update: bool = False) -> Optional[models.Task]:
+    query = db.query(models.Task).filter(models.Task.id == task_id, models.Task.owner_id == user_id)
+    if for_update:
+        # قفل الصف حتى لا تُحتسب نفس المهمة مرتين في الملخص عند التعديل المتزامن
+        query = query.with_for_update()
+    return query.first()
 
 def create_user_task(db: Session, task: schemas.TaskCreate, user_id: int) -> models.Task:
     initial_duration_seconds = int(task.estimated_hours * 3600)
@@ -181,31 +776,50 @@ def create_user_task(db: Session, task: schemas.TaskCreate, user_id: int) -> mod
         remaining_time_seconds=initial_duration_seconds # Set remaining time to full duration initially
     )
     db.add(db_task)
+    db.flush() # لتعبئة created_at قبل تحديث الملخص
+    _update_rollups(db, None, _rollup_snapshot(db_task))
     db.commit()
-    db.refresh(db_task)
+    _refresh_if_expired(db, db_task)
     return db_task
 
 def update_task(db: Session, task_id: int, user_id: int, task_in: schemas.TaskUpdate) -> Optional[models.Task]:
-    db_task = get_task(db, task_id, user_id)
-    return update_item(db, db_task, task_in) if db_task else None
+    db_task = get_task(db, task_id, user_id, for_update=True)
+    if not db_task:
+        return None
+    before = _rollup_snapshot(db_task)
+    _apply_update(db_task, task_in)
+    _update_rollups(db, before, _rollup_snapshot(db_task))
+    db.commit()
+    _refresh_if_expired(db, db_task)
+    active_timers.sync(user_id, db_task)
+    if db_task.is_active and db_task.start_time is not None:
+        expiry_engine.schedule(db_task.id, db_task.start_time + timedelta(seconds=db_task.remaining_time_seconds))
+    else:
+        expiry_engine.cancel(db_task.id)
+    return db_task
 
 def delete_task(db: Session, task_id: int, user_id: int) -> bool:
-    db_task = get_task(db, task_id, user_id)
+    db_task = get_task(db, task_id, user_id, for_update=True)
     if db_task:
+        was_active = db_task.is_active
+        _update_rollups(db, _rollup_snapshot(db_task), None)
         db.delete(db_task)
         db.commit()
+        if was_active:
+            active_timers.record_none(user_id)
+            expiry_engine.cancel(task_id)
         return True
     return False
 
 # --- عمليات الملاحظات (Note CRUD) ---
-def get_notes(db: Session, user_id: int, skip: int = 0, limit: int = 100) -> List[models.Note]:
-    return db.query(models.Note).filter(models.Note.owner_id == user_id).order_by(models.Note.created_at.desc()).offset(skip).limit(limit).all()
+def get_notes(db: Session, user_id: int, skip: int = 0, limit: int = 100, cursor: Optional[Cursor] = None) -> List[models.Note]:
+    return _paginate(db.query(models.Note).filter(models.Note.owner_id == user_id), models.Note, skip, limit, cursor)
 
 def create_user_note(db: Session, note: schemas.NoteCreate, user_id: int) -> models.Note:
     db_note = models.Note(**note.model_dump(), owner_id=user_id)
     db.add(db_note)
     db.commit()
-    db.refresh(db_note)
+    _refresh_if_expired(db, db_note)
     return db_note
 
 def update_note(db: Session, note_id: int, user_id: int, note_in: schemas.NoteUpdate) -> Optional[models.Note]:
@@ -221,14 +835,14 @@ def delete_note(db: Session, note_id: int, user_id: int) -> bool:
     return False
     
 # --- عمليات العادات (Habit CRUD) ---
-def get_habits(db: Session, user_id: int, skip: int = 0, limit: int = 100) -> List[models.Habit]:
-    return db.query(models.Habit).filter(models.Habit.owner_id == user_id).order_by(models.Habit.created_at.desc()).offset(skip).limit(limit).all()
+def get_habits(db: Session, user_id: int, skip: int = 0, limit: int = 100, cursor: Optional[Cursor] = None) -> List[models.Habit]:
+    return _paginate(db.query(models.Habit).filter(models.Habit.owner_id == user_id), models.Habit, skip, limit, cursor)
 
 def create_user_habit(db: Session, habit: schemas.HabitCreate, user_id: int) -> models.Habit:
     db_habit = models.Habit(**habit.model_dump(), owner_id=user_id)
     db.add(db_habit)
     db.commit()
-    db.refresh(db_habit)
+    _refresh_if_expired(db, db_habit)
     return db_habit
 
 def update_habit(db: Session, habit_id: int, user_id: int, habit_in: schemas.HabitUpdate) -> Optional[models.Habit]:
@@ -245,58 +859,72 @@ def delete_habit(db: Session, habit_id: int, user_id: int) -> bool:
 
 # --- عمليات إحصائيات التقارير (Report Statistics) ---
 
-def get_user_report_stats(db: Session, user_id: int) -> schemas.ReportStats:
-    # الحصول على تاريخ بداية ونهاية الشهر الحالي
-    today = datetime.utcnow()
-    start_of_month = today.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    
+# ألوان افتراضية للفئات
+CATEGORY_COLORS = ["text-blue-500", "text-green-500", "text-red-500", "text-yellow-500", "text-purple-500"]
+
+def _start_of_month(moment: datetime) -> datetime:
+    return moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+def _best_habit_streak(db: Session, user_id: int) -> int:
+    return db.query(func.coalesce(func.max(models.Habit.best_streak), 0)).filter(
+        models.Habit.owner_id == user_id
+    ).scalar() or 0
+
+def _build_report_stats(category_rows, best_habit_streak: int) -> schemas.ReportStats:
+    """بناء التقرير من صفوف (category, total, completed, hours) المجمعة مسبقاً."""
     # 1. إحصائيات المهام الشهرية
-    monthly_tasks = db.query(models.Task).filter(
-        models.Task.owner_id == user_id,
-        models.Task.created_at >= start_of_month
-    ).all()
-    
-    completed_tasks = sum(1 for task in monthly_tasks if task.completed)
-    total_tasks = len(monthly_tasks)
-    total_hours = sum(task.estimated_hours for task in monthly_tasks)
-    
+    total_tasks = sum(int(total) for _, total, _, _ in category_rows)
+    completed_tasks = sum(int(completed) for _, _, completed, _ in category_rows)
+    total_hours = sum(float(hours) for _, _, _, hours in category_rows)
+
     monthly_stats = schemas.MonthlyStats(
         completed_tasks=completed_tasks,
         total_tasks=total_tasks,
         total_hours=total_hours
     )
-    
+
     # 2. معدل الإكمال الإجمالي
     total_completion_rate = (completed_tasks / total_tasks * 100) if total_tasks > 0 else 0
-    
-    # 3. أفضل سلسلة للعادات
-    habits = get_habits(db, user_id=user_id)
-    best_habit_streak = max((habit.best_streak for habit in habits), default=0)
-    
-    # 4. إحصائيات الفئات
+
+    # 3. إحصائيات الفئات (الفئات الفارغة تدخل في المجاميع فقط)
     category_stats = []
-    categories = {task.category for task in monthly_tasks if task.category}
-    
-    # ألوان افتراضية للفئات
-    colors = ["text-blue-500", "text-green-500", "text-red-500", "text-yellow-500", "text-purple-500"]
-    
-    for i, category_name in enumerate(categories):
-        tasks_in_cat = [t for t in monthly_tasks if t.category == category_name]
-        completed_in_cat = sum(1 for t in tasks_in_cat if t.completed)
-        total_in_cat = len(tasks_in_cat)
+    named_rows = [row for row in category_rows if row[0]]
+    for i, (category_name, total_in_cat, completed_in_cat, _) in enumerate(named_rows):
+        total_in_cat = int(total_in_cat)
+        completed_in_cat = int(completed_in_cat)
         rate = (completed_in_cat / total_in_cat * 100) if total_in_cat > 0 else 0
-        
+
         category_stats.append(schemas.CategoryStat(
             name=category_name,
-            color=colors[i % len(colors)], # تعيين لون متكرر
+            color=CATEGORY_COLORS[i % len(CATEGORY_COLORS)], # تعيين لون متكرر
             completed=completed_in_cat,
             total=total_in_cat,
             rate=rate
         ))
-        
+
     return schemas.ReportStats(
         monthly_stats=monthly_stats,
         total_completion_rate=total_completion_rate,
         best_habit_streak=best_habit_streak,
         category_stats=category_stats
-    )
\ No newline at end of file
+    )
+
+def _rollup_category_rows(db: Session, user_id: int, start_of_month: datetime):
+    """صفوف الشهر من task_stats_rollups: (category, total, completed, hours)."""
+    rollup = models.TaskStatsRollup
+    return db.query(
+        rollup.category,
+        rollup.total_count,
+        rollup.completed_count,
+        rollup.estimated_hours,
+    ).filter(
+        rollup.user_id == user_id,
+        rollup.month == start_of_month.date(),
+        rollup.total_count > 0
+    ).order_by(rollup.category).all()
+
+def get_user_report_stats(db: Session, user_id: int) -> schemas.ReportStats:
+    # قراءة مباشرة من الملخص (صف لكل فئة)، وأفضل سلسلة للعادات
+    start_of_month = _start_of_month(datetime.utcnow())
+    category_rows = _rollup_category_rows(db, user_id, start_of_month)
+    return _build_report_stats(category_rows, _best_habit_streak(db, user_id))
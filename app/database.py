@@ -1,9 +1,17 @@
 # app/database.py
 import os
+import time
+import threading
+from contextlib import asynccontextmanager
+from typing import Union
 from dotenv import load_dotenv
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy import create_engine, text
+from sqlalchemy import exc
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, QueuePool
 
 # 1. تحميل متغيرات البيئة
 load_dotenv()
@@ -12,14 +20,151 @@ SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL")
 if not SQLALCHEMY_DATABASE_URL:
     raise ValueError("DATABASE_URL not found in environment variables.")
 
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+# إعدادات مجمع الاتصالات (Connection Pool)
+# DB_POOL_MODE=null يفتح اتصالاً جديداً لكل جلسة (مناسب لـ Vercel حيث لا تبقى العملية حية)
+DB_POOL_MODE = os.getenv("DB_POOL_MODE", "null" if os.getenv("VERCEL") else "queue").lower()
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+DB_POOL_USE_LIFO = _env_bool("DB_POOL_USE_LIFO", True)
+# pre-ping يضيف رحلة ذهاب وعودة مع كل استعارة اتصال؛ pool_recycle يكفي عادةً
+DB_POOL_PRE_PING = _env_bool("DB_POOL_PRE_PING", False)
+
+# DB_ASYNC=1 يجعل المسارات تستخدم محركاً غير متزامن (asyncpg) بدلاً من threadpool + psycopg2
+DB_ASYNC = _env_bool("DB_ASYNC", False)
+# false = لا تُبطل الحقول بعد commit، فلا حاجة إلى SELECT إضافي (refresh) لإعادة تحميل ما كُتب للتو.
+# الجلسة تعيش لطلب واحد فقط، لذا لا يوجد خطر حقيقي من قراءة بيانات قديمة.
+DB_EXPIRE_ON_COMMIT = _env_bool("DB_EXPIRE_ON_COMMIT", True)
+
+
+def _to_async_url(url: str) -> str:
+    for prefix in ("postgresql+psycopg2://", "postgresql://", "postgres://"):
+        if url.startswith(prefix):
+            return "postgresql+asyncpg://" + url[len(prefix):]
+    return url
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or _to_async_url(SQLALCHEMY_DATABASE_URL)
+
+
+class PoolStats:
+    """مقاييس زمن انتظار استعارة الاتصالات من المجمع."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def record_wait(self, seconds: float):
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait_seconds += seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "avg_wait_ms": (self.total_wait_seconds / self.checkouts * 1000) if self.checkouts else 0.0,
+                "max_wait_ms": self.max_wait_seconds * 1000,
+            }
+
+
+class _TimedPoolMixin:
+    """يقيس زمن انتظار كل استعارة اتصال من المجمع."""
+
+    stats: PoolStats
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            # المهلة ليست استعارة ناجحة ولا تدخل في متوسط الانتظار
+            self.stats.record_timeout()
+            raise
+        self.stats.record_wait(time.perf_counter() - started)
+        return connection
+
+
+class TimedQueuePool(_TimedPoolMixin, QueuePool):
+    stats = PoolStats()
+
+
+class TimedAsyncAdaptedQueuePool(_TimedPoolMixin, AsyncAdaptedQueuePool):
+    stats = PoolStats()
+
+
+def _engine_options(is_async: bool = False) -> dict:
+    if DB_POOL_MODE == "null":
+        return {"poolclass": NullPool, "pool_pre_ping": DB_POOL_PRE_PING}
+    return {
+        "poolclass": TimedAsyncAdaptedQueuePool if is_async else TimedQueuePool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_use_lifo": DB_POOL_USE_LIFO,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
 # 2. إنشاء محرك الاتصال
 engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, 
-    pool_pre_ping=True
+    SQLALCHEMY_DATABASE_URL,
+    **_engine_options()
 )
 
+
+# المحرك غير المتزامن يُنشأ فقط عند تفعيل DB_ASYNC (يتطلب asyncpg)
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **_engine_options(is_async=True)) if DB_ASYNC else None
+
+
+def _pool_status(pool) -> dict:
+    status = {"mode": DB_POOL_MODE, "pre_ping": DB_POOL_PRE_PING}
+    if isinstance(pool, _TimedPoolMixin):
+        status.update(pool.stats.snapshot())
+    if isinstance(pool, QueuePool):
+        status.update({
+            "pool_size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": pool.overflow(),
+            "max_overflow": DB_MAX_OVERFLOW,
+        })
+    return status
+
+
+def get_pool_status() -> dict:
+    """حالة المجمع الحية: الاتصالات المستعارة، الفائضة، وزمن الانتظار."""
+    status = {"sync": _pool_status(engine.pool)}
+    if async_engine is not None:
+        status["async"] = _pool_status(async_engine.sync_engine.pool)
+    return status
+
 # 3. إنشاء فئة جلسة العمل
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine, expire_on_commit=DB_EXPIRE_ON_COMMIT)
+# expire_on_commit=False ضروري مع AsyncSession حتى لا يحاول تسلسل الاستجابة تحميل الحقول بشكل كسول
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False) if async_engine is not None else None
+
+# أي من نوعي الجلسة حسب الوضع المفعّل
+DBSession = Union[Session, AsyncSession]
 
 # 4. إنشاء الكلاس الأساسي لنماذج SQLAlchemy
 Base = declarative_base()
@@ -30,4 +175,29 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+# 6. جلسة المسارات غير المتزامنة: AsyncSession عند تفعيل DB_ASYNC وإلا Session عادية
+async def get_session():
+    if AsyncSessionLocal is not None:
+        async with AsyncSessionLocal() as session:
+            yield session
+    else:
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            await run_in_threadpool(db.close)
+
+# نفس get_session لكن كسياق async with، للاستخدام خارج حقن التبعيات (مثل WebSocket)
+session_scope = asynccontextmanager(get_session)
+
+async def run_db(db: DBSession, func, *args, **kwargs):
+    """
+    تشغيل دالة من crud.py على الجلسة الحالية دون حجز حلقة الأحداث.
+    مع AsyncSession تُنفَّذ الدالة عبر run_sync (greenlet فوق asyncpg)،
+    ومع Session العادية تُنفَّذ في threadpool كما في السابق.
+    """
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(func, *args, **kwargs)
+    return await run_in_threadpool(func, db, *args, **kwargs)
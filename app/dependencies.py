@@ -1,45 +1,135 @@
 # app/dependencies.py
 from datetime import timedelta
-from fastapi import Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import Depends, HTTPException, Request, Response, status
 from jose import JWTError
-from typing import Annotated
+from typing import Annotated, Optional
 
 from . import crud, schemas
-from .auth_utils import decode_access_token, oauth2_scheme
-from .database import get_db
+from .auth_utils import decode_access_token, oauth2_scheme, optional_oauth2_scheme, TOKEN_FORMAT_VERSION
+from .database import DBSession, get_session, run_db
+from .cache import user_cache, token_version_cache
 
 # استخدام Annotated مع Depends لتحديد النوع بوضوح
-DatabaseDependency = Annotated[Session, Depends(get_db)]
+DatabaseDependency = Annotated[DBSession, Depends(get_session)]
 TokenDependency = Annotated[str, Depends(oauth2_scheme)]
 
 
-def get_current_user(db: DatabaseDependency, token: TokenDependency) -> schemas.UserRead:
-    """الحصول على المستخدم الحالي من رمز JWT والتحقق من صلاحيته"""
-    credentials_exception = HTTPException(
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="تعذر التحقق من بيانات الاعتماد",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    
+
+
+# يُرسل مع الاستجابة عندما يحمل التوكن حقولاً قديمة (تغيّر الاشتراك مثلاً)؛ الواجهة تستدعي /auth/refresh
+TOKEN_REFRESH_HEADER = "X-Token-Refresh"
+
+
+async def _check_token_version(db: DBSession, token_data: dict) -> bool:
+    """
+    رفض التوكنات الصادرة قبل آخر إبطال (token_version، مثل تغيير كلمة المرور).
+    تعيد True إذا كان التوكن صالحاً لكن حقوله أقدم من claims_version الحالي.
+    """
+    if "tv" not in token_data:
+        return False
+    user_id = token_data.get("user_id")
+    versions = token_version_cache.get(user_id)
+    if versions is None:
+        versions = await run_db(db, crud.get_user_token_versions, user_id)
+    if versions is None or token_data["tv"] != versions[0]:
+        raise _credentials_exception()
+    return token_data.get("cv", 0) != versions[1]
+
+
+async def get_current_user(db: DatabaseDependency, token: TokenDependency, response: Response = None) -> schemas.UserRead:
+    """الحصول على المستخدم الحالي من رمز JWT والتحقق من صلاحيته"""
+    credentials_exception = _credentials_exception()
+
     # 1. فك ترميز التوكن
     token_data = decode_access_token(token)
     if token_data is None:
         raise credentials_exception
-        
+
     user_email = token_data.get("email")
     if user_email is None:
         raise credentials_exception
-    
-    # 2. جلب المستخدم من قاعدة البيانات
-    user = crud.get_user_by_email(db, email=user_email)
+
+    # response غائب عند الاستدعاء المباشر (مثل مصادقة WebSocket / SSE): لا رأس تجديد
+    if await _check_token_version(db, token_data) and response is not None:
+        response.headers[TOKEN_REFRESH_HEADER] = "1"
+
+    # 2. محاولة الذاكرة المؤقتة أولاً لتجنب استعلام users في كل طلب
+    cached_user = user_cache.get(user_email)
+    if cached_user is not None:
+        return cached_user
+
+    # 3. جلب المستخدم من قاعدة البيانات
+    user = await run_db(db, crud.get_user_by_email, email=user_email)
     if user is None:
         raise credentials_exception
-        
-    return schemas.UserRead.model_validate(user)
+
+    user_read = schemas.UserRead.model_validate(user)
+    user_cache.set(user_email, user_read)
+    return user_read
+
+
+async def get_current_user_from_claims(db: DatabaseDependency, token: TokenDependency, response: Response = None) -> schemas.UserRead:
+    """
+    بناء المستخدم الحالي من الـ claims الموقّعة فقط (بدون استعلام users).
+    الاستعلام الوحيد الممكن هو قراءة token_version عند عدم وجوده في الذاكرة المؤقتة.
+    التوكنات ذات الصيغة القديمة أو الحقول القديمة (claims_version) تُعالج عبر get_current_user.
+    """
+    token_data = decode_access_token(token)
+    if token_data is None:
+        raise _credentials_exception()
+
+    if token_data.get("fmt") != TOKEN_FORMAT_VERSION:
+        return await get_current_user(db, token, response)
+
+    if await _check_token_version(db, token_data):
+        # الحقول الموقّعة قديمة: القراءة من قاعدة البيانات حتى يُعاد إصدار التوكن
+        return await get_current_user(db, token, response)
+
+    try:
+        return schemas.UserRead(
+            id=token_data["user_id"],
+            name=token_data["name"],
+            email=token_data["email"],
+            is_active=token_data["is_active"],
+            is_unlocked=token_data.get("is_unlocked", False),
+            plan=token_data.get("plan"),
+            subscription_id=token_data.get("subscription_id"),
+            expires_at=token_data.get("expires_at"),
+            timezone=token_data.get("timezone", "UTC"),
+        )
+    except (KeyError, ValueError):
+        raise _credentials_exception()
+
+async def get_optional_user_id(token: Optional[str] = Depends(optional_oauth2_scheme)) -> Optional[int]:
+    """
+    معرف المستخدم من التوكن الموقّع إن وُجد، وإلا None.
+    لا يستعلم قاعدة البيانات ولا يرفض التوكن غير الصالح (يُعامل كطلب مجهول).
+    """
+    if token:
+        token_data = decode_access_token(token)
+        if token_data and token_data.get("user_id") is not None:
+            return token_data["user_id"]
+    return None
+
+
+async def get_rate_limit_key(request: Request, user_id: Optional[int] = Depends(get_optional_user_id)) -> str:
+    """مفتاح الميزانية/تحديد المعدل: معرف المستخدم إن وُجد، وإلا عنوان IP."""
+    if user_id is not None:
+        return f"user:{user_id}"
+    client_host = request.client.host if request.client else "unknown"
+    return f"ip:{client_host}"
 
 # يمكن تعريف اختصار لـ get_current_user
 # Expose the actual callable so routes that do Depends(ActiveUser) work correctly.
 # Previously ActiveUser was an Annotated type which caused FastAPI to treat it
 # incorrectly and attempt to parse query params like 'args'/'kwargs'.
-ActiveUser = get_current_user
\ No newline at end of file
+ActiveUser = get_current_user
+
+# للمسارات كثيرة القراءة التي تحتاج فقط إلى معرف المستخدم
+ClaimsUser = get_current_user_from_claims
@@ -0,0 +1,257 @@
+# app/events.py
+# موزع أحداث المؤقت على اتصالات WebSocket / SSE المفتوحة لكل مستخدم.
+# كل اتصال يملك طابوراً صغيراً محدود الحجم؛ الرسالة تُسلسل إلى JSON مرة واحدة
+# وتُشارك بين كل الاتصالات، فتبقى كلفة الموزع لكل اتصال خامل بضعة كيلوبايت (~45 KiB للاتصال
+# كاملاً مع uvicorn). ضغط per-message-deflate في uvicorn يضيف سياق zlib لكل اتصال (~90 KiB)،
+# لذا يُشغَّل الخادم مع --ws-per-message-deflate false (انظر bench/event_connections.py).
+# الموزع نفسه يصل فقط إلى اتصالات هذه العملية؛ مع عدة عمليات تُمرر الأحداث عبر
+# Postgres LISTEN/NOTIFY (PostgresEventRelay) حتى تصل إلى العميل أينما كان متصلاً.
+import asyncio
+import json
+import os
+import threading
+import uuid
+from collections import defaultdict
+from typing import Dict, Optional, Set, Tuple
+
+from dotenv import load_dotenv
+
+from . import schemas
+
+load_dotenv()
+
+# عند امتلاء الطابور (عميل بطيء) يُحذف أقدم حدث
+EVENT_QUEUE_SIZE = int(os.getenv("EVENT_QUEUE_SIZE", 16))
+# Vercel لا يدعم WebSocket ولا يبقي عملية دائمة للاستماع؛ يبقى SSE والاستطلاع
+_ON_VERCEL = bool(os.getenv("VERCEL"))
+EVENTS_WEBSOCKET_ENABLED = os.getenv("EVENTS_WEBSOCKET_ENABLED", "false" if _ON_VERCEL else "true").lower() in ("1", "true", "yes")
+EVENTS_RELAY_ENABLED = os.getenv("EVENTS_RELAY_ENABLED", "false" if _ON_VERCEL else "true").lower() in ("1", "true", "yes")
+EVENTS_RELAY_CHANNEL = os.getenv("EVENTS_RELAY_CHANNEL", "task_events")
+# حمولة NOTIFY محدودة بـ 8000 بايت؛ الحدث الأكبر يُرسل بدون المهمة والعميل يعيد جلبها
+NOTIFY_MAX_BYTES = 7900
+# أحداث تنتظر الإرسال أثناء انقطاع اتصال المرحّل؛ عند الامتلاء يُحذف أقدمها
+EVENTS_RELAY_OUTBOX_SIZE = int(os.getenv("EVENTS_RELAY_OUTBOX_SIZE", 1000))
+
+Event = Tuple[str, str]  # (نوع الحدث, JSON)
+
+
+class EventHub:
+    def __init__(self, queue_size: int = EVENT_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscribers: Dict[int, Set[asyncio.Queue]] = defaultdict(set)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+        self.relay: Optional["PostgresEventRelay"] = None
+        self.published = 0
+        self.dropped = 0
+
+    def subscribe(self, user_id: int) -> asyncio.Queue:
+        """يُستدعى من حلقة الأحداث عند فتح اتصال."""
+        self._loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._subscribers[user_id].add(queue)
+        return queue
+
+    def unsubscribe(self, user_id: int, queue: asyncio.Queue) -> None:
+        with self._lock:
+            queues = self._subscribers.get(user_id)
+            if queues is None:
+                return
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[user_id]
+
+    def has_subscribers(self, user_id: int) -> bool:
+        return user_id in self._subscribers
+
+    def publish(self, user_id: int, event_type: str, task=None) -> None:
+        """
+        نشر حدث لكل اتصالات المستخدم. آمنة للاستدعاء من أي خيط
+        (دوال crud تعمل في threadpool أو داخل run_sync).
+        """
+        relay = self.relay if self.relay is not None and self.relay.running else None
+        local = self.has_subscribers(user_id) and self._loop is not None
+        if not local and relay is None:
+            return
+        payload = {"type": event_type}
+        if task is not None:
+            payload["task"] = schemas.TaskRead.model_validate(task).model_dump(mode="json")
+        event = (event_type, json.dumps(payload, ensure_ascii=False))
+        if relay is not None:
+            relay.send(user_id, event)
+        if local:
+            self.deliver(user_id, event)
+
+    def deliver(self, user_id: int, event: Event) -> None:
+        """تسليم حدث مسلسل مسبقاً لاتصالات هذه العملية. آمنة للاستدعاء من أي خيط."""
+        if self._loop is None:
+            return
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        if running_loop is self._loop:
+            self._deliver(user_id, event)
+        else:
+            self._loop.call_soon_threadsafe(self._deliver, user_id, event)
+
+    def _deliver(self, user_id: int, event: Event) -> None:
+        with self._lock:
+            queues = list(self._subscribers.get(user_id, ()))
+        for queue in queues:
+            if queue.full():
+                queue.get_nowait()
+                self.dropped += 1
+            queue.put_nowait(event)
+        self.published += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            users = len(self._subscribers)
+            connections = sum(len(queues) for queues in self._subscribers.values())
+        return {
+            "users": users,
+            "connections": connections,
+            "published": self.published,
+            "dropped": self.dropped,
+            "websocket_enabled": EVENTS_WEBSOCKET_ENABLED,
+            "relay": self.relay.stats() if self.relay is not None else None,
+        }
+
+
+def _asyncpg_dsn(url: str) -> str:
+    for prefix in ("postgresql+asyncpg://", "postgresql+psycopg2://", "postgres://"):
+        if url.startswith(prefix):
+            return "postgresql://" + url[len(prefix):]
+    return url
+
+
+class PostgresEventRelay:
+    """
+    نقل الأحداث بين العمليات عبر Postgres LISTEN/NOTIFY: كل حدث يُرسل إلى القناة،
+    وكل عملية تستمع وتسلم الأحداث الواردة من العمليات الأخرى إلى اتصالاتها المحلية
+    (أحداث العملية نفسها سُلمت محلياً مسبقاً). اتصال asyncpg واحد للاستماع والإرسال معاً.
+    """
+
+    def __init__(self, hub: EventHub, dsn: str, channel: str = EVENTS_RELAY_CHANNEL, outbox_size: int = EVENTS_RELAY_OUTBOX_SIZE):
+        self.hub = hub
+        self.dsn = _asyncpg_dsn(dsn)
+        self.channel = channel
+        self.outbox_size = outbox_size
+        self.origin = uuid.uuid4().hex
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._outbox: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self.sent = 0
+        self.received = 0
+        self.truncated = 0
+        self.dropped = 0
+        self.errors = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def send(self, user_id: int, event: Event) -> None:
+        """آمنة للاستدعاء من أي خيط."""
+        event_type, message = event
+        notification = json.dumps({"o": self.origin, "u": user_id, "t": event_type, "m": message}, ensure_ascii=False)
+        if len(notification.encode("utf-8")) > NOTIFY_MAX_BYTES:
+            self.truncated += 1
+            message = json.dumps({"type": event_type})
+            notification = json.dumps({"o": self.origin, "u": user_id, "t": event_type, "m": message})
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        if running_loop is self._loop:
+            self._enqueue(notification)
+        else:
+            self._loop.call_soon_threadsafe(self._enqueue, notification)
+
+    def _enqueue(self, notification: str) -> None:
+        # يعمل على حلقة الأحداث فقط، فلا سباق بين الفحص والإضافة
+        if self._outbox.full():
+            self._outbox.get_nowait()
+            self.dropped += 1
+        self._outbox.put_nowait(notification)
+
+    def _on_notify(self, connection, pid, channel, payload: str) -> None:
+        try:
+            notification = json.loads(payload)
+        except ValueError:
+            return
+        if notification.get("o") == self.origin or not self.hub.has_subscribers(notification.get("u")):
+            return
+        self.received += 1
+        self.hub.deliver(notification["u"], (notification["t"], notification["m"]))
+
+    async def _run(self) -> None:
+        import asyncpg
+
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(self.dsn)
+                await connection.add_listener(self.channel, self._on_notify)
+                while True:
+                    notification = await self._outbox.get()
+                    await connection.execute("SELECT pg_notify($1, $2)", self.channel, notification)
+                    self.sent += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # انقطاع الاتصال: الأحداث خلال فترة إعادة الاتصال تُفقد والعملاء يعتمدون على الاستطلاع
+                self.errors += 1
+                print(f"Event relay error: {e}")
+                await asyncio.sleep(1)
+            finally:
+                if connection is not None and not connection.is_closed():
+                    await connection.close()
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._outbox = asyncio.Queue(maxsize=self.outbox_size)
+        self._task = asyncio.create_task(self._run())
+        self.hub.relay = self
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self.hub.relay = None
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "channel": self.channel,
+            "sent": self.sent,
+            "received": self.received,
+            "truncated": self.truncated,
+            "dropped": self.dropped,
+            "errors": self.errors,
+        }
+
+
+event_hub = EventHub()
+event_relay: Optional[PostgresEventRelay] = None
+
+
+async def start_event_relay(dsn: str) -> None:
+    global event_relay
+    if event_relay is None:
+        event_relay = PostgresEventRelay(event_hub, dsn)
+    await event_relay.start()
+
+
+async def stop_event_relay() -> None:
+    if event_relay is not None:
+        await event_relay.stop()
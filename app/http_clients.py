@@ -0,0 +1,202 @@
+# app/http_clients.py
+# عملاء HTTP الصادرة (Gemini / Kashier) مشتركة على مستوى التطبيق بدلاً من
+# إنشاء httpx.AsyncClient في كل طلب: الاتصالات تبقى مفتوحة (keep-alive) وتُعاد
+# لاستخدامها فلا نكرر مصافحة TCP + TLS، مع HTTP/2 عند توفر مكتبة h2.
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+try:
+    import h2  # noqa: F401  (httpx[http2])
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# عدد عينات زمن الاستجابة المحفوظة لكل خدمة لحساب p50/p95
+LATENCY_SAMPLES = int(os.getenv("HTTP_CLIENT_LATENCY_SAMPLES", 512))
+
+
+@dataclass
+class UpstreamConfig:
+    name: str
+    max_connections: int = 20
+    max_keepalive_connections: int = 10
+    keepalive_expiry: float = 60.0
+    connect_timeout: float = 5.0
+    timeout: float = 10.0
+    http2: bool = True
+    # ناقل بديل (مثل httpx.ASGITransport لخادم Gemini وهمي في الاختبارات)
+    transport: Optional[httpx.AsyncBaseTransport] = None
+
+    @classmethod
+    def from_env(cls, name: str, **defaults) -> "UpstreamConfig":
+        """القيم من متغيرات البيئة بالبادئة <NAME>_HTTP_ (مثل GEMINI_HTTP_TIMEOUT)."""
+        config = cls(name=name, **defaults)
+        prefix = f"{name.upper()}_HTTP_"
+        for field, cast in (
+            ("max_connections", int),
+            ("max_keepalive_connections", int),
+            ("keepalive_expiry", float),
+            ("connect_timeout", float),
+            ("timeout", float),
+        ):
+            value = os.getenv(prefix + field.upper())
+            if value is not None:
+                setattr(config, field, cast(value))
+        http2 = os.getenv(prefix + "HTTP2")
+        if http2 is not None:
+            config.http2 = http2.lower() in ("1", "true", "yes")
+        return config
+
+
+class UpstreamStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        # اتصالات جديدة (مصافحة TCP) مقابل طلبات أعادت استخدام اتصال مفتوح
+        self.new_connections = 0
+        self.tls_handshakes = 0
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+
+    def record_connect(self) -> None:
+        with self._lock:
+            self.new_connections += 1
+
+    def record_tls(self) -> None:
+        with self._lock:
+            self.tls_handshakes += 1
+
+    def record_response(self, elapsed: Optional[float], error: bool) -> None:
+        with self._lock:
+            self.requests += 1
+            if error:
+                self.errors += 1
+            if elapsed is not None:
+                self._latencies.append(elapsed)
+
+    @property
+    def samples(self) -> int:
+        return len(self._latencies)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """زمن الاستجابة بالثواني عند النسبة المئوية p (0..1) من آخر العينات."""
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            requests = self.requests
+            new_connections = self.new_connections
+            result = {
+                "requests": requests,
+                "errors": self.errors,
+                "new_connections": new_connections,
+                "tls_handshakes": self.tls_handshakes,
+            }
+
+        def percentile_ms(p: float) -> Optional[float]:
+            value = self.percentile(p)
+            return round(value * 1000, 2) if value is not None else None
+
+        result["reused_connections"] = max(0, requests - new_connections)
+        result["reuse_ratio"] = round(1 - new_connections / requests, 4) if requests else None
+        result["latency_ms_p50"] = percentile_ms(0.50)
+        result["latency_ms_p95"] = percentile_ms(0.95)
+        return result
+
+
+class HTTPClientRegistry:
+    def __init__(self):
+        self._configs: Dict[str, UpstreamConfig] = {}
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._stats: Dict[str, UpstreamStats] = {}
+
+    def register(self, config: UpstreamConfig) -> None:
+        self._configs[config.name] = config
+        self._stats.setdefault(config.name, UpstreamStats())
+
+    def _build(self, config: UpstreamConfig) -> httpx.AsyncClient:
+        stats = self._stats[config.name]
+
+        async def trace(event_name: str, info: dict) -> None:
+            # أحداث httpcore: تُطلق فقط عند فتح اتصال جديد
+            if event_name == "connection.connect_tcp.complete":
+                stats.record_connect()
+            elif event_name == "connection.start_tls.complete":
+                stats.record_tls()
+
+        async def on_request(request: httpx.Request) -> None:
+            request.extensions["trace"] = trace
+            request.extensions["upstream_started"] = time.perf_counter()
+
+        async def on_response(response: httpx.Response) -> None:
+            started = response.request.extensions.get("upstream_started")
+            if started is not None:
+                stats.record_response(time.perf_counter() - started, response.is_error)
+
+        return httpx.AsyncClient(
+            http2=config.http2 and HTTP2_AVAILABLE,
+            limits=httpx.Limits(
+                max_connections=config.max_connections,
+                max_keepalive_connections=config.max_keepalive_connections,
+                keepalive_expiry=config.keepalive_expiry,
+            ),
+            timeout=httpx.Timeout(config.timeout, connect=config.connect_timeout),
+            transport=config.transport,
+            event_hooks={"request": [on_request], "response": [on_response]},
+        )
+
+    def get(self, name: str) -> httpx.AsyncClient:
+        """العميل المشترك للخدمة؛ يُنشأ عند أول استخدام إذا لم يُفتح عند بدء التطبيق (Vercel)."""
+        client = self._clients.get(name)
+        if client is None or client.is_closed:
+            client = self._build(self._configs[name])
+            self._clients[name] = client
+        return client
+
+    def upstream_stats(self, name: str) -> UpstreamStats:
+        return self._stats[name]
+
+    def record_error(self, name: str) -> None:
+        """أخطاء الاتصال / المهلة لا تصل إلى response hook."""
+        stats = self._stats.get(name)
+        if stats is not None:
+            stats.record_response(None, True)
+
+    def start(self) -> None:
+        for name in self._configs:
+            self.get(name)
+
+    async def aclose(self) -> None:
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            await client.aclose()
+
+    def stats(self) -> dict:
+        return {
+            name: {
+                "http2": config.http2 and HTTP2_AVAILABLE,
+                "open": name in self._clients and not self._clients[name].is_closed,
+                "max_connections": config.max_connections,
+                "max_keepalive_connections": config.max_keepalive_connections,
+                **self._stats[name].snapshot(),
+            }
+            for name, config in self._configs.items()
+        }
+
+
+http_clients = HTTPClientRegistry()
+http_clients.register(UpstreamConfig.from_env("gemini", timeout=10.0))
+http_clients.register(UpstreamConfig.from_env("kashier", timeout=10.0))
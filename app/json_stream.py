@@ -0,0 +1,67 @@
+# app/json_stream.py
+# محلل تدريجي لمصفوفة JSON تصل على أجزاء (مثل نص Gemini المتدفق):
+# يعيد كل كائن من المستوى الأول بمجرد إغلاق قوسه، دون انتظار نهاية المصفوفة.
+import json
+from typing import Any, List
+
+
+class JSONArrayStreamParser:
+    def __init__(self):
+        self._buffer = ""
+        # موضع الفحص داخل _buffer
+        self._pos = 0
+        self._depth = 0
+        # عمق كائنات العناصر: 1 داخل مصفوفة، 0 إذا أعاد النموذج كائناً واحداً بدون مصفوفة
+        self._base = None
+        self._start = None
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, chunk: str) -> List[Any]:
+        """إضافة جزء جديد وإرجاع الكائنات التي اكتملت فيه."""
+        self._buffer += chunk
+        items: List[Any] = []
+        buffer = self._buffer
+        i = self._pos
+        while i < len(buffer) and not self.complete:
+            ch = buffer[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                # حالة النص تُتابع في كل عمق (بما فيه عناصر المصفوفة النصية مثل "a]")،
+                # أما ما قبل أول قوس فنص حر قد يحتوي علامات تنصيص غير متوازنة
+                if self._base is not None:
+                    self._in_string = True
+            elif ch in "[{":
+                if self._base is None:
+                    # ما قبل أول قوس (مثل ```json) يُتجاهل
+                    self._base = 1 if ch == "[" else 0
+                if ch == "{" and self._depth == self._base and self._start is None:
+                    self._start = i
+                self._depth += 1
+            elif ch in "]}" and self._base is not None:
+                self._depth -= 1
+                if ch == "}" and self._depth == self._base and self._start is not None:
+                    items.append(json.loads(buffer[self._start:i + 1]))
+                    self._start = None
+            i += 1
+
+        # الاحتفاظ فقط بالكائن غير المكتمل
+        if self._start is not None:
+            self._buffer = buffer[self._start:]
+            self._pos = i - self._start
+            self._start = 0
+        else:
+            self._buffer = ""
+            self._pos = 0
+        return items
+
+    @property
+    def complete(self) -> bool:
+        """هل أُغلقت المصفوفة (أو الكائن الوحيد)؟"""
+        return self._base is not None and self._depth == 0
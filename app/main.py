@@ -1,8 +1,16 @@
 # app/main.py
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from .routers import auth, tasks, notes, habits, payments, ai, statistics
-from .database import engine, Base 
+from .routers import auth, tasks, notes, habits, payments, ai, statistics, internal
+from .database import engine, async_engine, Base, ASYNC_DATABASE_URL
+from .query_stats import QueryCountMiddleware, instrument
+from .auth_utils import shutdown_hash_executor
+from .pagination import NEXT_CURSOR_HEADER
+from .dependencies import TOKEN_REFRESH_HEADER
+from .http_clients import http_clients
+from .timer_expiry import TIMER_EXPIRY_ENABLED, expiry_engine
+from .payment_worker import PAYMENT_WORKER_ENABLED, payment_worker
+from .events import EVENTS_RELAY_ENABLED, start_event_relay, stop_event_relay
 
 # تهيئة FastAPI
 app = FastAPI(
@@ -26,13 +34,40 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, TOKEN_REFRESH_HEADER],
 )
 
+# عدد استعلامات SQL لكل مسار (/internal/query-counts)
+instrument(engine)
+if async_engine is not None:
+    instrument(async_engine.sync_engine)
+app.add_middleware(QueryCountMiddleware)
+
 @app.on_event("startup")
 def startup_event():
     Base.metadata.create_all(bind=engine)
     print("Database tables created successfully!")
 
+@app.on_event("startup")
+async def start_background_workers():
+    http_clients.start()
+    if TIMER_EXPIRY_ENABLED:
+        await expiry_engine.start()
+    if PAYMENT_WORKER_ENABLED:
+        await payment_worker.start()
+    if EVENTS_RELAY_ENABLED:
+        await start_event_relay(ASYNC_DATABASE_URL)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await expiry_engine.stop()
+    await payment_worker.stop()
+    await stop_event_relay()
+    await http_clients.aclose()
+    shutdown_hash_executor()
+    if async_engine is not None:
+        await async_engine.dispose()
+
 app.include_router(auth.router)
 app.include_router(tasks.router)
 app.include_router(notes.router)
@@ -40,6 +75,7 @@ app.include_router(habits.router)
 app.include_router(payments.router)
 app.include_router(ai.router)
 app.include_router(statistics.router)
+app.include_router(internal.router)
 
 @app.get("/")
 def read_root():
@@ -1,5 +1,5 @@
 # app/models.py
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, ForeignKey, Float
+from sqlalchemy import Column, Integer, String, Boolean, Date, DateTime, Text, ForeignKey, Float, Index, text
 from sqlalchemy.orm import relationship
 from .database import Base
 from datetime import datetime
@@ -18,10 +18,22 @@ class User(Base):
     plan = Column(String, nullable=True)
     subscription_id = Column(String, nullable=True)
     expires_at = Column(DateTime, nullable=True)
+    # يُزاد عند أي تعديل يبطل التوكنات الصادرة سابقاً (كلمة المرور)
+    token_version = Column(Integer, default=0, server_default="0", nullable=False)
+    # يُزاد عند تغيّر الحقول المحمولة في التوكن (الاشتراك، التفعيل): التوكن يبقى صالحاً لكن يجب تجديده عبر /auth/refresh
+    claims_version = Column(Integer, default=0, server_default="0", nullable=False)
+    # المنطقة الزمنية (IANA) لتنفيذ ترحيل المهام عند منتصف الليل المحلي للمستخدم
+    timezone = Column(String, default="UTC", server_default="UTC", nullable=False)
+    last_rollover_date = Column(Date, nullable=True)
     
     tasks = relationship("Task", back_populates="owner")
     notes = relationship("Note", back_populates="owner")
     habits = relationship("Habit", back_populates="owner")
+
+    __table_args__ = (
+        # جدولة الترحيل اليومي: المستخدمون المستحقون في كل منطقة زمنية
+        Index("ix_users_timezone_last_rollover_date", timezone, last_rollover_date),
+    )
     
 # --- نموذج المهمة (Task) ---
 class Task(Base):
@@ -48,6 +60,20 @@ class Task(Base):
 
     owner = relationship("User", back_populates="tasks")
 
+    # الفهارس مطابقة لاستعلامات crud.py (كلها تبدأ بـ owner_id)
+    __table_args__ = (
+        # قوائم المهام وإحصائيات الشهر: owner_id + created_at
+        Index("ix_tasks_owner_id_created_at", owner_id, created_at.desc(), id.desc()),
+        # get_active_task: مهمة نشطة واحدة على الأكثر لكل مستخدم
+        Index("uq_tasks_owner_id_active", owner_id, unique=True, postgresql_where=text("is_active")),
+        # end_of_day_cleanup: المهام المفتوحة غير النشطة فقط
+        Index(
+            "ix_tasks_open_inactive",
+            id,
+            postgresql_where=text("status IN ('TO_DO', 'IN_PROGRESS') AND NOT is_active"),
+        ),
+    )
+
 # --- نموذج الملاحظة (Note) ---
 class Note(Base):
     __tablename__ = "notes"
@@ -62,6 +88,10 @@ class Note(Base):
 
     owner = relationship("User", back_populates="notes")
 
+    __table_args__ = (
+        Index("ix_notes_owner_id_created_at", owner_id, created_at.desc(), id.desc()),
+    )
+
 # --- نموذج العادة (Habit) ---
 class Habit(Base):
     __tablename__ = "habits"
@@ -76,4 +106,50 @@ class Habit(Base):
     last_completed = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     
-    owner = relationship("User", back_populates="habits")
\ No newline at end of file
+    owner = relationship("User", back_populates="habits")
+
+    __table_args__ = (
+        Index("ix_habits_owner_id_created_at", owner_id, created_at.desc(), id.desc()),
+    )
+
+# --- ملخص إحصائيات المهام (يُحدَّث مع كل كتابة على tasks) ---
+class TaskStatsRollup(Base):
+    __tablename__ = "task_stats_rollups"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    month = Column(Date, primary_key=True)  # أول يوم في الشهر حسب created_at للمهمة
+    category = Column(String, primary_key=True)  # "" للمهام بدون فئة
+    total_count = Column(Integer, default=0, server_default="0", nullable=False)
+    completed_count = Column(Integer, default=0, server_default="0", nullable=False)
+    estimated_hours = Column(Float, default=0.0, server_default="0", nullable=False)
+
+# --- طلبات الدفع (order_id المرسل إلى Kashier -> المستخدم والخطة) ---
+class PaymentOrder(Base):
+    __tablename__ = "payment_orders"
+
+    order_id = Column(String, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"), nullable=True, index=True)
+    plan = Column(String, nullable=True)
+    amount = Column(String, nullable=True)
+    currency = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+# --- صندوق وارد إشعارات Kashier: كل إشعار يُحفظ مرة واحدة ويُعالج لاحقاً في الخلفية ---
+class PaymentEvent(Base):
+    __tablename__ = "payment_events"
+
+    event_id = Column(String, primary_key=True)  # "<event>:<transactionId>"
+    event_type = Column(String, nullable=True)
+    order_id = Column(String, nullable=True, index=True)
+    payload = Column(Text, nullable=False)  # الجسم الخام كما وصل
+    status = Column(String, default="pending", server_default="pending", nullable=False)  # pending | processed | ignored | failed
+    attempts = Column(Integer, default=0, server_default="0", nullable=False)
+    last_error = Column(Text, nullable=True)
+    received_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    processed_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        # العامل الخلفي يسحب الإشعارات المعلقة المستحقة فقط
+        Index("ix_payment_events_pending", next_attempt_at, postgresql_where=text("status = 'pending'")),
+    )
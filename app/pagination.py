@@ -0,0 +1,40 @@
+# app/pagination.py
+import base64
+import json
+from datetime import datetime
+from typing import Optional, Sequence, Tuple
+
+from fastapi import HTTPException, status
+
+# اسم الرأس الذي يحمل مؤشر الصفحة التالية في استجابات القوائم
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+Cursor = Tuple[datetime, int]
+
+
+def encode_cursor(created_at: datetime, item_id: int) -> str:
+    """ترميز (created_at, id) كنص مبهم للواجهة الأمامية."""
+    raw = json.dumps([created_at.isoformat(), item_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Cursor]:
+    """فك ترميز المؤشر؛ يرفع 400 إذا كان غير صالح."""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, item_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(created_at), int(item_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+
+def next_cursor(items: Sequence, limit: int) -> Optional[str]:
+    """مؤشر الصفحة التالية إذا كانت الصفحة الحالية ممتلئة."""
+    if limit <= 0 or len(items) < limit:
+        return None
+    last = items[-1]
+    if last.created_at is None:
+        return None
+    return encode_cursor(last.created_at, last.id)
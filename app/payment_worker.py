@@ -0,0 +1,96 @@
+# app/payment_worker.py
+# العامل الخلفي لتطبيق إشعارات Kashier المحفوظة في payment_events.
+# مسار الـ webhook يكتفي بالتحقق من التوقيع وINSERT واحد ثم يوقظ العامل،
+# والعامل يطبق الإشعارات على دفعات (crud.process_payment_events).
+import asyncio
+import os
+from typing import Optional
+
+from dotenv import load_dotenv
+
+from .database import run_db, session_scope
+
+load_dotenv()
+
+# على Vercel لا توجد عملية دائمة؛ يُستخدم أمر "python -m app.cli process-payment-events" من cron
+PAYMENT_WORKER_ENABLED = os.getenv("PAYMENT_WORKER_ENABLED", "false" if os.getenv("VERCEL") else "true").lower() in ("1", "true", "yes")
+# الفحص الدوري يلتقط إعادة المحاولات المؤجلة والإشعارات التي استقبلتها عمليات أخرى
+PAYMENT_WORKER_POLL_SECONDS = float(os.getenv("PAYMENT_WORKER_POLL_SECONDS", 5))
+
+
+class PaymentWorker:
+    def __init__(self, poll_seconds: float = PAYMENT_WORKER_POLL_SECONDS):
+        self.poll_seconds = poll_seconds
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.batches = 0
+        self.totals = {"processed": 0, "ignored": 0, "retried": 0, "failed": 0}
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def wake(self) -> None:
+        """يُستدعى بعد حفظ إشعار جديد. آمنة للاستدعاء من أي خيط."""
+        if not self.running or self._loop is None:
+            return
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        if running_loop is self._loop:
+            self._wakeup.set()
+        else:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def _drain(self) -> None:
+        from . import crud
+
+        while True:
+            async with session_scope() as db:
+                result = await run_db(db, crud.process_payment_events)
+            if not result["batch"]:
+                return
+            self.batches += 1
+            for key in self.totals:
+                self.totals[key] += result[key]
+            if result["batch"] < crud.PAYMENT_BATCH_SIZE:
+                return
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            try:
+                await self._drain()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Payment worker error: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def stats(self) -> dict:
+        return {"running": self.running, "batches": self.batches, **self.totals}
+
+
+payment_worker = PaymentWorker()
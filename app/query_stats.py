@@ -0,0 +1,87 @@
+# app/query_stats.py
+# عدد استعلامات SQL لكل طلب HTTP مجمّعاً حسب المسار، لمقارنة كلفة المسارات
+# (مثلاً قبل وبعد DB_EXPIRE_ON_COMMIT=false) عبر /internal/query-counts.
+# العداد محفوظ في contextvar ينتقل مع الطلب إلى threadpool وإلى run_sync.
+import os
+import threading
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import event
+
+load_dotenv()
+
+QUERY_COUNT_ENABLED = os.getenv("QUERY_COUNT_ENABLED", "true").lower() in ("1", "true", "yes")
+
+
+class _RequestCounter:
+    __slots__ = ("count",)
+
+    def __init__(self):
+        self.count = 0
+
+
+_current: ContextVar[Optional[_RequestCounter]] = ContextVar("query_counter", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    counter = _current.get()
+    if counter is not None:
+        counter.count += 1
+
+
+def instrument(engine) -> None:
+    """تسجيل المستمع على محرك متزامن (أو sync_engine للمحرك غير المتزامن)."""
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+
+
+class QueryStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints: Dict[str, dict] = {}
+
+    def record(self, endpoint: str, queries: int) -> None:
+        with self._lock:
+            entry = self._endpoints.get(endpoint)
+            if entry is None:
+                entry = self._endpoints[endpoint] = {"requests": 0, "queries": 0, "max": 0}
+            entry["requests"] += 1
+            entry["queries"] += queries
+            entry["max"] = max(entry["max"], queries)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._endpoints.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                endpoint: {**entry, "avg": round(entry["queries"] / entry["requests"], 2)}
+                for endpoint, entry in sorted(self._endpoints.items())
+            }
+
+
+query_stats = QueryStats()
+
+
+class QueryCountMiddleware:
+    """ASGI middleware: عداد جديد لكل طلب HTTP ثم تسجيله باسم المسار (قالب المسار وليس القيم)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not QUERY_COUNT_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        counter = _RequestCounter()
+        token = _current.set(counter)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _current.reset(token)
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "<unmatched>"
+            query_stats.record(f"{scope['method']} {path}", counter.count)
@@ -0,0 +1,114 @@
+# app/rollover.py
+# ترحيل المهام اليومي حسب المنطقة الزمنية لكل مستخدم.
+# يُشغَّل دورياً (مثلاً كل 15 دقيقة عبر cron): في كل تشغيل يُعالج فقط المستخدمين
+# الذين تجاوزوا منتصف الليل المحلي منذ آخر ترحيل، فتتوزع الكتابات على مدار اليوم.
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, asdict
+from datetime import date, datetime, time, timezone
+from typing import Callable, List, Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from sqlalchemy import or_, update
+from sqlalchemy.orm import Session
+
+from . import crud, models
+from .database import SessionLocal
+
+ROLLOVER_CONCURRENCY = int(os.getenv("ROLLOVER_CONCURRENCY", 4))
+ROLLOVER_SHARD_SIZE = int(os.getenv("ROLLOVER_SHARD_SIZE", 500))
+
+
+@dataclass
+class Shard:
+    timezone: str
+    local_date: date
+    # منتصف الليل المحلي بتوقيت UTC (بدون tzinfo مثل بقية الأعمدة)
+    cutoff: datetime
+    user_ids: List[int]
+
+
+@dataclass
+class ShardReport:
+    timezone: str
+    local_date: date
+    users: int
+    tasks: int
+    dry_run: bool
+
+
+def _zone(name: str) -> ZoneInfo:
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        return ZoneInfo("UTC")
+
+
+def plan_shards(db: Session, now: Optional[datetime] = None, shard_size: int = ROLLOVER_SHARD_SIZE) -> List[Shard]:
+    """تقسيم المستخدمين المستحقين للترحيل إلى دفعات حسب المنطقة الزمنية."""
+    now = now or datetime.now(timezone.utc)
+    shards: List[Shard] = []
+    timezones = [row[0] for row in db.query(models.User.timezone).distinct()]
+    for tz_name in timezones:
+        zone = _zone(tz_name)
+        local_date = now.astimezone(zone).date()
+        cutoff = datetime.combine(local_date, time.min, tzinfo=zone).astimezone(timezone.utc).replace(tzinfo=None)
+
+        user_ids = [
+            row[0] for row in db.query(models.User.id).filter(
+                models.User.timezone == tz_name,
+                or_(models.User.last_rollover_date.is_(None), models.User.last_rollover_date < local_date),
+            ).order_by(models.User.id)
+        ]
+        for start in range(0, len(user_ids), shard_size):
+            shards.append(Shard(tz_name, local_date, cutoff, user_ids[start:start + shard_size]))
+    return shards
+
+
+def _run_shard(shard: Shard, dry_run: bool, batch_size: int) -> ShardReport:
+    # كل دفعة تستخدم جلسة مستقلة لأنها قد تعمل في خيط منفصل
+    with SessionLocal() as db:
+        if dry_run:
+            tasks = crud.count_rollover_tasks(db, owner_ids=shard.user_ids, created_before=shard.cutoff)
+        else:
+            result = crud.end_of_day_cleanup(
+                db,
+                batch_size=batch_size,
+                owner_ids=shard.user_ids,
+                created_before=shard.cutoff,
+            )
+            tasks = result["updated"]
+            db.execute(
+                update(models.User)
+                .where(models.User.id.in_(shard.user_ids))
+                .values(last_rollover_date=shard.local_date)
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+    return ShardReport(shard.timezone, shard.local_date, len(shard.user_ids), tasks, dry_run)
+
+
+def run_rollover(
+    now: Optional[datetime] = None,
+    concurrency: int = ROLLOVER_CONCURRENCY,
+    shard_size: int = ROLLOVER_SHARD_SIZE,
+    batch_size: int = crud.CLEANUP_BATCH_SIZE,
+    dry_run: bool = False,
+    on_shard: Optional[Callable[[ShardReport], None]] = None,
+) -> List[dict]:
+    """
+    تنفيذ الترحيل للمستخدمين الذين حلّ منتصف الليل المحلي لديهم.
+    dry_run=True يعيد عدد المهام التي ستتأثر في كل دفعة دون أي كتابة.
+    """
+    with SessionLocal() as db:
+        shards = plan_shards(db, now=now, shard_size=shard_size)
+
+    reports: List[dict] = []
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        futures = [executor.submit(_run_shard, shard, dry_run, batch_size) for shard in shards]
+        for future in futures:
+            report = future.result()
+            if on_shard:
+                on_shard(report)
+            reports.append(asdict(report))
+    return reports
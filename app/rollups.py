@@ -0,0 +1,72 @@
+# app/rollups.py
+from typing import List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+# تجميع جدول tasks الخام بنفس مفاتيح task_stats_rollups (user_id, month, category)
+_RAW_AGGREGATE_SQL = """
+    SELECT owner_id AS user_id,
+           date_trunc('month', created_at)::date AS month,
+           coalesce(category, '') AS category,
+           count(*) AS total_count,
+           sum(CASE WHEN completed THEN 1 ELSE 0 END) AS completed_count,
+           coalesce(sum(estimated_hours), 0) AS estimated_hours
+    FROM tasks
+    WHERE owner_id IS NOT NULL AND created_at IS NOT NULL
+      AND (CAST(:user_id AS INTEGER) IS NULL OR owner_id = :user_id)
+    GROUP BY 1, 2, 3
+"""
+
+
+def rebuild_rollups(db: Session, user_id: Optional[int] = None) -> int:
+    """إعادة بناء الملخص من جدول tasks (لكل المستخدمين أو لمستخدم واحد). يعيد عدد الصفوف."""
+    # القفل ينتظر المعاملات الجارية ويؤجل الجديدة حتى تُطبق تغييراتها فوق الملخص المعاد بناؤه
+    db.execute(text("LOCK TABLE task_stats_rollups IN EXCLUSIVE MODE"))
+    db.execute(
+        text("DELETE FROM task_stats_rollups WHERE CAST(:user_id AS INTEGER) IS NULL OR user_id = :user_id"),
+        {"user_id": user_id},
+    )
+    result = db.execute(
+        text(
+            "INSERT INTO task_stats_rollups "
+            "(user_id, month, category, total_count, completed_count, estimated_hours) "
+            + _RAW_AGGREGATE_SQL
+        ),
+        {"user_id": user_id},
+    )
+    db.commit()
+    return result.rowcount
+
+
+def check_rollups(db: Session, user_id: Optional[int] = None, tolerance: float = 1e-6) -> List[dict]:
+    """مقارنة الملخص مع جدول tasks الخام؛ يعيد قائمة بالصفوف المختلفة (فارغة عند التطابق)."""
+    rows = db.execute(
+        text(
+            f"""
+            WITH raw AS ({_RAW_AGGREGATE_SQL}),
+            rollup AS (
+                SELECT * FROM task_stats_rollups
+                WHERE CAST(:user_id AS INTEGER) IS NULL OR user_id = :user_id
+            )
+            SELECT coalesce(raw.user_id, rollup.user_id) AS user_id,
+                   coalesce(raw.month, rollup.month) AS month,
+                   coalesce(raw.category, rollup.category) AS category,
+                   coalesce(raw.total_count, 0) AS expected_total,
+                   coalesce(rollup.total_count, 0) AS actual_total,
+                   coalesce(raw.completed_count, 0) AS expected_completed,
+                   coalesce(rollup.completed_count, 0) AS actual_completed,
+                   coalesce(raw.estimated_hours, 0) AS expected_hours,
+                   coalesce(rollup.estimated_hours, 0) AS actual_hours
+            FROM raw
+            FULL OUTER JOIN rollup
+              ON raw.user_id = rollup.user_id AND raw.month = rollup.month AND raw.category = rollup.category
+            WHERE coalesce(raw.total_count, 0) <> coalesce(rollup.total_count, 0)
+               OR coalesce(raw.completed_count, 0) <> coalesce(rollup.completed_count, 0)
+               OR abs(coalesce(raw.estimated_hours, 0) - coalesce(rollup.estimated_hours, 0)) > :tolerance
+            ORDER BY 1, 2, 3
+            """
+        ),
+        {"user_id": user_id, "tolerance": tolerance},
+    )
+    return [dict(row._mapping) for row in rows]
@@ -2,12 +2,21 @@
 
 import os
 import json
+import time
+import asyncio
 from typing import List, Optional
-from fastapi import APIRouter, HTTPException, Depends
-from pydantic import BaseModel, Field
+from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field, ValidationError
 import httpx # <--- استخدام مكتبة httpx غير المتزامنة
 from dotenv import load_dotenv
 
+from ..http_clients import http_clients
+from ..ai_cache import ai_cache
+from ..json_stream import JSONArrayStreamParser
+from ..upstream import RETRYABLE_STATUS, Upstream, ai_budget, gemini_batch_upstream, gemini_upstream
+from ..dependencies import get_rate_limit_key
+
 # لضمان تحميل مفتاح API
 load_dotenv()
 
@@ -38,7 +47,10 @@ if not GEMINI_API_KEY:
     # يجب أن يكون هذا المفتاح موجوداً في ملف .env
     print("WARNING: GEMINI_API_KEY is not set.")
 
-GEMINI_API_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash:generateContent"
+# يمكن توجيهه إلى خادم محلي بديل أثناء التطوير والاختبار
+GEMINI_API_BASE = os.getenv("GEMINI_API_BASE", "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash")
+GEMINI_API_URL = f"{GEMINI_API_BASE}:generateContent"
+GEMINI_STREAM_URL = f"{GEMINI_API_BASE}:streamGenerateContent"
 
 # --- وظائف تحليل الرد ---
 
@@ -68,40 +80,375 @@ def parse_gemini_response(result: dict) -> List[GeminiTaskAnalysis]:
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"An unknown error occurred during parsing: {e}")
 
+# --- قالب الطلب ---
+
+# يجب رفع الإصدار عند أي تعديل على القالب حتى لا تُعاد نتائج مخزنة بالقالب القديم
+PROMPT_VERSION = "1"
+
+PROMPT_TEMPLATE = (
+    "Analyze the following user input and return a JSON array of tasks. "
+    "The response must be *only* a JSON array (no markdown, no backticks, no extra text). "
+    "Respond in the same language as the user's input. "
+    "Each task must strictly adhere to the following JSON keys and types: name(str), description(str), "
+    "type(str: urgent|important|routine|other), scheduledFor(str: today|tomorrow|week|month), "
+    "classification(str), and estimatedHours(float). "
+    "User input to analyze:\n{text}"
+)
+
+
+def build_prompt(text: str) -> str:
+    return PROMPT_TEMPLATE.format(text=text)
+
+
+async def _generate(prompt: str, upstream: Optional[Upstream] = None) -> list:
+    """استدعاء generateContent وإرجاع JSON المستخلص من النص (بسياسة gemini_upstream افتراضياً)."""
+    upstream = upstream or gemini_upstream
+    prompt_tokens = estimate_tokens(prompt)
+    # مهلة httpx لكل طلب تتبع مهلة محاولة السياسة بدلاً من مهلة العميل المشترك الثابتة
+    attempt_timeout, _ = upstream.timeouts(prompt_tokens)
+    payload = {
+        "contents": [{"parts": [{"text": prompt}]}]
+    }
+    print("Gemini payload:", payload)
+    
+    # العميل المشترك يعيد استخدام اتصال مفتوح مع Google بدلاً من مصافحة جديدة في كل طلب
+    client = http_clients.get("gemini")
+
+    async def send() -> httpx.Response:
+        try:
+            return await client.post(
+                GEMINI_API_URL, 
+                json=payload,
+                params={"key": GEMINI_API_KEY},
+                timeout=httpx.Timeout(attempt_timeout, connect=client.timeout.connect),
+            )
+        except httpx.TransportError:
+            http_clients.record_error("gemini")
+            raise
+
+    # إعادة المحاولة / التحوّط / قاطع الدائرة؛ يرفع HTTPException (502/503/504) عند الفشل
+    response = await upstream.call(send, prompt_tokens=prompt_tokens)
+    try:
+        response.raise_for_status() # إلقاء خطأ لطلبات HTTP الفاشلة (4xx)
+    except httpx.HTTPStatusError as e:
+        print("Gemini API error response:", response.text)
+        raise HTTPException(status_code=502, detail=f"Gemini rejected the request ({response.status_code}).")
+
+    return parse_gemini_response(response.json())
+
+
+def _validate_tasks(items) -> List[dict]:
+    # التحقق قبل التخزين حتى لا تُخزن نتيجة غير صالحة
+    if not isinstance(items, list):
+        items = [items]
+    try:
+        tasks = [GeminiTaskAnalysis.model_validate(item) for item in items]
+    except ValidationError as e:
+        raise HTTPException(status_code=500, detail=f"Gemini returned tasks in an unexpected shape: {e}")
+    return [task.model_dump() for task in tasks]
+
+
+async def _call_gemini(text: str) -> List[dict]:
+    return _validate_tasks(await _generate(build_prompt(text)))
+
 # --- المسار الرئيسي ---
 
 @router.post('/gemini/analyze-tasks', response_model=List[GeminiTaskAnalysis])
-async def analyze_tasks(req: TaskAnalysisRequest):
+async def analyze_tasks(req: TaskAnalysisRequest, budget_key: str = Depends(get_rate_limit_key)):
     if not GEMINI_API_KEY:
         raise HTTPException(status_code=503, detail="Gemini API key is missing from server configuration.")
-        
-    prompt = (
-        "Analyze the following user input and return a JSON array of tasks. "
-        "The response must be *only* a JSON array (no markdown, no backticks, no extra text). "
-        "Respond in the same language as the user's input. "
-        "Each task must strictly adhere to the following JSON keys and types: name(str), description(str), "
-        "type(str: urgent|important|routine|other), scheduledFor(str: today|tomorrow|week|month), "
-        "classification(str), and estimatedHours(float). "
-        f"User input to analyze:\n{req.text}"
-    )
-    
+
+    # النصوص المتطابقة (بعد التوحيد) تُخدم من الذاكرة، والطلبات المتزامنة تشترك في استدعاء واحد
+    key = ai_cache.key(req.text, PROMPT_VERSION)
+    cached = await ai_cache.aget(key)
+    if cached is not None:
+        return cached
+    # الميزانية تُحتسب فقط على الطلبات التي قد تصل إلى Gemini
+    ai_budget.check(budget_key)
+    return await ai_cache.get_or_compute(key, lambda: _call_gemini(req.text))
+
+
+# --- الوضع المتدفق ---
+
+def _candidate_text(chunk: dict) -> str:
+    parts = (chunk.get("candidates") or [{}])[0].get("content", {}).get("parts") or []
+    return "".join(part.get("text", "") for part in parts)
+
+
+async def _stream_gemini(text: str):
+    """
+    يقرأ streamGenerateContent (SSE) ويعيد ("task", dict) لكل مهمة بمجرد اكتمال كائنها،
+    أو ("error", رسالة) للكائنات غير الصالحة.
+    """
     payload = {
-        "contents": [{"parts": [{"text": prompt}]}]
+        "contents": [{"parts": [{"text": build_prompt(text)}]}]
     }
-    print("Gemini payload:", payload)
-    
-    # استخدام httpx غير المتزامن
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        response = await client.post(
-            GEMINI_API_URL, 
+    parser = JSONArrayStreamParser()
+    client = http_clients.get("gemini")
+    # البث لا يُعاد بعد بدئه، لكنه يحترم قاطع الدائرة ويغذيه بالنتيجة
+    gemini_upstream.ensure_available()
+    try:
+        async with client.stream(
+            "POST",
+            GEMINI_STREAM_URL,
             json=payload,
-            params={"key": GEMINI_API_KEY}
-        )
+            params={"key": GEMINI_API_KEY, "alt": "sse"},
+        ) as response:
+            if response.status_code in RETRYABLE_STATUS:
+                gemini_upstream.breaker.record_failure()
+            else:
+                gemini_upstream.breaker.record_success()
+            if response.is_error:
+                await response.aread()
+                print("Gemini API error response:", response.text)
+                response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                try:
+                    fragment = _candidate_text(json.loads(line[5:].strip()))
+                    items = parser.feed(fragment)
+                except json.JSONDecodeError:
+                    yield "error", "Gemini did not return valid JSON."
+                    return
+                for item in items:
+                    try:
+                        yield "task", GeminiTaskAnalysis.model_validate(item).model_dump()
+                    except ValidationError as e:
+                        yield "error", f"Invalid task skipped: {e.errors()[0]['msg']}"
+        if not parser.complete:
+            yield "error", "Gemini response ended before the JSON array was closed."
+    except httpx.TransportError:
+        http_clients.record_error("gemini")
+        gemini_upstream.breaker.record_failure()
+        raise
+
+
+def _format_event(event: str, data: dict, fmt: str) -> str:
+    body = json.dumps(data, ensure_ascii=False)
+    if fmt == "sse":
+        return f"event: {event}\ndata: {body}\n\n"
+    return json.dumps({"type": event, **data}, ensure_ascii=False) + "\n"
+
+
+@router.post('/gemini/analyze-tasks/stream')
+async def analyze_tasks_stream(
+    req: TaskAnalysisRequest,
+    format: str = Query("ndjson", pattern="^(ndjson|sse)$"),
+    budget_key: str = Depends(get_rate_limit_key),
+):
+    """
+    نفس analyze-tasks لكن كل مهمة تُرسل فور اكتمالها (NDJSON أو SSE)،
+    فيرى المستخدم أول مهمة قبل انتهاء توليد الرد كاملاً.
+    """
+    if not GEMINI_API_KEY:
+        raise HTTPException(status_code=503, detail="Gemini API key is missing from server configuration.")
+
+    key = ai_cache.key(req.text, PROMPT_VERSION)
+    cached = await ai_cache.aget(key)
+    if cached is None:
+        ai_budget.check(budget_key)
+
+    async def events():
+        if cached is not None:
+            for item in cached:
+                yield _format_event("task", {"task": item}, format)
+            yield _format_event("done", {"count": len(cached), "cached": True}, format)
+            return
+
+        tasks: List[dict] = []
+        failed = False
         try:
-            response.raise_for_status() # إلقاء خطأ لطلبات HTTP الفاشلة (4xx, 5xx)
-        except httpx.HTTPStatusError as e:
-            print("Gemini API error response:", response.text)
-            raise
+            async for kind, value in _stream_gemini(req.text):
+                if kind == "task":
+                    tasks.append(value)
+                    yield _format_event("task", {"task": value}, format)
+                else:
+                    failed = True
+                    yield _format_event("error", {"detail": value}, format)
+        except httpx.HTTPError as e:
+            yield _format_event("error", {"detail": f"Gemini request failed: {e}"}, format)
+            return
+        except HTTPException as e:
+            yield _format_event("error", {"detail": e.detail}, format)
+            return
+        # تخزين النتيجة الكاملة فقط حتى يستفيد منها المسار غير المتدفق أيضاً
+        if not failed:
+            await ai_cache.aset(key, tasks)
+        yield _format_event("done", {"count": len(tasks), "cached": False}, format)
+
+    media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    return StreamingResponse(events(), media_type=media_type, headers={"Cache-Control": "no-cache"})
+
+
+# --- التحليل الدفعي ---
+
+AI_BATCH_MAX_ITEMS = int(os.getenv("AI_BATCH_MAX_ITEMS", 100))
+# الحد الأقصى لعدد الاستدعاءات المتزامنة إلى Gemini لكل دفعة
+AI_BATCH_CONCURRENCY = int(os.getenv("AI_BATCH_CONCURRENCY", 4))
+# ميزانية الرموز (tokens) للنصوص المجمعة في prompt واحد، وعدد النصوص الأقصى فيه
+AI_BATCH_TOKEN_BUDGET = int(os.getenv("AI_BATCH_TOKEN_BUDGET", 4000))
+AI_BATCH_MAX_TEXTS_PER_PROMPT = int(os.getenv("AI_BATCH_MAX_TEXTS_PER_PROMPT", 10))
+
+BATCH_PROMPT_TEMPLATE = (
+    "Analyze each of the following numbered user inputs independently and extract its tasks. "
+    "The response must be *only* a JSON array (no markdown, no backticks, no extra text) containing "
+    "exactly one object per input: {{\"index\": <input number>, \"tasks\": [<tasks>]}}. "
+    "Respond in the same language as each input. "
+    "Each task must strictly adhere to the following JSON keys and types: name(str), description(str), "
+    "type(str: urgent|important|routine|other), scheduledFor(str: today|tomorrow|week|month), "
+    "classification(str), and estimatedHours(float). "
+    "Inputs to analyze:\n{inputs}"
+)
+
+
+class BatchAnalysisRequest(BaseModel):
+    texts: List[str] = Field(..., min_length=1, description="النصوص المراد تحليلها")
+
+
+class BatchItemResult(BaseModel):
+    index: int
+    tasks: Optional[List[GeminiTaskAnalysis]] = None
+    error: Optional[str] = None
+    cached: bool = False
+
+
+class BatchStats(BaseModel):
+    items: int
+    cached: int
+    failed: int
+    upstream_calls: int
+    packed_prompts: int
+    elapsed_seconds: float
+    items_per_second: float
+
+
+class BatchAnalysisResponse(BaseModel):
+    results: List[BatchItemResult]
+    stats: BatchStats
 
-    result = response.json()
-    return parse_gemini_response(result)
+
+def estimate_tokens(text: str) -> int:
+    # تقدير تقريبي: ~4 أحرف لكل رمز
+    return len(text) // 4 + 1
+
+
+def pack_texts(indexed: List[tuple], budget: int = AI_BATCH_TOKEN_BUDGET, max_texts: int = AI_BATCH_MAX_TEXTS_PER_PROMPT) -> List[List[tuple]]:
+    """تجميع (index, text) في أقل عدد من المجموعات ضمن ميزانية الرموز (الأكبر أولاً)."""
+    groups: List[List[tuple]] = []
+    sizes: List[int] = []
+    for item in sorted(indexed, key=lambda pair: estimate_tokens(pair[1]), reverse=True):
+        cost = estimate_tokens(item[1])
+        for position, group in enumerate(groups):
+            if sizes[position] + cost <= budget and len(group) < max_texts:
+                group.append(item)
+                sizes[position] += cost
+                break
+        else:
+            groups.append([item])
+            sizes.append(cost)
+    return groups
+
+
+def _error_detail(error: Exception) -> str:
+    if isinstance(error, HTTPException):
+        return str(error.detail)
+    return f"Gemini request failed: {error}"
+
+
+@router.post('/gemini/analyze-tasks/batch', response_model=BatchAnalysisResponse)
+async def analyze_tasks_batch(req: BatchAnalysisRequest, budget_key: str = Depends(get_rate_limit_key)):
+    """
+    تحليل عدة نصوص في طلب واحد: النصوص القصيرة تُجمع في prompt واحد حسب ميزانية الرموز،
+    والمجموعات تُرسل بالتوازي بحد AI_BATCH_CONCURRENCY. النتيجة لكل نص على حدة (مهام أو خطأ).
+    """
+    if not GEMINI_API_KEY:
+        raise HTTPException(status_code=503, detail="Gemini API key is missing from server configuration.")
+    if len(req.texts) > AI_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {AI_BATCH_MAX_ITEMS} texts per batch.")
+
+    started = time.perf_counter()
+    results: dict = {}
+    upstream_calls = 0
+    packed_prompts = 0
+    keys = [ai_cache.key(text, PROMPT_VERSION) for text in req.texts]
+
+    pending: List[tuple] = []
+    for index, text in enumerate(req.texts):
+        cached = await ai_cache.aget(keys[index])
+        if cached is not None:
+            results[index] = BatchItemResult(index=index, tasks=cached, cached=True)
+        else:
+            pending.append((index, text))
+
+    semaphore = asyncio.Semaphore(max(1, AI_BATCH_CONCURRENCY))
+
+    async def run_single(index: int, text: str):
+        async def compute():
+            nonlocal upstream_calls
+            upstream_calls += 1
+            return await _call_gemini(text)
+
+        async with semaphore:
+            try:
+                tasks = await ai_cache.get_or_compute(keys[index], compute)
+                results[index] = BatchItemResult(index=index, tasks=tasks)
+            except (HTTPException, httpx.HTTPError) as e:
+                results[index] = BatchItemResult(index=index, error=_error_detail(e))
+
+    async def run_group(group: List[tuple]):
+        nonlocal upstream_calls, packed_prompts
+        # الترقيم داخل الـ prompt محلي للمجموعة
+        inputs = "\n\n".join(f"Input {number}:\n{text}" for number, (_, text) in enumerate(group))
+        async with semaphore:
+            upstream_calls += 1
+            packed_prompts += 1
+            try:
+                # prompt مجمع طويل: سياسة الدفعات بمهلة تتناسب مع حجمه (GEMINI_BATCH_*)
+                answers = await _generate(BATCH_PROMPT_TEMPLATE.format(inputs=inputs), gemini_batch_upstream)
+            except (HTTPException, httpx.HTTPError) as e:
+                for index, _ in group:
+                    results[index] = BatchItemResult(index=index, error=_error_detail(e))
+                return
+
+        by_number = {}
+        for answer in answers:
+            if isinstance(answer, dict) and isinstance(answer.get("index"), int):
+                by_number[answer["index"]] = answer.get("tasks")
+        for number, (index, _) in enumerate(group):
+            if number not in by_number:
+                results[index] = BatchItemResult(index=index, error="Missing from Gemini batch response.")
+                continue
+            try:
+                tasks = _validate_tasks(by_number[number])
+            except HTTPException as e:
+                results[index] = BatchItemResult(index=index, error=_error_detail(e))
+                continue
+            await ai_cache.aset(keys[index], tasks)
+            results[index] = BatchItemResult(index=index, tasks=tasks)
+
+    groups = pack_texts(pending)
+    if groups:
+        # كل prompt مرسل يُحتسب من الميزانية (النتائج المخزنة مجانية)
+        ai_budget.check(budget_key, cost=len(groups))
+
+    jobs = []
+    for group in groups:
+        if len(group) == 1:
+            jobs.append(run_single(*group[0]))
+        else:
+            jobs.append(run_group(group))
+    await asyncio.gather(*jobs)
+
+    elapsed = time.perf_counter() - started
+    ordered = [results[index] for index in range(len(req.texts))]
+    stats = BatchStats(
+        items=len(ordered),
+        cached=sum(1 for item in ordered if item.cached),
+        failed=sum(1 for item in ordered if item.error),
+        upstream_calls=upstream_calls,
+        packed_prompts=packed_prompts,
+        elapsed_seconds=round(elapsed, 3),
+        items_per_second=round(len(ordered) / elapsed, 2) if elapsed > 0 else 0.0,
+    )
+    return BatchAnalysisResponse(results=ordered, stats=stats)
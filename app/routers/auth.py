@@ -1,80 +1,113 @@
 # app/routers/auth.py
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
 from typing import Annotated
 from fastapi.security import OAuth2PasswordRequestForm
-from ..database import get_db
-from ..auth_utils import create_access_token, verify_password, get_password_hash
+from ..database import DBSession, get_session, run_db
+from ..auth_utils import (
+    create_user_access_token,
+    get_password_hash_async,
+    verify_and_update_password_async,
+    verify_password_async,
+)
 from .. import crud, schemas
 from ..dependencies import ActiveUser
-from sqlalchemy.orm import Session
-from ..database import get_db
 
 router = APIRouter(
     prefix="/auth",
     tags=["المصادقة (Auth)"],
 )
 
+# ملاحظة: تجزئة كلمات المرور تُنفَّذ في عمليات منفصلة دون حجز threadpool المشترك مع بقية المسارات.
+
 @router.post("/signup", response_model=schemas.UserRead, status_code=status.HTTP_201_CREATED)
-def signup(
-    user: schemas.UserCreate, 
-    db: Session = Depends(get_db)
+async def signup(
+    user: schemas.UserCreate,
+    db: DBSession = Depends(get_session)
 ):
     """إنشاء حساب مستخدم جديد"""
-    db_user = crud.get_user_by_email(db, email=user.email)
+    db_user = await run_db(db, crud.get_user_by_email, user.email)
     if db_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="البريد الإلكتروني مستخدم بالفعل",
         )
-    return crud.create_user(db=db, user=user)
+    hashed_password = await get_password_hash_async(user.password)
+    return await run_db(db, crud.create_user, user, hashed_password)
 
 @router.post("/token", response_model=schemas.Token)
-def login_for_access_token(
-    form_data: Annotated[OAuth2PasswordRequestForm, Depends()], 
-    db: Session = Depends(get_db) 
+async def login_for_access_token(
+    form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
+    db: DBSession = Depends(get_session)
 ):
     """تسجيل دخول المستخدم وإصدار رمز JWT"""
-    
+
     # form_data هو الوسيط الأول لأنه لا يحمل قيمة افتراضية مباشرة
-    user = crud.get_user_by_email(db, email=form_data.username)
-    
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    user = await run_db(db, crud.get_user_by_email, form_data.username)
+
+    valid, new_hash = (False, None)
+    if user:
+        valid, new_hash = await verify_and_update_password_async(form_data.password, user.hashed_password)
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="بيانات الاعتماد غير صحيحة",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    
-    access_token = create_access_token(
-        data={"email": user.email, "user_id": user.id}
-    )
-    
+
+    access_token = create_user_access_token(user)
+
+    # تغيّر عدد جولات PBKDF2 المضبوط: حفظ التجزئة الجديدة
+    if new_hash:
+        await run_db(db, crud.update_password_hash, user, new_hash)
+
     return schemas.Token(access_token=access_token, token_type="bearer")
 
 
 
+@router.post("/refresh", response_model=schemas.Token)
+async def refresh_access_token(
+    db: DBSession = Depends(get_session),
+    current_user: schemas.UserRead = Depends(ActiveUser)
+):
+    """إعادة إصدار التوكن بالحقول الحالية (بعد تفعيل الاشتراك مثلاً) دون إعادة تسجيل الدخول"""
+    user = await run_db(db, crud.get_user_by_id, current_user.id)
+    if not user:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="المستخدم غير موجود")
+    return schemas.Token(access_token=create_user_access_token(user), token_type="bearer")
+
+
 @router.get("/me", response_model=schemas.UserRead)
-def read_current_user(current_user: schemas.UserRead = Depends(ActiveUser)):
+async def read_current_user(current_user: schemas.UserRead = Depends(ActiveUser)):
     """Return current authenticated user's profile"""
     return current_user
 
+@router.put("/me/timezone", response_model=schemas.UserRead)
+async def update_timezone(
+    payload: schemas.TimezoneUpdate,
+    db: DBSession = Depends(get_session),
+    current_user: schemas.UserRead = Depends(ActiveUser)
+):
+    """تحديث المنطقة الزمنية للمستخدم (تحدد موعد ترحيل المهام اليومي)"""
+    user = await run_db(db, crud.get_user_by_email, current_user.email)
+    if not user:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="المستخدم غير موجود")
+    return await run_db(db, crud.update_timezone, user, payload.timezone)
+
 @router.post("/change-password", status_code=status.HTTP_200_OK)
-def change_password(
+async def change_password(
     passwords: schemas.PasswordChange,
-    db: Session = Depends(get_db),
+    db: DBSession = Depends(get_session),
     current_user: schemas.UserRead = Depends(ActiveUser)
 ):
     """تغيير كلمة مرور المستخدم الحالي"""
-    user = crud.get_user_by_email(db, email=current_user.email)
-    if not user or not verify_password(passwords.old_password, user.hashed_password):
+    user = await run_db(db, crud.get_user_by_email, current_user.email)
+    if not user or not await verify_password_async(passwords.old_password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="كلمة المرور القديمة غير صحيحة",
         )
-    
-    hashed_password = get_password_hash(passwords.new_password)
-    user.hashed_password = hashed_password
-    db.commit()
-    
-    return {"message": "تم تغيير كلمة المرور بنجاح"}
\ No newline at end of file
+
+    hashed_password = await get_password_hash_async(passwords.new_password)
+    await run_db(db, crud.change_password, user, hashed_password)
+
+    return {"message": "تم تغيير كلمة المرور بنجاح"}
@@ -1,11 +1,11 @@
 # app/routers/habits.py
-from fastapi import APIRouter, Depends, HTTPException, status
-from typing import List
-from sqlalchemy.orm import Session 
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from typing import Any, Dict, List, Optional
 
-from .. import crud, schemas
-from ..database import get_db
-from ..dependencies import ActiveUser
+from .. import bulk, crud, schemas
+from ..database import DBSession, get_session, run_db
+from ..pagination import NEXT_CURSOR_HEADER, decode_cursor, next_cursor
+from ..dependencies import ClaimsUser
 
 router = APIRouter(
     prefix="/habits",
@@ -14,45 +14,84 @@ router = APIRouter(
 )
 
 @router.post("/", response_model=schemas.HabitRead, status_code=status.HTTP_201_CREATED)
-def create_habit(
+async def create_habit(
     habit: schemas.HabitCreate, 
-    db: Session = Depends(get_db),
-    current_user: schemas.UserRead = Depends(ActiveUser),
+    db: DBSession = Depends(get_session),
+    current_user: schemas.UserRead = Depends(ClaimsUser),
 ):
     """إنشاء عادة جديدة للمستخدم الحالي"""
-    return crud.create_user_habit(db=db, habit=habit, user_id=current_user.id)
+    return await run_db(db, crud.create_user_habit, habit=habit, user_id=current_user.id)
 
 @router.get("/", response_model=List[schemas.HabitRead])
-def read_habits(
+async def read_habits(
+    response: Response,
     skip: int = 0, 
     limit: int = 100, 
-    db: Session = Depends(get_db),
-    current_user: schemas.UserRead = Depends(ActiveUser),
+    cursor: Optional[str] = None,
+    db: DBSession = Depends(get_session),
+    current_user: schemas.UserRead = Depends(ClaimsUser),
 ):
     """جلب جميع عادات المستخدم الحالي"""
-    habits = crud.get_habits(db, user_id=current_user.id, skip=skip, limit=limit)
+    habits = await run_db(db, crud.get_habits, user_id=current_user.id, skip=skip, limit=limit, cursor=decode_cursor(cursor))
+    cursor_value = next_cursor(habits, limit)
+    if cursor_value:
+        response.headers[NEXT_CURSOR_HEADER] = cursor_value
     return habits
 
+# العمليات الجماعية (معرفة قبل مسارات /{habit_id} حتى لا تُطابق "bulk" كمعرف)
+@router.post("/bulk", response_model=schemas.BulkResult[schemas.HabitRead])
+async def bulk_create_habits(
+    items: List[Dict[str, Any]],
+    db: DBSession = Depends(get_session),
+    current_user: schemas.UserRead = Depends(ClaimsUser),
+):
+    """إنشاء عدة عناصر في معاملة واحدة؛ العناصر غير الصالحة تُعاد في errors"""
+    valid, errors = bulk.validate_items(items, schemas.HabitCreate)
+    created = await run_db(db, crud.bulk_create_habits, habits=[item for _, item in valid], user_id=current_user.id) if valid else []
+    return {"items": bulk.created_items(valid, created), "errors": errors}
+
+@router.patch("/bulk", response_model=schemas.BulkResult[schemas.HabitRead])
+async def bulk_update_habits(
+    items: List[Dict[str, Any]],
+    db: DBSession = Depends(get_session),
+    current_user: schemas.UserRead = Depends(ClaimsUser),
+):
+    """تعديل عدة عناصر (كل عنصر يحتوي id) في معاملة واحدة"""
+    valid, errors = bulk.validate_items(items, schemas.HabitUpdate, with_id=True)
+    updated, missing = await run_db(db, crud.bulk_update_habits, items=valid, user_id=current_user.id) if valid else ([], [])
+    return {"items": bulk.updated_items(updated), "errors": errors + bulk.not_found_errors(missing)}
+
+@router.delete("/bulk", response_model=schemas.BulkDeleteResult)
+async def bulk_delete_habits(
+    body: schemas.BulkDeleteRequest,
+    db: DBSession = Depends(get_session),
+    current_user: schemas.UserRead = Depends(ClaimsUser),
+):
+    """حذف عدة عناصر بعبارة DELETE واحدة"""
+    bulk.check_size(len(body.ids))
+    deleted = await run_db(db, crud.bulk_delete_habits, habit_ids=body.ids, user_id=current_user.id)
+    return {"deleted": deleted, "errors": bulk.deleted_errors(body.ids, deleted)}
+
 @router.put("/{habit_id}", response_model=schemas.HabitRead)
-def update_habit_route(
+async def update_habit_route(
     habit_id: int, 
     habit: schemas.HabitUpdate, 
-    db: Session = Depends(get_db),
-    current_user: schemas.UserRead = Depends(ActiveUser),
+    db: DBSession = Depends(get_session),
+    current_user: schemas.UserRead = Depends(ClaimsUser),
 ):
     """تعديل عادة معينة للمستخدم الحالي"""
-    db_habit = crud.update_habit(db, habit_id=habit_id, user_id=current_user.id, habit_in=habit)
+    db_habit = await run_db(db, crud.update_habit, habit_id=habit_id, user_id=current_user.id, habit_in=habit)
     if db_habit is None:
         raise HTTPException(status_code=404, detail="العادة غير موجودة")
     return db_habit
 
 @router.delete("/{habit_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_habit_route(
+async def delete_habit_route(
     habit_id: int, 
-    db: Session = Depends(get_db),
-    current_user: schemas.UserRead = Depends(ActiveUser),
+    db: DBSession = Depends(get_session),
+    current_user: schemas.UserRead = Depends(ClaimsUser),
 ):
     """حذف عادة معينة للمستخدم الحالي"""
-    if not crud.delete_habit(db, habit_id=habit_id, user_id=current_user.id):
+    if not await run_db(db, crud.delete_habit, habit_id=habit_id, user_id=current_user.id):
         raise HTTPException(status_code=404, detail="العادة غير موجودة")
     return
\ No newline at end of file
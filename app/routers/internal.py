@@ -0,0 +1,104 @@
+# app/routers/internal.py
+import os
+import hmac
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+
+from ..cache import user_cache, token_version_cache
+from ..auth_utils import token_cache
+from ..database import get_pool_status
+from ..timer_registry import active_timers
+from ..events import event_hub
+from ..timer_expiry import expiry_engine
+from ..http_clients import http_clients
+from ..ai_cache import ai_cache
+from ..upstream import ai_budget, gemini_batch_upstream, gemini_upstream
+from ..payment_worker import payment_worker
+from ..query_stats import query_stats
+from .payments import payment_link_cache, payment_link_flight
+
+# مفتاح الوصول لنقاط النهاية الداخلية (المراقبة). إذا لم يُضبط تُعطَّل هذه النقاط.
+INTERNAL_API_TOKEN = os.getenv("INTERNAL_API_TOKEN")
+
+
+def require_internal_token(x_internal_token: Optional[str] = Header(default=None)):
+    """التحقق من رأس X-Internal-Token قبل إظهار أي مقاييس داخلية."""
+    if not INTERNAL_API_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if not x_internal_token or not hmac.compare_digest(x_internal_token, INTERNAL_API_TOKEN):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
+
+
+router = APIRouter(
+    prefix="/internal",
+    tags=["Internal"],
+    dependencies=[Depends(require_internal_token)],
+    include_in_schema=False,
+)
+
+
+@router.get("/cache-stats")
+def get_cache_stats():
+    """إحصائيات الذاكرات المؤقتة الخاصة بالمصادقة (hits/misses)."""
+    return {
+        "user_cache": user_cache.stats(),
+        "token_version_cache": token_version_cache.stats(),
+        "token_cache": token_cache.stats(),
+        "active_timers": active_timers.stats(),
+        "ai_responses": ai_cache.stats(),
+    }
+
+
+@router.get("/db-pool")
+def get_db_pool_stats():
+    """حالة مجمع اتصالات قاعدة البيانات لضبط حجمه تحت الضغط."""
+    return get_pool_status()
+
+
+@router.get("/event-hub")
+def get_event_hub_stats():
+    """عدد الاتصالات المفتوحة (WebSocket / SSE) والأحداث المنشورة."""
+    return event_hub.stats()
+
+
+@router.get("/timer-expiry")
+def get_timer_expiry_stats():
+    """حالة محرك انتهاء المؤقتات: عدد المؤقتات المجدولة وأقرب موعد."""
+    return expiry_engine.stats()
+
+
+@router.get("/http-clients")
+def get_http_client_stats():
+    """إعادة استخدام الاتصالات (اتصالات جديدة مقابل الطلبات) وزمن استجابة كل خدمة خارجية."""
+    return http_clients.stats()
+
+
+@router.get("/upstreams")
+def get_upstream_stats():
+    """إعادة المحاولة والتحوّط وحالة قاطع الدائرة لـ Gemini (العادي والدفعي)، وميزانية طلبات الذكاء الاصطناعي."""
+    return {
+        "gemini": gemini_upstream.stats(),
+        "gemini_batch": gemini_batch_upstream.stats(),
+        "ai_budget": ai_budget.stats(),
+    }
+
+
+@router.get("/payment-worker")
+def get_payment_worker_stats():
+    """نتائج تطبيق إشعارات Kashier منذ بدء العملية وإصابات ذاكرة روابط الدفع."""
+    return {
+        **payment_worker.stats(),
+        "payment_links": {**payment_link_cache.stats(), **payment_link_flight.stats()},
+    }
+
+
+@router.get("/query-counts")
+def get_query_counts():
+    """عدد استعلامات SQL لكل مسار (المجموع، المتوسط، الأقصى) منذ آخر إعادة ضبط."""
+    return query_stats.stats()
+
+
+@router.delete("/query-counts", status_code=status.HTTP_204_NO_CONTENT)
+def reset_query_counts():
+    """إعادة ضبط العدادات قبل قياس جديد."""
+    query_stats.reset()
@@ -1,11 +1,11 @@
 # app/routers/notes.py
-from fastapi import APIRouter, Depends, HTTPException, status
-from typing import List
-from sqlalchemy.orm import Session 
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from typing import Any, Dict, List, Optional
 
-from .. import crud, schemas
-from ..database import get_db
-from ..dependencies import ActiveUser
+from .. import bulk, crud, schemas
+from ..database import DBSession, get_session, run_db
+from ..pagination import NEXT_CURSOR_HEADER, decode_cursor, next_cursor
+from ..dependencies import ClaimsUser
 
 router = APIRouter(
     prefix="/notes",
@@ -14,45 +14,84 @@ router = APIRouter(
 )
 
 @router.post("/", response_model=schemas.NoteRead, status_code=status.HTTP_201_CREATED)
-def create_note(
+async def create_note(
     note: schemas.NoteCreate, 
-    db: Session = Depends(get_db),
-    current_user: schemas.UserRead = Depends(ActiveUser),
+    db: DBSession = Depends(get_session),
+    current_user: schemas.UserRead = Depends(ClaimsUser),
 ):
     """إنشاء ملاحظة جديدة للمستخدم الحالي"""
-    return crud.create_user_note(db=db, note=note, user_id=current_user.id)
+    return await run_db(db, crud.create_user_note, note=note, user_id=current_user.id)
 
 @router.get("/", response_model=List[schemas.NoteRead])
-def read_notes(
+async def read_notes(
+    response: Response,
     skip: int = 0, 
     limit: int = 100, 
-    db: Session = Depends(get_db),
-    current_user: schemas.UserRead = Depends(ActiveUser),
+    cursor: Optional[str] = None,
+    db: DBSession = Depends(get_session),
+    current_user: schemas.UserRead = Depends(ClaimsUser),
 ):
     """جلب جميع ملاحظات المستخدم الحالي"""
-    notes = crud.get_notes(db, user_id=current_user.id, skip=skip, limit=limit)
+    notes = await run_db(db, crud.get_notes, user_id=current_user.id, skip=skip, limit=limit, cursor=decode_cursor(cursor))
+    cursor_value = next_cursor(notes, limit)
+    if cursor_value:
+        response.headers[NEXT_CURSOR_HEADER] = cursor_value
     return notes
 
+# العمليات الجماعية (معرفة قبل مسارات /{note_id} حتى لا تُطابق "bulk" كمعرف)
+@router.post("/bulk", response_model=schemas.BulkResult[schemas.NoteRead])
+async def bulk_create_notes(
+    items: List[Dict[str, Any]],
+    db: DBSession = Depends(get_session),
+    current_user: schemas.UserRead = Depends(ClaimsUser),
+):
+    """إنشاء عدة عناصر في معاملة واحدة؛ العناصر غير الصالحة تُعاد في errors"""
+    valid, errors = bulk.validate_items(items, schemas.NoteCreate)
+    created = await run_db(db, crud.bulk_create_notes, notes=[item for _, item in valid], user_id=current_user.id) if valid else []
+    return {"items": bulk.created_items(valid, created), "errors": errors}
+
+@router.patch("/bulk", response_model=schemas.BulkResult[schemas.NoteRead])
+async def bulk_update_notes(
+    items: List[Dict[str, Any]],
+    db: DBSession = Depends(get_session),
+    current_user: schemas.UserRead = Depends(ClaimsUser),
+):
+    """تعديل عدة عناصر (كل عنصر يحتوي id) في معاملة واحدة"""
+    valid, errors = bulk.validate_items(items, schemas.NoteUpdate, with_id=True)
+    updated, missing = await run_db(db, crud.bulk_update_notes, items=valid, user_id=current_user.id) if valid else ([], [])
+    return {"items": bulk.updated_items(updated), "errors": errors + bulk.not_found_errors(missing)}
+
+@router.delete("/bulk", response_model=schemas.BulkDeleteResult)
+async def bulk_delete_notes(
+    body: schemas.BulkDeleteRequest,
+    db: DBSession = Depends(get_session),
+    current_user: schemas.UserRead = Depends(ClaimsUser),
+):
+    """حذف عدة عناصر بعبارة DELETE واحدة"""
+    bulk.check_size(len(body.ids))
+    deleted = await run_db(db, crud.bulk_delete_notes, note_ids=body.ids, user_id=current_user.id)
+    return {"deleted": deleted, "errors": bulk.deleted_errors(body.ids, deleted)}
+
 @router.put("/{note_id}", response_model=schemas.NoteRead)
-def update_note_route(
+async def update_note_route(
     note_id: int, 
     note: schemas.NoteUpdate, 
-    db: Session = Depends(get_db),
-    current_user: schemas.UserRead = Depends(ActiveUser),
+    db: DBSession = Depends(get_session),
+    current_user: schemas.UserRead = Depends(ClaimsUser),
 ):
     """تعديل ملاحظة معينة للمستخدم الحالي"""
-    db_note = crud.update_note(db, note_id=note_id, user_id=current_user.id, note_in=note)
+    db_note = await run_db(db, crud.update_note, note_id=note_id, user_id=current_user.id, note_in=note)
     if db_note is None:
         raise HTTPException(status_code=404, detail="الملاحظة غير موجودة")
     return db_note
 
 @router.delete("/{note_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_note_route(
+async def delete_note_route(
     note_id: int, 
-    db: Session = Depends(get_db),
-    current_user: schemas.UserRead = Depends(ActiveUser),
+    db: DBSession = Depends(get_session),
+    current_user: schemas.UserRead = Depends(ClaimsUser),
 ):
     """حذف ملاحظة معينة للمستخدم الحالي"""
-    if not crud.delete_note(db, note_id=note_id, user_id=current_user.id):
+    if not await run_db(db, crud.delete_note, note_id=note_id, user_id=current_user.id):
         raise HTTPException(status_code=404, detail="الملاحظة غير موجودة")
     return
\ No newline at end of file
@@ -1,9 +1,22 @@
 # app/routers/payments.py - الكود الموحد والمصحح لاستخدام httpx
 
-from fastapi import APIRouter, HTTPException, Request, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, status
 import os
+import hmac
+import json
+import hashlib
+import uuid
+from typing import Optional
+from urllib.parse import quote, urlencode
 import httpx # مكتبة httpx غير المتزامنة لطلبات API
 
+from .. import crud, schemas
+from ..database import run_db, session_scope
+from ..dependencies import ClaimsUser, DatabaseDependency
+from ..cache import SingleFlight, TTLCache
+from ..http_clients import http_clients
+from ..payment_worker import payment_worker
+
 router = APIRouter(
     prefix="/payments",
     tags=["Payments"],
@@ -13,25 +26,88 @@ router = APIRouter(
 KASHIER_MERCHANT_ID = os.getenv("KASHIER_MERCHANT_ID")
 KASHIER_API_KEY = os.getenv("KASHIER_API_KEY")
 
+# روابط الدفع المنشأة حديثاً: النقر المزدوج أو إعادة الإرسال يعيد نفس الرابط دون طلب جديد إلى Kashier
+PAYMENT_LINK_CACHE_MAXSIZE = int(os.getenv("PAYMENT_LINK_CACHE_MAXSIZE", 10000))
+PAYMENT_LINK_CACHE_TTL_SECONDS = float(os.getenv("PAYMENT_LINK_CACHE_TTL_SECONDS", 900))
+
+payment_link_cache = TTLCache(maxsize=PAYMENT_LINK_CACHE_MAXSIZE, ttl=PAYMENT_LINK_CACHE_TTL_SECONDS)
+payment_link_flight = SingleFlight()
+
 @router.post("/kashier/create-payment-link")
-async def create_kashier_payment_link(payload: dict):
+async def create_kashier_payment_link(
+    payload: dict,
+    current_user: schemas.UserRead = Depends(ClaimsUser),
+    idempotency_key: Optional[str] = Header(default=None),
+):
     """
     نقطة نهاية لإنشاء رابط الدفع من كاشير وتحويل المستخدم إليه.
+    السعر والعملة يحددهما الخادم من الخطة (crud.PLAN_PRICES)؛ أي مبلغ يرسله العميل يُتجاهل.
+    الطلبات المكررة (نفس Idempotency-Key، أو نفس المستخدم والطلب والخطة) تعيد الرابط المخزن،
+    والطلبات المتزامنة المكررة تشترك في استدعاء واحد إلى Kashier.
     """
     # 1. التحقق من مفاتيح الخادم
     if not KASHIER_MERCHANT_ID or not KASHIER_API_KEY:
         raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE, 
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             detail="Kashier credentials are not set on server. Please check .env file."
         )
 
-    # 2. استخلاص بيانات الدفع من الواجهة الأمامية
-    amount = payload.get("amount")
-    currency = payload.get("currency", "EGP")
-    merchant_order_id = payload.get("merchant_order_id")
+    # 2. الخطة من الواجهة الأمامية، والسعر من جدول الخادم
+    if not crud.PLAN_PRICES:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Plan prices are not set on server. Please check PAYMENT_PLAN_PRICES.",
+        )
+    plan = payload.get("plan")
+    amount = crud.PLAN_PRICES.get(plan)
+    if amount is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"plan must be one of: {', '.join(sorted(crud.PLAN_PRICES))}",
+        )
+    currency = crud.PAYMENT_CURRENCY
+    user_id = current_user.id
+    requested_order_id = payload.get("merchant_order_id")
+
+    # المفاتيح دائماً ضمن مساحة المستخدم المصادق عليه، فلا يتشارك مستخدمان نفس Idempotency-Key
+    fingerprint = (user_id, str(requested_order_id or ""), plan)
+    cache_key = ("idempotency-key", user_id, idempotency_key) if idempotency_key else fingerprint
+    cached = payment_link_cache.get(cache_key)
+    if cached is not None:
+        cached_fingerprint, link = cached
+        if cached_fingerprint != fingerprint:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="Idempotency-Key was already used with a different payment.",
+            )
+        return link
+
+    async def create_link():
+        # رقم الطلب يولده الخادم إن لم يرسله العميل؛ الرقم المرسل المستخدم لحساب آخر يُرفض (409)
+        merchant_order_id = str(requested_order_id or uuid.uuid4().hex)
+        link = await _create_payment_link(user_id, plan, merchant_order_id, amount, currency)
+        payment_link_cache.set(cache_key, (fingerprint, link))
+        return link
+
+    return await payment_link_flight.do((cache_key, fingerprint), create_link)
 
-    if not all([amount, merchant_order_id]):
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="amount and merchant_order_id are required")
+
+async def _create_payment_link(user_id: int, plan: str, merchant_order_id: str, amount, currency: str) -> dict:
+    # ربط الطلب بالمستخدم والخطة والسعر حتى يعرف الـ webhook من يجب تفعيل اشتراكه وبأي مبلغ.
+    # جلسة مستقلة لأن الاستدعاء مشترك بين عدة طلبات وقد يستمر بعد انتهاء الطلب الأول
+    try:
+        async with session_scope() as db:
+            await run_db(
+                db,
+                crud.create_payment_order,
+                order_id=merchant_order_id,
+                user_id=user_id,
+                plan=plan,
+                amount=amount,
+                currency=currency,
+            )
+    except crud.PaymentOrderConflict:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="merchant_order_id is already used by another order.")
 
     # 3. إعداد الطلب إلى Kashier
     url = "https://api.kashier.io/v1/payment-requests"
@@ -43,37 +119,88 @@ async def create_kashier_payment_link(payload: dict):
 
     data = {
         "merchantId": KASHIER_MERCHANT_ID,
-        "amount": amount,
+        "amount": str(amount),
         "currency": currency,
         "orderId": merchant_order_id,
         "redirectUrl": "http://localhost:5173/dashboard", # المسار الذي يعود إليه المستخدم بعد الدفع
         "display": "ar", # استخدام اللغة العربية
     }
-    
-    # 4. إرسال الطلب بشكل غير متزامن
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        try:
-            response = await client.post(url, headers=headers, json=data)
-            response.raise_for_status()
-        except httpx.HTTPStatusError as e:
-            # معالجة الأخطاء الواردة من Kashier (مثل مفاتيح خاطئة)
-            print(f"Kashier API Error: {e.response.text}")
-            raise HTTPException(
-                status_code=e.response.status_code, 
-                detail=f"Kashier Error: {e.response.text}"
-            )
-        except Exception as e:
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to connect to Kashier: {e}")
+
+    # 4. إرسال الطلب بشكل غير متزامن عبر العميل المشترك (اتصالات keep-alive)
+    client = http_clients.get("kashier")
+    try:
+        response = await client.post(url, headers=headers, json=data)
+        response.raise_for_status()
+    except httpx.HTTPStatusError as e:
+        # معالجة الأخطاء الواردة من Kashier (مثل مفاتيح خاطئة)
+        print(f"Kashier API Error: {e.response.text}")
+        raise HTTPException(
+            status_code=e.response.status_code,
+            detail=f"Kashier Error: {e.response.text}"
+        )
+    except Exception as e:
+        http_clients.record_error("kashier")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to connect to Kashier: {e}")
 
     # 5. إعادة رابط الدفع إلى الواجهة الأمامية
     return response.json()
 
+
+def kashier_signature(data: dict, secret: str) -> str:
+    """
+    توقيع Kashier: الحقول المذكورة في signatureKeys (مرتبة أبجدياً) بصيغة query string
+    (ترميز encodeURIComponent) ثم HMAC-SHA256 بمفتاح الـ API.
+    """
+    keys = sorted(data.get("signatureKeys") or [])
+    query = urlencode([(key, "" if data.get(key) is None else str(data.get(key))) for key in keys], quote_via=quote, safe="-_.!~*'()")
+    return hmac.new(secret.encode(), query.encode(), hashlib.sha256).hexdigest()
+
+
+def _event_id(body: dict, raw: bytes) -> str:
+    data = body.get("data") or {}
+    transaction_id = data.get("transactionId") or data.get("kashierOrderId")
+    if transaction_id:
+        return f"{body.get('event', 'unknown')}:{transaction_id}"
+    # بدون معرف معاملة: بصمة الجسم تكفي لإزالة التكرار عند إعادة الإرسال
+    return "sha256:" + hashlib.sha256(raw).hexdigest()
+
+
 @router.post("/kashier/webhook")
-async def kashier_webhook(request: Request):
+async def kashier_webhook(
+    request: Request,
+    db: DatabaseDependency,
+    x_kashier_signature: Optional[str] = Header(default=None),
+):
     """
     نقطة نهاية استقبال إشعارات الـ Webhook من كاشير.
-    يجب إضافة منطق التحقق من التوقيع (HMAC verification) هنا.
+    تتحقق من التوقيع ثم تحفظ الإشعار في payment_events وترد فوراً؛
+    تفعيل الاشتراك يتم في العامل الخلفي (payment_worker).
     """
-    data = await request.json()
-    print(f"Kashier webhook received: {data}")
-    return {"status": "ok"}
+    if not KASHIER_API_KEY:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Kashier credentials are not set on server.")
+
+    raw = await request.body()
+    try:
+        body = json.loads(raw)
+    except json.JSONDecodeError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid JSON body")
+    data = body.get("data") if isinstance(body, dict) else None
+    if not isinstance(data, dict):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Missing data")
+
+    # مقارنة بزمن ثابت حتى لا يتسرب التوقيع الصحيح عبر زمن الاستجابة
+    expected = kashier_signature(data, KASHIER_API_KEY)
+    if not x_kashier_signature or not hmac.compare_digest(expected, x_kashier_signature):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid signature")
+
+    inserted = await run_db(
+        db,
+        crud.record_payment_event,
+        event_id=_event_id(body, raw),
+        event_type=body.get("event"),
+        order_id=data.get("merchantOrderId"),
+        payload=raw.decode("utf-8", errors="replace"),
+    )
+    if inserted:
+        payment_worker.wake()
+    return {"status": "ok", "duplicate": not inserted}
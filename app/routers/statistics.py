@@ -1,9 +1,8 @@
 # app/routers/statistics.py
 from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
 from .. import crud, schemas
-from ..database import get_db
-from ..dependencies import ActiveUser
+from ..database import DBSession, get_session, run_db
+from ..dependencies import ClaimsUser
 
 router = APIRouter(
     prefix="/statistics",
@@ -11,11 +10,11 @@ router = APIRouter(
 )
 
 @router.get("/", response_model=schemas.ReportStats)
-def get_report_statistics(
-    db: Session = Depends(get_db),
-    current_user: schemas.UserRead = Depends(ActiveUser),
+async def get_report_statistics(
+    db: DBSession = Depends(get_session),
+    current_user: schemas.UserRead = Depends(ClaimsUser),
 ):
     """
     جلب إحصائيات مجمعة للتقارير.
     """
-    return crud.get_user_report_stats(db=db, user_id=current_user.id)
+    return await run_db(db, crud.get_user_report_stats, user_id=current_user.id)
@@ -1,15 +1,22 @@
 # app/routers/tasks.py
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List, Optional
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import StreamingResponse
+from typing import Any, Dict, List, Optional
 from datetime import datetime
 
 # استيرادات الدعم من ملفات مشروعك
 from app import crud 
 # TaskTimerAction يجب أن تكون معرفة في schemas.py
 from app.schemas import TaskBase, TaskCreate, TaskUpdate, TaskRead, TaskTimerAction 
-from app.dependencies import get_db, get_current_user
+from app.schemas import BulkDeleteRequest, BulkDeleteResult, BulkResult
+from app import bulk
+from app.dependencies import ClaimsUser, get_current_user_from_claims
+from app.database import DBSession, get_session, run_db, session_scope
+from app.events import EVENTS_WEBSOCKET_ENABLED, event_hub
+from app.pagination import NEXT_CURSOR_HEADER, decode_cursor, next_cursor
+from app.timer_registry import active_timers
 from app.models import User
 
 router = APIRouter(
@@ -22,23 +29,117 @@ router = APIRouter(
 # ====================================================================
 
 @router.get("/active", response_model=Optional[TaskRead], status_code=status.HTTP_200_OK)
-def get_active_task_endpoint(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def get_active_task_endpoint(db: DBSession = Depends(get_session), current_user: User = Depends(ClaimsUser)):
     """
     GET /tasks/active (يحل خطأ 405)
     جلب المهمة النشطة حالياً. يعيد 404 إذا لم يتم العثور على مهمة نشطة.
     """
-    active_task = crud.get_active_task(db, user_id=current_user.id)
+    # يُخدم من سجل المؤقتات في الذاكرة؛ قاعدة البيانات فقط عند عدم وجود المستخدم في السجل
+    found, active_task = await active_timers.alookup(current_user.id)
+    if not found:
+        marker = active_timers.begin_fill(current_user.id)
+        db_task = await run_db(db, crud.get_active_task, user_id=current_user.id)
+        active_task = await active_timers.afill(current_user.id, marker, db_task)
     if not active_task:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No active task found")
     return active_task
 
+# ====================================================================
+# بث أحداث المؤقت (بدلاً من الاستطلاع)
+# ====================================================================
+
+# مهلة إرسال تعليق keep-alive في SSE حتى لا تغلق الوسائط الاتصال الخامل
+SSE_KEEPALIVE_SECONDS = 15
+
+async def _authenticate_stream(token: Optional[str]):
+    """
+    المتصفح لا يرسل رأس Authorization مع WebSocket / EventSource، لذا يُقبل التوكن كمعامل.
+    الجلسة تُغلق فوراً بعد التحقق حتى لا يحجز الاتصال الطويل أي اتصال بقاعدة البيانات.
+    """
+    if not token:
+        return None
+    try:
+        async with session_scope() as db:
+            return await get_current_user_from_claims(db, token)
+    except HTTPException:
+        return None
+
+async def task_events_websocket(websocket: WebSocket, token: Optional[str] = None):
+    """
+    WS /tasks/stream?token=...
+    يدفع أحداث timer.started / timer.stopped / task.completed / task.incomplete / timer.expired.
+    """
+    user = await _authenticate_stream(token)
+    if user is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+    queue = event_hub.subscribe(user.id)
+
+    async def forward_events():
+        while True:
+            _, message = await queue.get()
+            await websocket.send_text(message)
+
+    sender = asyncio.create_task(forward_events())
+    try:
+        # الرسائل الواردة من العميل (ping) تُتجاهل؛ القراءة تكشف قطع الاتصال
+        while True:
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        sender.cancel()
+        event_hub.unsubscribe(user.id, queue)
+
+# Vercel لا يدعم WebSocket: العملاء هناك يستخدمون /stream/sse
+if EVENTS_WEBSOCKET_ENABLED:
+    router.add_api_websocket_route("/stream", task_events_websocket)
+
+@router.get("/stream/sse")
+async def task_events_sse(request: Request, token: Optional[str] = None):
+    """
+    GET /tasks/stream/sse?token=... (بديل SSE لنفس الأحداث عند تعذر WebSocket)
+    """
+    authorization = request.headers.get("Authorization", "")
+    if not token and authorization.lower().startswith("bearer "):
+        token = authorization[7:]
+    user = await _authenticate_stream(token)
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="تعذر التحقق من بيانات الاعتماد",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    queue = event_hub.subscribe(user.id)
+
+    async def event_stream():
+        try:
+            while True:
+                try:
+                    event_type, message = await asyncio.wait_for(queue.get(), timeout=SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: {event_type}\ndata: {message}\n\n"
+        finally:
+            event_hub.unsubscribe(user.id, queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @router.post("/{task_id}/start_timer", response_model=TaskRead)
-def start_task_timer_endpoint(task_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def start_task_timer_endpoint(task_id: int, db: DBSession = Depends(get_session), current_user: User = Depends(ClaimsUser)):
     """
     POST /tasks/{id}/start_timer (يحل خطأ 404)
     بدء المؤقت أو استئنافه.
     """
-    task = crud.start_task_timer(db, task_id=task_id, user_id=current_user.id)
+    task = await run_db(db, crud.start_task_timer, task_id=task_id, user_id=current_user.id)
     if task is None:
         raise HTTPException(status_code=404, detail="Task not found or unable to start.")
     if isinstance(task, dict) and 'error' in task:
@@ -46,33 +147,33 @@ def start_task_timer_endpoint(task_id: int, db: Session = Depends(get_db), curre
     return task
 
 @router.post("/{task_id}/stop_timer", response_model=TaskRead)
-def stop_task_timer_endpoint(task_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def stop_task_timer_endpoint(task_id: int, db: DBSession = Depends(get_session), current_user: User = Depends(ClaimsUser)):
     """
     POST /tasks/{id}/stop_timer (يحل خطأ 404)
     إيقاف المؤقت وحفظ التقدم (يستخدم للإيقاف المؤقت).
     """
-    task = crud.stop_task_timer(db, task_id=task_id, user_id=current_user.id)
+    task = await run_db(db, crud.stop_task_timer, task_id=task_id, user_id=current_user.id)
     if not task:
         raise HTTPException(status_code=404, detail="Active task not found or already stopped.")
     return task
 
 @router.post("/{task_id}/complete", response_model=TaskRead)
-def complete_task_endpoint(task_id: int, action: TaskTimerAction, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def complete_task_endpoint(task_id: int, action: TaskTimerAction, db: DBSession = Depends(get_session), current_user: User = Depends(ClaimsUser)):
     """
     POST /tasks/{id}/complete (يحل خطأ 404)
     وسم المهمة كمكتملة وحفظ تقدمها.
     """
-    task = crud.complete_task(db, task_id=task_id, user_id=current_user.id, progress_details=action.progress_details)
+    task = await run_db(db, crud.complete_task, task_id=task_id, user_id=current_user.id, progress_details=action.progress_details)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found or unable to complete.")
     return task
 
 @router.post("/{task_id}/mark_incomplete", response_model=TaskRead)
-def mark_task_incomplete_endpoint(task_id: int, action: TaskTimerAction, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def mark_task_incomplete_endpoint(task_id: int, action: TaskTimerAction, db: DBSession = Depends(get_session), current_user: User = Depends(ClaimsUser)):
     """
     وسم المهمة كغير مكتملة (يضيف ساعة إضافية للمرة القادمة).
     """
-    task = crud.mark_task_incomplete(db, task_id=task_id, user_id=current_user.id, progress_details=action.progress_details)
+    task = await run_db(db, crud.mark_task_incomplete, task_id=task_id, user_id=current_user.id, progress_details=action.progress_details)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found or unable to mark incomplete.")
     return task
@@ -83,25 +184,49 @@ def mark_task_incomplete_endpoint(task_id: int, action: TaskTimerAction, db: Ses
 # ====================================================================
 
 @router.post("/", response_model=TaskRead)
-def create_task_for_user(task: TaskCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def create_task_for_user(task: TaskCreate, db: DBSession = Depends(get_session), current_user: User = Depends(ClaimsUser)):
     # يجب أن تكون هذه الدالة موجودة في crud.py
-    return crud.create_user_task(db=db, task=task, user_id=current_user.id)
+    return await run_db(db, crud.create_user_task, task=task, user_id=current_user.id)
 
 @router.get("/", response_model=List[TaskRead])
-def read_tasks(skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    tasks = crud.get_tasks(db, user_id=current_user.id, skip=skip, limit=limit)
+async def read_tasks(response: Response, skip: int = 0, limit: int = 100, cursor: Optional[str] = None, db: DBSession = Depends(get_session), current_user: User = Depends(ClaimsUser)):
+    # cursor (من رأس X-Next-Cursor للصفحة السابقة) أسرع من skip للصفحات العميقة
+    tasks = await run_db(db, crud.get_tasks, user_id=current_user.id, skip=skip, limit=limit, cursor=decode_cursor(cursor))
+    cursor_value = next_cursor(tasks, limit)
+    if cursor_value:
+        response.headers[NEXT_CURSOR_HEADER] = cursor_value
     return tasks
 
+# العمليات الجماعية: دفعة كاملة في معاملة واحدة مع خطأ لكل عنصر غير صالح أو غير موجود
+# (معرفة قبل مسارات /{task_id} حتى لا تُطابق "bulk" كمعرف)
+@router.post("/bulk", response_model=BulkResult[TaskRead])
+async def bulk_create_tasks(items: List[Dict[str, Any]], db: DBSession = Depends(get_session), current_user: User = Depends(ClaimsUser)):
+    valid, errors = bulk.validate_items(items, TaskCreate)
+    created = await run_db(db, crud.bulk_create_tasks, tasks=[task for _, task in valid], user_id=current_user.id) if valid else []
+    return {"items": bulk.created_items(valid, created), "errors": errors}
+
+@router.patch("/bulk", response_model=BulkResult[TaskRead])
+async def bulk_update_tasks(items: List[Dict[str, Any]], db: DBSession = Depends(get_session), current_user: User = Depends(ClaimsUser)):
+    valid, errors = bulk.validate_items(items, TaskUpdate, with_id=True)
+    updated, missing = await run_db(db, crud.bulk_update_tasks, items=valid, user_id=current_user.id) if valid else ([], [])
+    return {"items": bulk.updated_items(updated), "errors": errors + bulk.not_found_errors(missing)}
+
+@router.delete("/bulk", response_model=BulkDeleteResult)
+async def bulk_delete_tasks(body: BulkDeleteRequest, db: DBSession = Depends(get_session), current_user: User = Depends(ClaimsUser)):
+    bulk.check_size(len(body.ids))
+    deleted = await run_db(db, crud.bulk_delete_tasks, task_ids=body.ids, user_id=current_user.id)
+    return {"deleted": deleted, "errors": bulk.deleted_errors(body.ids, deleted)}
+
 @router.put("/{task_id}", response_model=TaskRead)
-def update_task_data(task_id: int, task: TaskUpdate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    updated_task = crud.update_task(db, task_id=task_id, task=task, user_id=current_user.id)
+async def update_task_data(task_id: int, task: TaskUpdate, db: DBSession = Depends(get_session), current_user: User = Depends(ClaimsUser)):
+    updated_task = await run_db(db, crud.update_task, task_id=task_id, task_in=task, user_id=current_user.id)
     if updated_task is None:
         raise HTTPException(status_code=404, detail="Task not found")
     return updated_task
 
 @router.delete("/{task_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_task_data(task_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    deleted = crud.delete_task(db, task_id=task_id, user_id=current_user.id)
+async def delete_task_data(task_id: int, db: DBSession = Depends(get_session), current_user: User = Depends(ClaimsUser)):
+    deleted = await run_db(db, crud.delete_task, task_id=task_id, user_id=current_user.id)
     if not deleted:
         raise HTTPException(status_code=404, detail="Task not found")
     return {"ok": True}
\ No newline at end of file
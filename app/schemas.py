@@ -1,7 +1,8 @@
 # app/schemas.py
-from pydantic import BaseModel, EmailStr, Field
+from pydantic import BaseModel, EmailStr, Field, field_validator
 from datetime import datetime
-from typing import List, Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from typing import Any, Generic, List, Optional, TypeVar
 
 # --- نماذج المصادقة (Auth) ---
 
@@ -19,9 +20,22 @@ class UserRead(UserBase):
     plan: Optional[str] = None
     subscription_id: Optional[str] = None
     expires_at: Optional[datetime] = None
+    timezone: str = "UTC"
     class Config:
         from_attributes = True
 
+class TimezoneUpdate(BaseModel):
+    timezone: str
+
+    @field_validator("timezone")
+    @classmethod
+    def validate_timezone(cls, value: str) -> str:
+        try:
+            ZoneInfo(value)
+        except (ZoneInfoNotFoundError, ValueError):
+            raise ValueError("Unknown timezone")
+        return value
+
 class SubscriptionUpdate(BaseModel):
     plan: str
     subscription_id: str
@@ -127,6 +141,30 @@ class HabitRead(HabitUpdate):
     class Config:
         from_attributes = True
 
+# --- العمليات الجماعية (Bulk) ---
+
+ItemT = TypeVar("ItemT")
+
+class BulkItemError(BaseModel):
+    index: int  # موضع العنصر في الطلب
+    id: Optional[int] = None
+    detail: Any
+
+class BulkItem(BaseModel, Generic[ItemT]):
+    index: int  # موضع العنصر في الطلب
+    item: ItemT
+
+class BulkResult(BaseModel, Generic[ItemT]):
+    items: List[BulkItem[ItemT]]
+    errors: List[BulkItemError] = []
+
+class BulkDeleteRequest(BaseModel):
+    ids: List[int] = Field(min_length=1)
+
+class BulkDeleteResult(BaseModel):
+    deleted: List[int]
+    errors: List[BulkItemError] = []
+
 # --- نماذج إحصائيات التقارير (Reports) ---
 
 class MonthlyStats(BaseModel):
@@ -0,0 +1,189 @@
+# app/timer_expiry.py
+# إيقاف المؤقتات عند انتهاء الوقت المتبقي على الخادم، دون انتظار العميل.
+# المواعيد (start_time + remaining_time_seconds) محفوظة في كومة (heap) مرتبة:
+# الجدولة والإلغاء O(log n)، والمهمة الخلفية تنام حتى أقرب موعد فقط ثم توقف
+# كل المهام المستحقة دفعة واحدة عبر crud.expire_due_timers.
+import asyncio
+import heapq
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from .database import run_db, session_scope
+
+load_dotenv()
+
+# على Vercel لا توجد عملية دائمة؛ يُستخدم أمر "python -m app.cli expire-timers" من cron بدلاً من ذلك
+TIMER_EXPIRY_ENABLED = os.getenv("TIMER_EXPIRY_ENABLED", "false" if os.getenv("VERCEL") else "true").lower() in ("1", "true", "yes")
+TIMER_EXPIRY_BATCH_SIZE = int(os.getenv("TIMER_EXPIRY_BATCH_SIZE", 500))
+# إعادة فحص قاعدة البيانات دورياً لالتقاط مؤقتات بدأت في عمليات أخرى
+TIMER_EXPIRY_RESCAN_SECONDS = float(os.getenv("TIMER_EXPIRY_RESCAN_SECONDS", 300))
+
+HeapEntry = Tuple[datetime, int]  # (الموعد, task_id)
+
+
+class TimerExpiryEngine:
+    def __init__(self, batch_size: int = TIMER_EXPIRY_BATCH_SIZE, rescan_seconds: float = TIMER_EXPIRY_RESCAN_SECONDS):
+        self.batch_size = batch_size
+        self.rescan_seconds = rescan_seconds
+        self._heap: List[HeapEntry] = []
+        # الموعد الحالي لكل مهمة؛ عناصر الكومة التي لا تطابقه قديمة وتُتجاهل عند سحبها (حذف كسول)
+        self._deadlines: Dict[int, datetime] = {}
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.expired = 0
+        self.batches = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def schedule(self, task_id: int, deadline: datetime) -> None:
+        """جدولة (أو إعادة جدولة) انتهاء مؤقت. آمنة للاستدعاء من أي خيط."""
+        if not self.running:
+            return
+        with self._lock:
+            self._deadlines[task_id] = deadline
+            heapq.heappush(self._heap, (deadline, task_id))
+            earliest = self._heap[0][1] == task_id
+        if earliest:
+            self._wake()
+
+    def cancel(self, task_id: int) -> None:
+        """إلغاء الجدولة بعد الإيقاف أو الحذف. العنصر يبقى في الكومة ويُتجاهل لاحقاً."""
+        with self._lock:
+            self._deadlines.pop(task_id, None)
+            # تنظيف الكومة إذا تراكمت فيها عناصر قديمة كثيرة
+            if len(self._heap) > 2 * len(self._deadlines) + 1024:
+                self._heap = [(d, t) for d, t in self._heap if self._deadlines.get(t) == d]
+                heapq.heapify(self._heap)
+
+    def _wake(self) -> None:
+        if self._loop is None or self._wakeup is None:
+            return
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        if running_loop is self._loop:
+            self._wakeup.set()
+        else:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _next_deadline(self) -> Optional[datetime]:
+        with self._lock:
+            while self._heap:
+                deadline, task_id = self._heap[0]
+                if self._deadlines.get(task_id) == deadline:
+                    return deadline
+                heapq.heappop(self._heap)
+        return None
+
+    def _pop_due(self, now: datetime) -> List[int]:
+        due: List[int] = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                deadline, task_id = heapq.heappop(self._heap)
+                if self._deadlines.get(task_id) == deadline:
+                    del self._deadlines[task_id]
+                    due.append(task_id)
+        return due
+
+    async def _expire(self, task_ids: List[int]) -> None:
+        from . import crud
+
+        for start in range(0, len(task_ids), self.batch_size):
+            batch = task_ids[start:start + self.batch_size]
+            async with session_scope() as db:
+                tasks = await run_db(db, crud.expire_due_timers, task_ids=batch)
+            self.expired += len(tasks)
+            self.batches += 1
+
+    async def recover(self) -> int:
+        """تحميل كل المؤقتات النشطة من قاعدة البيانات (عند البدء وبشكل دوري)."""
+        from . import crud
+
+        async with session_scope() as db:
+            rows = await run_db(db, crud.get_running_timers)
+        with self._lock:
+            for task_id, _owner_id, start_time, remaining in rows:
+                deadline = start_time + timedelta(seconds=remaining)
+                if self._deadlines.get(task_id) != deadline:
+                    self._deadlines[task_id] = deadline
+                    heapq.heappush(self._heap, (deadline, task_id))
+        return len(rows)
+
+    async def _run(self) -> None:
+        last_scan = datetime.utcnow()
+        while True:
+            now = datetime.utcnow()
+            try:
+                due = self._pop_due(now)
+                if due:
+                    await self._expire(due)
+                if (now - last_scan).total_seconds() >= self.rescan_seconds:
+                    await self.recover()
+                    last_scan = now
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Timer expiry error: {e}")
+
+            timeout = self.rescan_seconds
+            deadline = self._next_deadline()
+            if deadline is not None:
+                timeout = min(timeout, max(0.0, (deadline - datetime.utcnow()).total_seconds()))
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        try:
+            count = await self.recover()
+            print(f"Timer expiry engine started ({count} running timers).")
+        except Exception as e:
+            # الفحص الدوري سيعيد المحاولة
+            print(f"Timer expiry recovery failed: {e}")
+        self._wake()
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        with self._lock:
+            self._heap.clear()
+            self._deadlines.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            scheduled = len(self._deadlines)
+            heap_size = len(self._heap)
+            next_deadline = min((d for d in self._deadlines.values()), default=None)
+        return {
+            "running": self.running,
+            "scheduled": scheduled,
+            "heap_size": heap_size,
+            "next_deadline": next_deadline.isoformat() if next_deadline else None,
+            "expired": self.expired,
+            "batches": self.batches,
+        }
+
+
+expiry_engine = TimerExpiryEngine()
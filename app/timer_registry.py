@@ -0,0 +1,264 @@
+# app/timer_registry.py
+# سجل المؤقتات النشطة في الذاكرة: الواجهة الأمامية تستطلع GET /tasks/active باستمرار،
+# فنخدمها من هنا بدلاً من Postgres. السجل يُحدَّث عند كل انتقال للمؤقت في crud.py،
+# وعند عدم وجود المستخدم فيه نرجع إلى قاعدة البيانات ونخزن النتيجة (بما فيها "لا توجد مهمة نشطة").
+# مع عدة عمليات (workers / Vercel) يجب استخدام مخزن مشترك (TIMER_REGISTRY_BACKEND=redis)،
+# وإلا فالمخزن المحلي يقصر مدة الصلاحية ولا يخزن "لا توجد مهمة نشطة".
+import asyncio
+import importlib
+import itertools
+import json
+import os
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Optional, Tuple
+
+from dotenv import load_dotenv
+from fastapi.concurrency import run_in_threadpool
+
+from . import schemas
+from .cache import MULTI_PROCESS, TTLCache
+
+load_dotenv()
+
+ACTIVE_TIMER_CACHE_MAXSIZE = int(os.getenv("ACTIVE_TIMER_CACHE_MAXSIZE", 50000))
+# "redis" (يستخدم REDIS_URL) أو مسار صنف بديل بصيغة "package.module:ClassName"
+TIMER_REGISTRY_BACKEND = os.getenv("TIMER_REGISTRY_BACKEND")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# في عملية واحدة يمر كل انتقال للمؤقت عبر هذا السجل، فالصلاحية الطويلة آمنة ويُخدم الاستطلاع
+# من الذاكرة. مع عدة عمليات بمخزن محلي لا نرى انتقالات العمليات الأخرى: صلاحية قصيرة تحد من قِدم البيانات
+_LOCAL_TTL_SECONDS = 5 if MULTI_PROCESS else 3600
+ACTIVE_TIMER_CACHE_TTL_SECONDS = float(os.getenv("ACTIVE_TIMER_CACHE_TTL_SECONDS", 60 if TIMER_REGISTRY_BACKEND else _LOCAL_TTL_SECONDS))
+# تشغيل عدة عمليات بمخزن محلي: مؤقت بدأ في عملية أخرى سيختفي خلف "لا توجد مهمة نشطة" المخزنة هنا
+ACTIVE_TIMER_CACHE_NEGATIVE = os.getenv(
+    "ACTIVE_TIMER_CACHE_NEGATIVE", "false" if MULTI_PROCESS and not TIMER_REGISTRY_BACKEND else "true"
+).lower() in ("1", "true", "yes")
+
+# قيمة مخزنة تعني "تم التحقق: لا توجد مهمة نشطة"
+_NO_ACTIVE_TASK = {"task": None}
+
+
+class TimerRegistryBackend(ABC):
+    """واجهة مخزن السجل. يجب أن تكون القيم قابلة للتحويل إلى JSON حتى يمكن مشاركتها بين العمليات."""
+
+    # المخازن الشبكية تُستدعى من المسارات غير المتزامنة عبر threadpool، وتُرسل كتاباتها
+    # من crud إلى خيط كاتب عند استدعائها على حلقة الأحداث
+    blocking = False
+
+    @abstractmethod
+    def get(self, user_id: int) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    def set(self, user_id: int, value: dict) -> None:
+        ...
+
+    @abstractmethod
+    def add(self, user_id: int, value: dict) -> bool:
+        """تخزين القيمة فقط إذا لم تكن موجودة (ملء من قاعدة البيانات لا يكتب فوق انتقال أحدث)."""
+
+    @abstractmethod
+    def delete(self, user_id: int) -> None:
+        ...
+
+    def stats(self) -> dict:
+        return {}
+
+
+class InProcessTimerBackend(TimerRegistryBackend):
+    """المخزن الافتراضي داخل العملية (TTL + LRU)، وبديل محلي للمخزن المشترك في التطوير."""
+
+    def __init__(self, maxsize: int = ACTIVE_TIMER_CACHE_MAXSIZE, ttl: float = ACTIVE_TIMER_CACHE_TTL_SECONDS):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int) -> Optional[dict]:
+        return self._cache.get(user_id)
+
+    def set(self, user_id: int, value: dict) -> None:
+        self._cache.set(user_id, value)
+
+    def add(self, user_id: int, value: dict) -> bool:
+        with self._lock:
+            if self._cache.get(user_id) is not None:
+                return False
+            self._cache.set(user_id, value)
+            return True
+
+    def delete(self, user_id: int) -> None:
+        self._cache.delete(user_id)
+
+    def stats(self) -> dict:
+        return {"backend": "in_process", **self._cache.stats()}
+
+
+class RedisTimerBackend(TimerRegistryBackend):
+    """مخزن مشترك بين كل العمليات في Redis (يتطلب حزمة redis)."""
+
+    blocking = True
+
+    def __init__(self, url: str = REDIS_URL, ttl: float = ACTIVE_TIMER_CACHE_TTL_SECONDS, prefix: str = "active_timer:"):
+        import redis
+
+        self._redis = redis.Redis.from_url(url)
+        self.ttl_ms = int(ttl * 1000)
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, user_id: int) -> str:
+        return f"{self.prefix}{user_id}"
+
+    def get(self, user_id: int) -> Optional[dict]:
+        raw = self._redis.get(self._key(user_id))
+        if raw is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(raw)
+
+    def set(self, user_id: int, value: dict) -> None:
+        self._redis.set(self._key(user_id), json.dumps(value), px=self.ttl_ms)
+
+    def add(self, user_id: int, value: dict) -> bool:
+        return bool(self._redis.set(self._key(user_id), json.dumps(value), px=self.ttl_ms, nx=True))
+
+    def delete(self, user_id: int) -> None:
+        self._redis.delete(self._key(user_id))
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "backend": "redis",
+            "ttl_seconds": self.ttl_ms / 1000,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total) if total else 0.0,
+        }
+
+
+def _on_event_loop() -> bool:
+    # مع DB_ASYNC=1 تعمل دوال crud داخل run_sync على خيط حلقة الأحداث نفسه
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+def _serialize(task) -> dict:
+    entry = schemas.TaskRead.model_validate(task).model_dump(mode="json")
+    return {"task": entry}
+
+
+class ActiveTimerRegistry:
+    def __init__(self, backend: TimerRegistryBackend):
+        self.backend = backend
+        # رقم تسلسلي لآخر كتابة مؤكدة لكل مستخدم، لمنع قراءة قديمة من قاعدة البيانات
+        # من الكتابة فوق انتقال حدث أثناءها
+        self._writes = TTLCache(maxsize=ACTIVE_TIMER_CACHE_MAXSIZE, ttl=ACTIVE_TIMER_CACHE_TTL_SECONDS)
+        self._sequence = itertools.count(1)
+        self._lock = threading.Lock()
+        # خيط واحد يحفظ ترتيب الكتابات كما صدرت من crud
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="timer-registry") if backend.blocking else None
+        self.write_errors = 0
+
+    def _dispatch(self, func, *args) -> None:
+        """تنفيذ كتابة على المخزن دون حجب حلقة الأحداث إذا كان المخزن شبكياً."""
+        if self._writer is not None and _on_event_loop():
+            self._writer.submit(self._guarded, func, *args)
+        else:
+            func(*args)
+
+    def _guarded(self, func, *args) -> None:
+        # فشل الكتابة في الخلفية لا يصل إلى أي طلب؛ القيمة القديمة تنتهي مع TTL
+        try:
+            func(*args)
+        except Exception:
+            self.write_errors += 1
+
+    def lookup(self, user_id: int) -> Tuple[bool, Optional[dict]]:
+        """(موجود في السجل؟, بيانات المهمة النشطة أو None)."""
+        value = self.backend.get(user_id)
+        if value is None:
+            return False, None
+        return True, value["task"]
+
+    async def alookup(self, user_id: int) -> Tuple[bool, Optional[dict]]:
+        if self.backend.blocking:
+            return await run_in_threadpool(self.lookup, user_id)
+        return self.lookup(user_id)
+
+    def begin_fill(self, user_id: int) -> Any:
+        """يُستدعى قبل قراءة قاعدة البيانات عند عدم الوجود في السجل."""
+        return self._writes.get(user_id)
+
+    def fill(self, user_id: int, marker: Any, task) -> Optional[dict]:
+        """تخزين نتيجة قراءة قاعدة البيانات ما لم يحدث انتقال للمؤقت أثناءها."""
+        if task is None:
+            if ACTIVE_TIMER_CACHE_NEGATIVE:
+                self._fill(user_id, marker, _NO_ACTIVE_TASK)
+            return None
+        value = _serialize(task)
+        self._fill(user_id, marker, value)
+        return value["task"]
+
+    async def afill(self, user_id: int, marker: Any, task) -> Optional[dict]:
+        if self.backend.blocking:
+            return await run_in_threadpool(self.fill, user_id, marker, task)
+        return self.fill(user_id, marker, task)
+
+    def _fill(self, user_id: int, marker: Any, value: dict) -> None:
+        with self._lock:
+            # marker يكشف انتقالاً في هذه العملية، و add لا يكتب فوق انتقال سجلته عملية أخرى
+            if self._writes.get(user_id) == marker:
+                self.backend.add(user_id, value)
+
+    def _write(self, user_id: int, value: dict):
+        # رفع الرقم التسلسلي فوراً يكفي لإبطال أي ملء جارٍ؛ الكتابة المؤجلة تأتي بعده دائماً،
+        # و add (NX) في الملء لا يكتب فوق set سابق
+        with self._lock:
+            self._writes.set(user_id, next(self._sequence))
+        self._dispatch(self.backend.set, user_id, value)
+
+    def record(self, user_id: int, task) -> None:
+        """تسجيل المهمة النشطة (بعد start_task_timer أو تعديل المهمة النشطة)."""
+        self._write(user_id, _serialize(task))
+
+    def record_none(self, user_id: int) -> None:
+        """تسجيل أن المستخدم ليس لديه مهمة نشطة (بعد stop_task_timer أو الحذف)."""
+        self._write(user_id, _NO_ACTIVE_TASK)
+
+    def sync(self, user_id: int, task) -> None:
+        """تحديث السجل بعد أي كتابة على مهمة لهذا المستخدم."""
+        if task is None:
+            return
+        if task.is_active:
+            self.record(user_id, task)
+            return
+        # القراءة من المخزن الشبكي تحجب هي أيضاً، فتُنفَّذ مع المقارنة في خيط الكاتب
+        self._dispatch(self._clear_if_active, user_id, task.id)
+
+    def _clear_if_active(self, user_id: int, task_id: int) -> None:
+        found, entry = self.lookup(user_id)
+        if found and entry is not None and entry["id"] == task_id:
+            self.record_none(user_id)
+
+    def stats(self) -> dict:
+        stats = {"cache_negative": ACTIVE_TIMER_CACHE_NEGATIVE, **self.backend.stats()}
+        if self._writer is not None:
+            stats["write_errors"] = self.write_errors
+        return stats
+
+
+def _load_backend() -> TimerRegistryBackend:
+    if not TIMER_REGISTRY_BACKEND:
+        return InProcessTimerBackend()
+    if TIMER_REGISTRY_BACKEND == "redis":
+        return RedisTimerBackend()
+    module_name, _, class_name = TIMER_REGISTRY_BACKEND.partition(":")
+    return getattr(importlib.import_module(module_name), class_name)()
+
+
+active_timers = ActiveTimerRegistry(_load_backend())
@@ -0,0 +1,340 @@
+# app/upstream.py
+# طبقة استدعاء الخدمات الخارجية البطيئة أو غير المستقرة (Gemini):
+#   - إعادة المحاولة مع تأخير عشوائي (full jitter) للأخطاء المؤقتة فقط
+#   - طلب تحوّطي (hedging) ثانٍ إذا تجاوز الأول زمن p95 المعتاد
+#   - قاطع دائرة (circuit breaker) يرفض فوراً أثناء تعطل الخدمة بدلاً من انتظار المهلة
+#   - ميزانية لكل مستخدم (token bucket) لحماية الحصة من مستخدم واحد
+import asyncio
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional, Tuple
+
+import httpx
+from dotenv import load_dotenv
+from fastapi import HTTPException, status
+
+from .cache import TTLCache
+from .http_clients import http_clients
+
+load_dotenv()
+
+# حالات HTTP التي تعني خللاً مؤقتاً في الخدمة ويجوز إعادة المحاولة معها
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+def _env(name: str, prefix: str, default, cast):
+    value = os.getenv(f"{prefix}_{name}")
+    return cast(value) if value is not None else default
+
+
+def _bool(value: str) -> bool:
+    return value.lower() in ("1", "true", "yes")
+
+
+@dataclass
+class UpstreamPolicy:
+    # إعادة المحاولة
+    attempts: int = 3
+    base_delay: float = 0.25
+    max_delay: float = 2.0
+    # مهلة المحاولة الواحدة لا تقل عن المهلة الثابتة السابقة (10 ثوانٍ) حتى لا تُقطع الردود البطيئة
+    # السليمة، والمهلة الكلية تحد مجموع المحاولات: الإعادة بعد خطأ سريع (503) تحصل على ما تبقى فقط
+    attempt_timeout: float = 10.0
+    deadline: float = 15.0
+    # زمن إضافي لكل 1000 رمز في الـ prompt (توليد رد أطول لنص أطول)، يُضاف لكل محاولة
+    seconds_per_1k_tokens: float = 0.0
+    # الطلب التحوّطي
+    hedge: bool = False
+    hedge_percentile: float = 0.95
+    hedge_min_delay: float = 0.5
+    hedge_min_samples: int = 20
+    # قاطع الدائرة
+    breaker_failures: int = 5
+    breaker_reset_seconds: float = 30.0
+
+    @classmethod
+    def from_env(cls, prefix: str, **overrides) -> "UpstreamPolicy":
+        """القيم من متغيرات البيئة بالبادئة <PREFIX>_ (مثل GEMINI_RETRY_ATTEMPTS)."""
+        defaults = cls(**overrides)
+        return cls(
+            attempts=_env("RETRY_ATTEMPTS", prefix, defaults.attempts, int),
+            base_delay=_env("RETRY_BASE_DELAY", prefix, defaults.base_delay, float),
+            max_delay=_env("RETRY_MAX_DELAY", prefix, defaults.max_delay, float),
+            attempt_timeout=_env("ATTEMPT_TIMEOUT_SECONDS", prefix, defaults.attempt_timeout, float),
+            deadline=_env("DEADLINE_SECONDS", prefix, defaults.deadline, float),
+            seconds_per_1k_tokens=_env("SECONDS_PER_1K_TOKENS", prefix, defaults.seconds_per_1k_tokens, float),
+            hedge=_env("HEDGE_ENABLED", prefix, defaults.hedge, _bool),
+            hedge_percentile=_env("HEDGE_PERCENTILE", prefix, defaults.hedge_percentile, float),
+            hedge_min_delay=_env("HEDGE_MIN_DELAY", prefix, defaults.hedge_min_delay, float),
+            breaker_failures=_env("BREAKER_FAILURES", prefix, defaults.breaker_failures, int),
+            breaker_reset_seconds=_env("BREAKER_RESET_SECONDS", prefix, defaults.breaker_reset_seconds, float),
+        )
+
+
+class CircuitBreaker:
+    """closed → open بعد عدد من الإخفاقات المتتالية → half_open بعد مدة لتجربة طلب واحد."""
+
+    def __init__(self, failures: int, reset_seconds: float):
+        self.failure_threshold = failures
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self._probe_in_flight = False
+        self._probe_started = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self.state = "half_open"
+                self._probe_in_flight = False
+            # طلب التجربة الذي لم يُسجل نتيجته (أُلغي مثلاً) لا يُبقي القاطع مغلقاً للأبد
+            probe_stale = time.monotonic() - self._probe_started >= self.reset_seconds
+            if self.state == "half_open" and (not self._probe_in_flight or probe_stale):
+                self._probe_in_flight = True
+                self._probe_started = time.monotonic()
+                return True
+            self.rejected += 1
+            return False
+
+    def retry_after(self) -> int:
+        return max(1, int(self.reset_seconds - (time.monotonic() - self.opened_at)) + 1)
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = "closed"
+            self.consecutive_failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+            self._probe_in_flight = False
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "rejected": self.rejected,
+        }
+
+
+class TokenBucketLimiter:
+    """ميزانية لكل مفتاح (مستخدم أو IP): rate رمز في الثانية بسعة capacity."""
+
+    def __init__(self, rate: float, capacity: float, maxsize: int = 50000):
+        self.rate = rate
+        self.capacity = capacity
+        # الدلو الذي لم يُستخدم لمدة امتلائه يعود ممتلئاً، فيمكن حذفه بعدها
+        self._buckets = TTLCache(maxsize=maxsize, ttl=capacity / rate if rate > 0 else 3600)
+        self._lock = threading.Lock()
+        self.limited = 0
+
+    def consume(self, key, cost: float = 1.0) -> float:
+        """0 إذا سُمح بالطلب، وإلا عدد الثواني حتى يتوفر الرصيد."""
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (self.capacity, now))
+            tokens = min(self.capacity, tokens + (now - updated) * self.rate)
+            if tokens >= cost:
+                self._buckets.set(key, (tokens - cost, now))
+                return 0.0
+            self._buckets.set(key, (tokens, now))
+            self.limited += 1
+            return (cost - tokens) / self.rate
+
+    def check(self, key, cost: float = 1.0) -> None:
+        """رفع 429 مع Retry-After عند نفاد الميزانية."""
+        if self.rate > 0 and cost > self.capacity:
+            # طلب أكبر من السعة لن يُسمح به أبداً مهما انتظر العميل
+            self.limited += 1
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail=f"Request needs {int(cost)} AI calls; at most {int(self.capacity)} are allowed at once. Please split it.",
+            )
+        wait = self.consume(key, cost)
+        if wait > 0:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="AI request budget exceeded. Please slow down.",
+                headers={"Retry-After": str(int(wait) + 1)},
+            )
+
+    def stats(self) -> dict:
+        return {
+            "rate_per_second": self.rate,
+            "capacity": self.capacity,
+            "tracked_keys": len(self._buckets),
+            "limited": self.limited,
+        }
+
+
+class _RetryableResponse(Exception):
+    def __init__(self, response: httpx.Response):
+        self.response = response
+
+
+class Upstream:
+    def __init__(self, name: str, policy: UpstreamPolicy, breaker: Optional[CircuitBreaker] = None):
+        self.name = name
+        self.policy = policy
+        # سياستان لنفس الخدمة (مثل الطلبات العادية والدفعية) تتشاركان قاطعاً واحداً
+        self.breaker = breaker or CircuitBreaker(policy.breaker_failures, policy.breaker_reset_seconds)
+        self.calls = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.failures = 0
+
+    def _unavailable(self) -> HTTPException:
+        return HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"{self.name} is temporarily unavailable. Please try again shortly.",
+            headers={"Retry-After": str(self.breaker.retry_after())},
+        )
+
+    def ensure_available(self) -> None:
+        """للاستدعاءات التي لا تمر عبر call() (مثل البث المتدفق)."""
+        if not self.breaker.allow():
+            raise self._unavailable()
+
+    def timeouts(self, prompt_tokens: int = 0) -> Tuple[float, float]:
+        """(مهلة المحاولة الواحدة, المهلة الكلية) بعد إضافة الزمن المتناسب مع حجم الـ prompt."""
+        extra = self.policy.seconds_per_1k_tokens * prompt_tokens / 1000
+        return self.policy.attempt_timeout + extra, self.policy.deadline + extra * max(1, self.policy.attempts)
+
+    def _backoff(self, attempt: int, response: Optional[httpx.Response]) -> float:
+        delay = random.uniform(0, min(self.policy.max_delay, self.policy.base_delay * (2 ** attempt)))
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, min(float(retry_after), self.policy.max_delay))
+        return delay
+
+    def _hedge_delay(self) -> Optional[float]:
+        if not self.policy.hedge:
+            return None
+        latency = http_clients.upstream_stats(self.name)
+        if latency.samples < self.policy.hedge_min_samples:
+            return None
+        return max(self.policy.hedge_min_delay, latency.percentile(self.policy.hedge_percentile) or 0.0)
+
+    async def _attempt(self, send: Callable[[], Awaitable[httpx.Response]]) -> httpx.Response:
+        response = await send()
+        if response.status_code in RETRYABLE_STATUS:
+            raise _RetryableResponse(response)
+        return response
+
+    async def _send(self, send: Callable[[], Awaitable[httpx.Response]]) -> httpx.Response:
+        delay = self._hedge_delay()
+        if delay is None:
+            return await self._attempt(send)
+
+        primary = asyncio.ensure_future(self._attempt(send))
+        pending = {primary}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=delay)
+            if done:
+                return primary.result()
+
+            # الطلب الأول أبطأ من p95: إرسال نسخة ثانية واعتماد أول نجاح
+            self.hedges += 1
+            hedge = asyncio.ensure_future(self._attempt(send))
+            pending.add(hedge)
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # إلغاء الطلب الخاسر (أو كليهما عند انتهاء المهلة)
+            for task in pending:
+                task.cancel()
+
+    async def call(self, send: Callable[[], Awaitable[httpx.Response]], prompt_tokens: int = 0) -> httpx.Response:
+        """
+        تنفيذ send() مع إعادة المحاولة والتحوّط وقاطع الدائرة.
+        send يجب أن يكون آمناً للتكرار (idempotent). الاستجابات 4xx تُعاد كما هي دون إعادة محاولة.
+        prompt_tokens يمدد المهلتين حسب seconds_per_1k_tokens.
+        """
+        self.calls += 1
+        attempt_timeout, deadline = self.timeouts(prompt_tokens)
+        started = time.monotonic()
+        last_error: Optional[BaseException] = None
+        for attempt in range(max(1, self.policy.attempts)):
+            remaining = deadline - (time.monotonic() - started)
+            if remaining <= 0:
+                break
+            if not self.breaker.allow():
+                raise self._unavailable()
+            try:
+                response = await asyncio.wait_for(self._send(send), timeout=min(attempt_timeout, remaining))
+            except (httpx.TransportError, asyncio.TimeoutError, _RetryableResponse) as e:
+                self.breaker.record_failure()
+                last_error = e
+                if attempt + 1 < self.policy.attempts:
+                    self.retries += 1
+                    response = e.response if isinstance(e, _RetryableResponse) else None
+                    await asyncio.sleep(self._backoff(attempt, response))
+                continue
+            # أي استجابة غير مؤقتة (بما فيها 4xx) تعني أن الخدمة تعمل
+            self.breaker.record_success()
+            return response
+
+        self.failures += 1
+        if isinstance(last_error, _RetryableResponse):
+            print(f"{self.name} API error response:", last_error.response.text)
+            raise HTTPException(
+                status_code=status.HTTP_502_BAD_GATEWAY,
+                detail=f"{self.name} returned {last_error.response.status_code} after {self.policy.attempts} attempts.",
+            )
+        if isinstance(last_error, httpx.TransportError) and not isinstance(last_error, httpx.TimeoutException):
+            raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail=f"Failed to reach {self.name}: {last_error}")
+        raise HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail=f"{self.name} did not respond in time.")
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "failures": self.failures,
+            "hedge_delay_seconds": self._hedge_delay(),
+            "breaker": self.breaker.stats(),
+        }
+
+
+gemini_upstream = Upstream("gemini", UpstreamPolicy.from_env("GEMINI"))
+# الدفعات المجمعة (/ai/gemini/analyze-tasks/batch) ترسل prompts أطول بكثير وتولد ردوداً أطول:
+# مهلة أطول تتناسب مع حجم الـ prompt، ومحاولتان فقط، وبدون تحوّط (نسخة ثانية تضاعف كلفة prompt كبير).
+# القيم من متغيرات البيئة بالبادئة GEMINI_BATCH_ (مثل GEMINI_BATCH_SECONDS_PER_1K_TOKENS)
+gemini_batch_upstream = Upstream(
+    "gemini",
+    UpstreamPolicy.from_env(
+        "GEMINI_BATCH", attempts=2, attempt_timeout=20.0, deadline=45.0, seconds_per_1k_tokens=5.0, hedge=False
+    ),
+    breaker=gemini_upstream.breaker,
+)
+
+# ميزانية طلبات الذكاء الاصطناعي لكل مستخدم (أو IP للطلبات غير المصادق عليها)
+AI_BUDGET_PER_MINUTE = float(os.getenv("AI_BUDGET_PER_MINUTE", 20))
+AI_BUDGET_BURST = float(os.getenv("AI_BUDGET_BURST", 10))
+
+ai_budget = TokenBucketLimiter(rate=AI_BUDGET_PER_MINUTE / 60.0, capacity=AI_BUDGET_BURST)
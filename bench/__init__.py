@@ -0,0 +1,2 @@
+# bench/
+# قياسات أداء قابلة للتشغيل محلياً: python -m bench.<name> --help
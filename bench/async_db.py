@@ -0,0 +1,102 @@
+# bench/async_db.py
+# مقارنة وضعي قاعدة البيانات (DB_ASYNC=0: threadpool + psycopg2، DB_ASYNC=1: asyncpg)
+# تحت حمل متزامن: يشغّل uvicorn لكل وضع ثم يرسل طلبات GET /tasks/ بالتوازي.
+# الاستخدام: DATABASE_URL=... python -m bench.async_db --requests 1000 --concurrency 50
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+EMAIL = "bench-async@example.com"
+PASSWORD = "bench-password"
+
+
+async def _wait_ready(base: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base) as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get("/")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError("server did not start")
+
+
+async def _token(client: httpx.AsyncClient, tasks: int) -> str:
+    await client.post("/auth/signup", json={"email": EMAIL, "name": "Bench", "password": PASSWORD})
+    response = await client.post("/auth/token", data={"username": EMAIL, "password": PASSWORD})
+    response.raise_for_status()
+    token = response.json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    existing = len((await client.get("/tasks/", params={"limit": tasks}, headers=headers)).json())
+    for index in range(existing, tasks):
+        await client.post("/tasks/", json={"title": f"bench {index}", "due_date": "2030-01-01T00:00:00"}, headers=headers)
+    return token
+
+
+async def _load(base: str, requests: int, concurrency: int, seed_tasks: int) -> dict:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base, limits=limits, timeout=120) as client:
+        headers = {"Authorization": f"Bearer {await _token(client, seed_tasks)}"}
+        latencies = []
+        errors = 0
+        queue = iter(range(requests))
+
+        async def worker():
+            nonlocal errors
+            for _ in queue:
+                started = time.perf_counter()
+                response = await client.get("/tasks/", params={"limit": 20}, headers=headers)
+                latencies.append(time.perf_counter() - started)
+                errors += response.status_code != 200
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "rps": requests / elapsed,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95)] * 1000,
+        "errors": errors,
+    }
+
+
+def _run_mode(db_async: bool, args) -> dict:
+    env = dict(os.environ, DB_ASYNC="1" if db_async else "0", TIMER_EXPIRY_ENABLED="false",
+               PAYMENT_WORKER_ENABLED="false", EVENTS_RELAY_ENABLED="false")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(args.port), "--log-level", "warning"],
+        env=env,
+    )
+    base = f"http://127.0.0.1:{args.port}"
+    try:
+        asyncio.run(_wait_ready(base))
+        return asyncio.run(_load(base, args.requests, args.concurrency, args.tasks))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Sync vs async database mode under concurrent load")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--tasks", type=int, default=50, help="tasks seeded for the bench user")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    for db_async in (False, True):
+        result = _run_mode(db_async, args)
+        print(f"DB_ASYNC={int(db_async)}: {result['rps']:.0f} req/s, p50 {result['p50_ms']:.1f} ms, "
+              f"p95 {result['p95_ms']:.1f} ms, errors {result['errors']}")
+
+
+if __name__ == "__main__":
+    main()
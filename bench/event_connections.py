@@ -0,0 +1,117 @@
+# bench/event_connections.py
+# عدد اتصالات /tasks/stream الخاملة التي يحملها عامل واحد وكلفة الذاكرة لكل اتصال:
+# يشغّل uvicorn، يقيس RSS للعملية قبل فتح الاتصالات وبعده، ثم يبدأ مؤقتاً ويقيس
+# الزمن حتى يصل الحدث إلى كل الاتصالات.
+# الاستخدام: DATABASE_URL=... python -m bench.event_connections --connections 5000 --transport ws|sse
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+from contextlib import AsyncExitStack
+
+import httpx
+import websockets
+
+from bench.async_db import _token, _wait_ready
+
+
+def _rss_kib(pid: int) -> int:
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+async def _open_ws(base: str, token: str, stack: AsyncExitStack):
+    socket = await websockets.connect(base.replace("http://", "ws://") + f"/tasks/stream?token={token}", ping_interval=None)
+    stack.push_async_callback(socket.close)
+    return socket.recv
+
+
+async def _open_sse(stream_client: httpx.AsyncClient, token: str, stack: AsyncExitStack):
+    response = await stack.enter_async_context(stream_client.stream("GET", "/tasks/stream/sse", params={"token": token}))
+    lines = response.aiter_lines()
+
+    async def receive():
+        async for line in lines:
+            if line.startswith("data: "):
+                return line
+
+    return receive
+
+
+async def _run(base: str, pid: int, connections: int, batch: int, transport: str) -> dict:
+    limits = httpx.Limits(max_connections=connections + 1)
+    async with httpx.AsyncClient(base_url=base, timeout=60) as client, \
+            httpx.AsyncClient(base_url=base, timeout=None, limits=limits) as stream_client, \
+            AsyncExitStack() as stack:
+        token = await _token(client, 1)
+        headers = {"Authorization": f"Bearer {token}"}
+        task_id = (await client.get("/tasks/", params={"limit": 1}, headers=headers)).json()[0]["id"]
+        await client.post(f"/tasks/{task_id}/stop_timer", headers=headers)
+
+        def opener():
+            if transport == "ws":
+                return _open_ws(base, token, stack)
+            return _open_sse(stream_client, token, stack)
+
+        rss_before = _rss_kib(pid)
+        receivers = []
+        started = time.perf_counter()
+        for _ in range(0, connections, batch):
+            receivers += await asyncio.gather(*(opener() for _ in range(batch)))
+        open_seconds = time.perf_counter() - started
+        await asyncio.sleep(1)
+        rss_after = _rss_kib(pid)
+
+        started = time.perf_counter()
+        response = await client.post(f"/tasks/{task_id}/start_timer", headers=headers)
+        response.raise_for_status()
+        await asyncio.gather(*(receive() for receive in receivers))
+        fanout_seconds = time.perf_counter() - started
+        await client.post(f"/tasks/{task_id}/stop_timer", headers=headers)
+    return {
+        "connections": len(receivers),
+        "open_seconds": open_seconds,
+        "rss_before_mib": rss_before / 1024,
+        "rss_after_mib": rss_after / 1024,
+        "kib_per_connection": (rss_after - rss_before) / len(receivers),
+        "fanout_ms": fanout_seconds * 1000,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Idle event-stream connections held per worker")
+    parser.add_argument("--connections", type=int, default=5000)
+    parser.add_argument("--batch", type=int, default=100)
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--transport", choices=("ws", "sse"), default="ws")
+    parser.add_argument("--ws-deflate", action="store_true", help="keep uvicorn's per-message-deflate enabled")
+    args = parser.parse_args()
+
+    env = dict(os.environ, TIMER_EXPIRY_ENABLED="false", PAYMENT_WORKER_ENABLED="false",
+               EVENTS_RELAY_ENABLED="false")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(args.port), "--log-level", "warning",
+         "--ws-per-message-deflate", str(args.ws_deflate)],
+        env=env,
+    )
+    base = f"http://127.0.0.1:{args.port}"
+    try:
+        asyncio.run(_wait_ready(base))
+        result = asyncio.run(_run(base, server.pid, args.connections, args.batch, args.transport))
+    finally:
+        server.terminate()
+        server.wait()
+
+    print(f"{args.transport}: {result['connections']} connections opened in {result['open_seconds']:.1f} s")
+    print(f"server RSS {result['rss_before_mib']:.1f} MiB -> {result['rss_after_mib']:.1f} MiB "
+          f"({result['kib_per_connection']:.1f} KiB per connection)")
+    print(f"one event fanned out to all connections in {result['fanout_ms']:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
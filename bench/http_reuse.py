@@ -0,0 +1,129 @@
+# bench/http_reuse.py
+# كلفة إنشاء httpx.AsyncClient لكل طلب (مصافحة TCP + TLS في كل مرة) مقابل العميل المشترك
+# من http_clients (اتصالات keep-alive معاد استخدامها)، على خادم HTTPS محلي بشهادة ذاتية التوقيع.
+# الاستخدام: python -m bench.http_reuse --requests 500
+import argparse
+import asyncio
+import datetime
+import ipaddress
+import os
+import socket
+import statistics
+import tempfile
+import threading
+import time
+
+import httpx
+import uvicorn
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+
+from app.http_clients import HTTPClientRegistry, UpstreamConfig
+
+
+async def _stub_app(scope, receive, send):
+    if scope["type"] != "http":
+        return
+    await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"application/json")]})
+    await send({"type": "http.response.body", "body": b'{"ok": true}'})
+
+
+def _self_signed(directory: str):
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "127.0.0.1")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(minutes=1))
+        .not_valid_after(now + datetime.timedelta(hours=1))
+        .add_extension(x509.SubjectAlternativeName([x509.IPAddress(ipaddress.ip_address("127.0.0.1"))]), critical=False)
+        .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+        .sign(key, hashes.SHA256())
+    )
+    cert_path = os.path.join(directory, "cert.pem")
+    key_path = os.path.join(directory, "key.pem")
+    with open(cert_path, "wb") as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+    with open(key_path, "wb") as f:
+        f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()))
+    return cert_path, key_path
+
+
+def _start_stub(cert_path: str, key_path: str):
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(
+        _stub_app, host="127.0.0.1", port=port, log_level="warning", lifespan="off",
+        ssl_certfile=cert_path, ssl_keyfile=key_path,
+    ))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, thread, f"https://127.0.0.1:{port}/"
+
+
+async def _per_request_clients(url: str, requests: int) -> list:
+    # السلوك القديم: عميل جديد لكل طلب
+    latencies = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        async with httpx.AsyncClient() as client:
+            (await client.get(url)).raise_for_status()
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+async def _shared_client(url: str, requests: int, registry: HTTPClientRegistry) -> list:
+    client = registry.get("stub")
+    latencies = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        (await client.get(url)).raise_for_status()
+        latencies.append(time.perf_counter() - started)
+    await registry.aclose()
+    return latencies
+
+
+def _report(name: str, latencies: list) -> None:
+    latencies = sorted(latencies)
+    print(f"{name}: mean {statistics.mean(latencies) * 1000:.2f} ms, "
+          f"p50 {latencies[len(latencies) // 2] * 1000:.2f} ms, "
+          f"p95 {latencies[int(len(latencies) * 0.95)] * 1000:.2f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Outbound HTTPS: new client per request vs the shared pooled client")
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        cert_path, key_path = _self_signed(directory)
+        # httpx يقرأ SSL_CERT_FILE عند إنشاء كل عميل (trust_env)
+        os.environ["SSL_CERT_FILE"] = cert_path
+        server, thread, url = _start_stub(cert_path, key_path)
+        try:
+            registry = HTTPClientRegistry()
+            registry.register(UpstreamConfig(name="stub"))
+            per_request = asyncio.run(_per_request_clients(url, args.requests))
+            shared = asyncio.run(_shared_client(url, args.requests, registry))
+        finally:
+            server.should_exit = True
+            thread.join(timeout=10)
+
+    _report("new client per request", per_request)
+    _report("shared pooled client  ", shared)
+    stats = registry.upstream_stats("stub").snapshot()
+    print(f"shared client: {stats['requests']} requests, {stats['new_connections']} TCP connects, "
+          f"{stats['tls_handshakes']} TLS handshakes, reuse ratio {stats['reuse_ratio']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# bench/pagination.py
+# زمن الصفحة 1 مقابل الصفحة 500 لمستخدم لديه 50 ألف مهمة: skip/limit مقابل المؤشر (cursor).
+# يُدرج المهام دفعة واحدة مباشرة في القاعدة ثم يستدعي crud.get_tasks كما تفعل المسارات.
+# الاستخدام: DATABASE_URL=... python -m bench.pagination --tasks 50000 --limit 100 --page 500
+import argparse
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, insert, text
+
+from app import crud, models
+from app.database import SessionLocal, engine
+
+EMAIL = "bench-pagination@example.com"
+
+
+def _seed(tasks: int) -> int:
+    with SessionLocal() as db:
+        user = crud.get_user_by_email(db, EMAIL)
+        if user is None:
+            user = models.User(email=EMAIL, name="Bench", hashed_password="!")
+            db.add(user)
+            db.commit()
+        db.execute(delete(models.Task).where(models.Task.owner_id == user.id))
+        base = datetime(2030, 1, 1)
+        rows = [
+            {"owner_id": user.id, "title": f"bench {index}", "due_date": base, "created_at": base - timedelta(seconds=index)}
+            for index in range(tasks)
+        ]
+        for start in range(0, tasks, 5000):
+            db.execute(insert(models.Task), rows[start:start + 5000])
+        db.commit()
+        db.execute(text("ANALYZE tasks"))
+        return user.id
+
+
+def _timed(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tasks", type=int, default=50000)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--page", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    models.Base.metadata.create_all(bind=engine)
+    user_id = _seed(args.tasks)
+    deep_skip = (args.page - 1) * args.limit
+    with SessionLocal() as db:
+        # المؤشر الذي كان العميل سيحمله عند الوصول إلى الصفحة العميقة
+        anchor = crud.get_tasks(db, user_id, skip=deep_skip - 1, limit=1)[0]
+        cursor = (anchor.created_at, anchor.id)
+        results = {
+            "skip page 1": _timed(lambda: crud.get_tasks(db, user_id, limit=args.limit), args.repeat),
+            f"skip page {args.page}": _timed(lambda: crud.get_tasks(db, user_id, skip=deep_skip, limit=args.limit), args.repeat),
+            f"cursor page {args.page}": _timed(lambda: crud.get_tasks(db, user_id, limit=args.limit, cursor=cursor), args.repeat),
+        }
+        assert [t.id for t in crud.get_tasks(db, user_id, skip=deep_skip, limit=args.limit)] == \
+            [t.id for t in crud.get_tasks(db, user_id, limit=args.limit, cursor=cursor)]
+    for name, median_ms in results.items():
+        print(f"{name}: {median_ms:.2f} ms (median of {args.repeat})")
+
+
+if __name__ == "__main__":
+    main()
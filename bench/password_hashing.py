@@ -0,0 +1,69 @@
+# bench/password_hashing.py
+# عدد عمليات تسجيل الدخول (التحقق من PBKDF2) في الثانية لكل نواة:
+#   - serial: التحقق في الخيط الحالي (الحد الأعلى لنواة واحدة)
+#   - pool: عبر verify_password_async ومجمع العمليات المخصص (PASSWORD_HASH_WORKERS)،
+#     مع أقصى تأخر لحلقة الأحداث أثناء الدفعة (يجب أن يبقى بالمللي ثانية)
+# الاستخدام: python -m bench.password_hashing --logins 200 --concurrency 32
+import argparse
+import asyncio
+import os
+import time
+
+from app import auth_utils
+
+
+def _serial(hashed: str, logins: int) -> float:
+    started = time.perf_counter()
+    for _ in range(logins):
+        auth_utils.verify_password("correct horse", hashed)
+    return logins / (time.perf_counter() - started)
+
+
+async def _pool(hashed: str, logins: int, concurrency: int) -> tuple:
+    semaphore = asyncio.Semaphore(concurrency)
+    max_lag = 0.0
+    done = False
+
+    async def probe():
+        nonlocal max_lag
+        while not done:
+            started = time.perf_counter()
+            await asyncio.sleep(0.01)
+            max_lag = max(max_lag, time.perf_counter() - started - 0.01)
+
+    async def login():
+        async with semaphore:
+            assert await auth_utils.verify_password_async("correct horse", hashed)
+
+    # تسخين المجمع حتى لا يُحتسب زمن إنشاء العمليات
+    await asyncio.gather(*(login() for _ in range(max(1, auth_utils.PASSWORD_HASH_WORKERS))))
+    prober = asyncio.create_task(probe())
+    started = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(logins)))
+    elapsed = time.perf_counter() - started
+    done = True
+    await prober
+    return logins / elapsed, max_lag
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="PBKDF2 logins per second per core")
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+
+    hashed = auth_utils.get_password_hash("correct horse")
+    workers = max(1, auth_utils.PASSWORD_HASH_WORKERS)
+    print(f"rounds={auth_utils.PBKDF2_ROUNDS} workers={auth_utils.PASSWORD_HASH_WORKERS} cpus={os.cpu_count()}")
+
+    serial = _serial(hashed, args.logins)
+    print(f"serial: {serial:.1f} logins/s (1 core)")
+
+    pooled, max_lag = asyncio.run(_pool(hashed, args.logins, args.concurrency))
+    print(f"pool:   {pooled:.1f} logins/s total, {pooled / workers:.1f} logins/s per worker")
+    print(f"event loop max lag during burst: {max_lag * 1000:.1f} ms")
+    auth_utils.shutdown_hash_executor()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+# bench/token_decode.py
+# التوفير لكل طلب من ذاكرة التوكنات المتحقق منها في decode_access_token:
+# نفس التوكن يُفك عدة مرات (كما في تحميل لوحة التحكم) مع الذاكرة ومن دونها.
+# الاستخدام: python -m bench.token_decode --calls 20000
+import argparse
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from jose import jwt
+
+from app import auth_utils
+
+
+def _token() -> str:
+    user = SimpleNamespace(
+        id=1, email="bench@example.com", name="Bench", is_active=True, is_unlocked=True,
+        plan="monthly", subscription_id="sub", expires_at=datetime.utcnow() + timedelta(days=30),
+        timezone="Africa/Cairo", token_version=0, claims_version=0,
+    )
+    return auth_utils.create_user_access_token(user)
+
+
+def _per_call_us(func, calls: int) -> float:
+    started = time.perf_counter()
+    for _ in range(calls):
+        func()
+    return (time.perf_counter() - started) / calls * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="decode_access_token with and without the verified-token cache")
+    parser.add_argument("--calls", type=int, default=20000)
+    args = parser.parse_args()
+
+    token = _token()
+    uncached = _per_call_us(lambda: jwt.decode(token, auth_utils.SECRET_KEY, algorithms=[auth_utils.ALGORITHM]), args.calls)
+    auth_utils.token_cache.clear()
+    auth_utils.decode_access_token(token)
+    cached = _per_call_us(lambda: auth_utils.decode_access_token(token), args.calls)
+
+    print(f"jwt.decode (no cache): {uncached:.1f} us/call")
+    print(f"decode_access_token (cache hit): {cached:.1f} us/call")
+    print(f"saving: {uncached - cached:.1f} us/call ({uncached / cached:.1f}x); "
+          f"~{(uncached - cached) * 6 / 1000:.2f} ms per dashboard load of 6 requests")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# bench/webhook_ack.py
+# زمن إقرار /payments/kashier/webhook تحت دفعة مفتوحة (open loop) بمعدل ثابت، مثل 1000 إشعار/ثانية:
+# كل طلب يُرسل في موعده المحدد بغض النظر عن بطء الردود السابقة، ثم تُعاد نسبة منها كإعادة إرسال
+# (مسار إزالة التكرار)، ويُعرض ما طبقه العامل الخلفي بعد انتهاء الدفعة.
+# الطلبات (merchantOrderId) غير موجودة في payment_orders، فيعلّمها العامل ignored: المقيس هو مسار الإقرار.
+# الاستخدام: DATABASE_URL=... python -m bench.webhook_ack --events 1000 --rate 1000
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+import uuid
+
+import httpx
+
+from app.routers.payments import kashier_signature
+from bench.async_db import _wait_ready
+
+API_KEY = "bench-kashier-key"
+INTERNAL_TOKEN = "bench-internal"
+SIGNATURE_KEYS = ["amount", "currency", "merchantOrderId", "status", "transactionId"]
+
+
+def _event(run: str, index: int) -> tuple:
+    data = {
+        "merchantOrderId": f"bench-{run}-{index}",
+        "transactionId": f"bench-tx-{run}-{index}",
+        "status": "SUCCESS",
+        "amount": "99.00",
+        "currency": "EGP",
+        "signatureKeys": SIGNATURE_KEYS,
+    }
+    body = json.dumps({"event": "pay", "data": data}).encode()
+    return body, kashier_signature(data, API_KEY)
+
+
+def _percentiles(latencies: list) -> str:
+    latencies = sorted(latencies)
+    pick = lambda p: latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000
+    return f"p50 {pick(0.50):.1f} ms, p95 {pick(0.95):.1f} ms, p99 {pick(0.99):.1f} ms, max {latencies[-1] * 1000:.1f} ms"
+
+
+async def _burst(client: httpx.AsyncClient, events: list, rate: float) -> dict:
+    latencies = []
+    statuses = {}
+
+    async def send(body: bytes, signature: str, at: float):
+        await asyncio.sleep(max(0.0, at - time.perf_counter()))
+        # الزمن يُقاس من الموعد المحدد، فيشمل أي انتظار في طابور العميل أو الخادم
+        response = await client.post("/payments/kashier/webhook", content=body,
+                                     headers={"X-Kashier-Signature": signature, "Content-Type": "application/json"})
+        latencies.append(time.perf_counter() - at)
+        key = f"{response.status_code} duplicate" if response.json().get("duplicate") else str(response.status_code)
+        statuses[key] = statuses.get(key, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(send(body, signature, started + index / rate) for index, (body, signature) in enumerate(events)))
+    return {"elapsed": time.perf_counter() - started, "latencies": latencies, "statuses": statuses}
+
+
+async def _run(base: str, args) -> None:
+    run = uuid.uuid4().hex[:8]
+    events = [_event(run, index) for index in range(args.events)]
+    duplicates = events[: int(args.events * args.duplicates)]
+    limits = httpx.Limits(max_connections=args.connections, max_keepalive_connections=args.connections)
+    async with httpx.AsyncClient(base_url=base, limits=limits, timeout=60) as client:
+        fresh = await _burst(client, events, args.rate)
+        print(f"fresh: {len(events)} events in {fresh['elapsed']:.2f} s ({len(events) / fresh['elapsed']:.0f}/s), "
+              f"{_percentiles(fresh['latencies'])}, statuses {fresh['statuses']}")
+        if duplicates:
+            replay = await _burst(client, duplicates, args.rate)
+            print(f"redelivered: {len(duplicates)} events, {_percentiles(replay['latencies'])}, statuses {replay['statuses']}")
+
+        # العامل يطبق الإشعارات على دفعات في الخلفية بعد الإقرار
+        await asyncio.sleep(args.settle)
+        worker = (await client.get("/internal/payment-worker", headers={"X-Internal-Token": INTERNAL_TOKEN})).json()
+        applied = {key: worker.get(key) for key in ("processed", "ignored", "retried", "failed")}
+        print(f"payment worker after {args.settle:.0f} s: {worker.get('batches')} batches, {applied}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Kashier webhook ack latency under an open-loop burst")
+    parser.add_argument("--events", type=int, default=1000)
+    parser.add_argument("--rate", type=float, default=1000, help="events per second")
+    parser.add_argument("--duplicates", type=float, default=0.2, help="fraction redelivered after the burst")
+    parser.add_argument("--connections", type=int, default=100)
+    parser.add_argument("--settle", type=float, default=5)
+    parser.add_argument("--port", type=int, default=8767)
+    parser.add_argument("--no-worker", action="store_true", help="measure acks with the background worker disabled")
+    args = parser.parse_args()
+
+    env = dict(os.environ, KASHIER_API_KEY=API_KEY, INTERNAL_API_TOKEN=INTERNAL_TOKEN, TIMER_EXPIRY_ENABLED="false",
+               EVENTS_RELAY_ENABLED="false", PAYMENT_WORKER_ENABLED="false" if args.no_worker else "true")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(args.port), "--log-level", "warning"],
+        env=env,
+    )
+    base = f"http://127.0.0.1:{args.port}"
+    try:
+        asyncio.run(_wait_ready(base))
+        asyncio.run(_run(base, args))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
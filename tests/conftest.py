@@ -0,0 +1,105 @@
+# tests/conftest.py
+# اختبارات القاعدة تحتاج PostgreSQL حقيقية (الفهارس الجزئية وUPDATE ... RETURNING)،
+# لذا تتخطى وحداتها نفسها (requires_db) ما لم يُضبط TEST_DATABASE_URL.
+import os
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import pytest
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+if TEST_DATABASE_URL:
+    os.environ["DATABASE_URL"] = TEST_DATABASE_URL
+    # لا عمال خلفية أثناء الاختبارات إلا ما يشغّله الاختبار نفسه
+    for name in ("TIMER_EXPIRY_ENABLED", "PAYMENT_WORKER_ENABLED", "EVENTS_RELAY_ENABLED"):
+        os.environ.setdefault(name, "false")
+    os.environ.setdefault("PASSWORD_HASH_WORKERS", "0")
+    os.environ.setdefault("PBKDF2_ROUNDS", "1000")
+
+
+def requires_db():
+    """يُستدعى أعلى وحدة الاختبار قبل استيراد app (app.database يرفض العمل بدون DATABASE_URL)."""
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL is not set", allow_module_level=True)
+
+
+@contextmanager
+def serve(app):
+    """تشغيل تطبيق ASGI بـ uvicorn حقيقي على منفذ محلي حر داخل خيط (للبث الذي لا يدعمه ASGITransport)."""
+    import uvicorn
+
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 10
+    while not server.started:
+        assert time.monotonic() < deadline, "server did not start"
+        time.sleep(0.05)
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.should_exit = True
+        thread.join(timeout=10)
+
+
+@pytest.fixture(scope="session")
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture(scope="session")
+def engine():
+    from app import models
+    from app.database import engine
+
+    models.Base.metadata.create_all(bind=engine)
+    return engine
+
+
+@pytest.fixture
+def db(engine):
+    from app.database import SessionLocal
+
+    with SessionLocal() as session:
+        yield session
+
+
+@pytest.fixture
+def user(db):
+    from app import crud, schemas
+
+    email = f"test-{uuid.uuid4().hex[:12]}@example.com"
+    return crud.create_user(db, schemas.UserCreate(email=email, name="Test", password="password"))
+
+
+@pytest.fixture
+def fake_gemini(monkeypatch):
+    """Gemini وهمي خلف ASGITransport، مع سجل عملاء وذاكرة نتائج وقاطع دائرة جديدة لكل اختبار."""
+    import httpx
+
+    from app import upstream
+    from app.ai_cache import AIResponseCache, InProcessAICacheBackend
+    from app.http_clients import HTTPClientRegistry, UpstreamConfig
+    from app.routers import ai
+    from tests.fake_gemini import FakeGemini
+
+    fake = FakeGemini()
+    registry = HTTPClientRegistry()
+    registry.register(UpstreamConfig(name="gemini", transport=httpx.ASGITransport(app=fake)))
+    for module in (ai, upstream):
+        monkeypatch.setattr(module, "http_clients", registry)
+    monkeypatch.setattr(ai, "GEMINI_API_KEY", "fake")
+    monkeypatch.setattr(ai, "ai_cache", AIResponseCache(InProcessAICacheBackend()))
+    monkeypatch.setattr(ai, "ai_budget", upstream.TokenBucketLimiter(rate=0, capacity=0))
+    single = upstream.Upstream("gemini", upstream.UpstreamPolicy(base_delay=0.01, max_delay=0.05))
+    batch = upstream.Upstream("gemini", upstream.UpstreamPolicy(attempts=2, base_delay=0.01, max_delay=0.05), breaker=single.breaker)
+    monkeypatch.setattr(ai, "gemini_upstream", single)
+    monkeypatch.setattr(ai, "gemini_batch_upstream", batch)
+    return fake
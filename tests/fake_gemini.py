@@ -0,0 +1,141 @@
+# tests/fake_gemini.py
+# خادم Gemini وهمي (تطبيق ASGI) لمساري generateContent و streamGenerateContent مع حقن الأعطال:
+# حالات HTTP محددة للطلبات التالية، انقطاع الاتصال، وتأخير لكل طلب أو لكل جزء من البث.
+# داخل الاختبارات يُستخدم عبر httpx.ASGITransport، ويمكن تشغيله كخادم محلي للتطوير:
+#   python -m tests.fake_gemini --port 8081
+#   GEMINI_API_BASE=http://127.0.0.1:8081/v1beta/models/gemini-2.5-flash GEMINI_API_KEY=fake uvicorn app.main:app
+import argparse
+import asyncio
+import json
+import re
+from collections import deque
+from typing import List, Optional, Union
+
+import httpx
+
+DEFAULT_TASKS = [
+    {
+        "name": "كتابة التقرير",
+        "description": "إنهاء مسودة التقرير الشهري",
+        "type": "important",
+        "scheduledFor": "today",
+        "classification": "work",
+        "estimatedHours": 2.0,
+    },
+    {
+        "name": "شراء الخضار",
+        "description": "قائمة مشتريات الأسبوع",
+        "type": "routine",
+        "scheduledFor": "tomorrow",
+        "classification": "personal",
+        "estimatedHours": 0.5,
+    },
+]
+
+_BATCH_INPUT = re.compile(r"^Input (\d+):", re.MULTILINE)
+
+# عطل يحاكي انقطاع الاتصال: عبر ASGITransport يصل إلى العميل كـ httpx.ConnectError
+DROP = "drop"
+
+
+class FakeGemini:
+    def __init__(self, tasks: Optional[List[dict]] = None, chunk_size: int = 40):
+        self.tasks = DEFAULT_TASKS if tasks is None else tasks
+        # عدد أحرف النص في كل حدث SSE من مسار البث
+        self.chunk_size = chunk_size
+        # تأخير قبل الرد على كل طلب، وبين أجزاء البث
+        self.delay = 0.0
+        self.chunk_delay = 0.0
+        # نص خام بدلاً من JSON المهام (لاختبار الردود غير الصالحة)
+        self.raw_text: Optional[str] = None
+        self._faults: deque = deque()
+        self._delays: deque = deque()
+        self.calls = 0
+        self.prompts: List[str] = []
+
+    def fail_next(self, *faults: Union[int, str]) -> None:
+        """الطلبات التالية ترد بهذه الحالات (أو DROP) بالترتيب، ثم يعود الخادم للعمل الطبيعي."""
+        self._faults.extend(faults)
+
+    def delay_next(self, *seconds: float) -> None:
+        """تأخير إضافي للطلبات التالية بالترتيب (مثل طلب أول بطيء لاختبار التحوّط)."""
+        self._delays.extend(seconds)
+
+    def response_text(self, prompt: str) -> str:
+        if self.raw_text is not None:
+            return self.raw_text
+        numbers = _BATCH_INPUT.findall(prompt)
+        if numbers:
+            return json.dumps([{"index": int(n), "tasks": self.tasks} for n in numbers], ensure_ascii=False)
+        return json.dumps(self.tasks, ensure_ascii=False)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+
+        self.calls += 1
+        delay = self.delay + (self._delays.popleft() if self._delays else 0.0)
+        if delay:
+            await asyncio.sleep(delay)
+        if self._faults:
+            status = self._faults.popleft()
+            if status == DROP:
+                raise httpx.ConnectError("injected connection failure")
+            await _send_json(send, status, {"error": {"code": status, "message": "injected fault"}})
+            return
+
+        path = scope["path"]
+        try:
+            prompt = json.loads(body)["contents"][0]["parts"][0]["text"]
+        except (ValueError, KeyError, IndexError):
+            await _send_json(send, 400, {"error": {"code": 400, "message": "invalid payload"}})
+            return
+        self.prompts.append(prompt)
+        text = self.response_text(prompt)
+
+        if path.endswith(":generateContent"):
+            await _send_json(send, 200, _candidate(text))
+        elif path.endswith(":streamGenerateContent"):
+            await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"text/event-stream")]})
+            for start in range(0, len(text), self.chunk_size):
+                event = json.dumps(_candidate(text[start:start + self.chunk_size]), ensure_ascii=False)
+                await send({"type": "http.response.body", "body": f"data: {event}\r\n\r\n".encode("utf-8"), "more_body": True})
+                if self.chunk_delay:
+                    await asyncio.sleep(self.chunk_delay)
+            await send({"type": "http.response.body", "body": b""})
+        else:
+            await _send_json(send, 404, {"error": {"code": 404, "message": "not found"}})
+
+
+def _candidate(text: str) -> dict:
+    return {"candidates": [{"content": {"parts": [{"text": text}], "role": "model"}}]}
+
+
+async def _send_json(send, status: int, payload: dict) -> None:
+    await send({"type": "http.response.start", "status": status, "headers": [(b"content-type", b"application/json")]})
+    await send({"type": "http.response.body", "body": json.dumps(payload, ensure_ascii=False).encode("utf-8")})
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Local fake Gemini upstream")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds before each response")
+    parser.add_argument("--chunk-delay", type=float, default=0.2, help="seconds between streamed chunks")
+    args = parser.parse_args()
+
+    fake = FakeGemini()
+    fake.delay = args.delay
+    fake.chunk_delay = args.chunk_delay
+    uvicorn.run(fake, host="127.0.0.1", port=args.port, lifespan="off")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# tests/test_ai_batch.py
+# التحليل الدفعي مقابل Gemini الوهمي: التجميع في prompts، النتائج لكل عنصر، ومهلة سياسة الدفعات.
+import pytest
+
+from tests.conftest import requires_db
+
+requires_db()
+
+import httpx
+
+from app.main import app
+from app.routers import ai
+from app.upstream import Upstream, UpstreamPolicy
+from tests.fake_gemini import DEFAULT_TASKS
+
+
+async def _batch(texts) -> httpx.Response:
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        return await client.post("/ai/gemini/analyze-tasks/batch", json={"texts": texts})
+
+
+def test_timeouts_scale_with_prompt_size():
+    upstream = Upstream("gemini", UpstreamPolicy(attempts=2, attempt_timeout=20, deadline=45, seconds_per_1k_tokens=5))
+
+    assert upstream.timeouts() == (20, 45)
+    assert upstream.timeouts(4000) == (40, 85)
+
+
+@pytest.mark.anyio
+async def test_texts_are_packed_into_one_prompt(fake_gemini):
+    response = await _batch(["نص أول", "نص ثانٍ", "نص ثالث"])
+
+    assert response.status_code == 200
+    body = response.json()
+    assert [item["index"] for item in body["results"]] == [0, 1, 2]
+    assert all(item["tasks"] == DEFAULT_TASKS and item["error"] is None for item in body["results"])
+    assert body["stats"]["upstream_calls"] == 1
+    assert body["stats"]["packed_prompts"] == 1
+    assert fake_gemini.calls == 1
+
+
+@pytest.mark.anyio
+async def test_cached_items_skip_the_upstream(fake_gemini):
+    await _batch(["نص أول", "نص ثانٍ"])
+    response = await _batch(["نص أول", "نص ثانٍ", "نص جديد"])
+
+    body = response.json()
+    assert [item["cached"] for item in body["results"]] == [True, True, False]
+    assert body["stats"]["upstream_calls"] == 1
+    assert fake_gemini.calls == 2
+
+
+@pytest.mark.anyio
+async def test_packed_prompt_uses_the_batch_policy_timeout(fake_gemini, monkeypatch):
+    # الرد يتأخر 0.3 ثانية: أكثر من مهلة الطلب العادي، وأقل من مهلة الدفعة بعد تمديدها حسب الحجم
+    fake_gemini.delay = 0.3
+    single = Upstream("gemini", UpstreamPolicy(attempts=1, attempt_timeout=0.1, deadline=0.1))
+    batch = Upstream(
+        "gemini",
+        UpstreamPolicy(attempts=1, attempt_timeout=0.1, deadline=0.1, seconds_per_1k_tokens=2.0),
+        breaker=single.breaker,
+    )
+    monkeypatch.setattr(ai, "gemini_upstream", single)
+    monkeypatch.setattr(ai, "gemini_batch_upstream", batch)
+
+    packed = (await _batch(["نص أول", "نص ثانٍ"])).json()
+    alone = (await _batch(["نص منفرد"])).json()
+
+    assert packed["stats"]["failed"] == 0
+    assert alone["results"][0]["error"] is not None
+    assert alone["stats"]["failed"] == 1
@@ -0,0 +1,65 @@
+# tests/test_ai_cache.py
+import asyncio
+
+import pytest
+
+from app.ai_cache import AIResponseCache, InProcessAICacheBackend, RedisAICacheBackend
+
+
+class FakeRedis:
+    """ما يستخدمه RedisAICacheBackend فقط: get و set مع px."""
+
+    def __init__(self):
+        self.data = {}
+        self.expiry_ms = {}
+
+    def get(self, key):
+        value = self.data.get(key)
+        return value.encode("utf-8") if value is not None else None
+
+    def set(self, key, value, px=None):
+        self.data[key] = value
+        self.expiry_ms[key] = px
+
+
+def test_key_ignores_whitespace_and_tracks_prompt_version():
+    assert AIResponseCache.key("اكتب  التقرير\n", "v1") == AIResponseCache.key(" اكتب التقرير", "v1")
+    assert AIResponseCache.key("اكتب التقرير", "v1") != AIResponseCache.key("اكتب التقرير", "v2")
+
+
+def test_redis_backend_round_trip_with_ttl():
+    client = FakeRedis()
+    cache = AIResponseCache(RedisAICacheBackend(client=client), ttl=60)
+
+    cache.set("k", [{"title": "مهمة"}])
+
+    assert cache.get("k") == [{"title": "مهمة"}]
+    assert client.expiry_ms["ai_cache:k"] == 60000
+    assert cache.get("missing") is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("backend", [InProcessAICacheBackend, lambda: RedisAICacheBackend(client=FakeRedis())])
+async def test_concurrent_identical_requests_share_one_call(backend):
+    cache = AIResponseCache(backend())
+    calls = 0
+
+    async def compute():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return [{"title": "مهمة"}]
+
+    results = await asyncio.gather(*(cache.get_or_compute("k", compute) for _ in range(5)))
+
+    assert calls == 1
+    assert results == [[{"title": "مهمة"}]] * 5
+    assert await cache.aget("k") == [{"title": "مهمة"}]
+
+
+def test_oversized_results_are_not_stored():
+    cache = AIResponseCache(InProcessAICacheBackend(), max_entry_bytes=10)
+    cache.set("k", [{"title": "x" * 20}])
+    assert cache.get("k") is None
+    assert cache.stats()["oversized"] == 1
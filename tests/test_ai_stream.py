@@ -0,0 +1,102 @@
+# tests/test_ai_stream.py
+# البث من Gemini الوهمي (tests/fake_gemini.py) حتى العميل بصيغة NDJSON.
+import json
+import time
+
+import pytest
+
+from tests.conftest import requires_db, serve
+
+requires_db()
+
+import httpx
+
+from app.http_clients import HTTPClientRegistry, UpstreamConfig
+from app.main import app
+from app.routers import ai
+from tests.fake_gemini import DEFAULT_TASKS
+
+
+async def _collect(text: str = "نص"):
+    return [event async for event in ai._stream_gemini(text)]
+
+
+async def _stream_endpoint(text: str = "نص") -> list:
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        response = await client.post("/ai/gemini/analyze-tasks/stream", json={"text": text})
+    assert response.status_code == 200
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+@pytest.mark.anyio
+async def test_stream_yields_each_task(fake_gemini):
+    fake_gemini.chunk_size = 7
+
+    events = await _collect()
+
+    assert events == [("task", task) for task in DEFAULT_TASKS]
+    assert fake_gemini.calls == 1
+
+
+@pytest.mark.anyio
+async def test_invalid_task_is_reported_and_valid_ones_still_stream(fake_gemini):
+    fake_gemini.tasks = [DEFAULT_TASKS[0], {"name": "ناقصة"}]
+
+    events = await _collect()
+
+    assert events[0] == ("task", DEFAULT_TASKS[0])
+    assert events[1][0] == "error"
+
+
+@pytest.mark.anyio
+async def test_truncated_response_is_reported(fake_gemini):
+    fake_gemini.raw_text = json.dumps(DEFAULT_TASKS, ensure_ascii=False)[:-40]
+
+    events = await _collect()
+
+    assert events[0] == ("task", DEFAULT_TASKS[0])
+    assert events[-1] == ("error", "Gemini response ended before the JSON array was closed.")
+
+
+@pytest.mark.anyio
+async def test_endpoint_streams_ndjson_then_serves_the_cache(fake_gemini):
+    first = await _stream_endpoint()
+    second = await _stream_endpoint("  نص ")
+
+    assert [event["task"] for event in first if event["type"] == "task"] == DEFAULT_TASKS
+    assert first[-1] == {"type": "done", "count": 2, "cached": False}
+    assert second[-1] == {"type": "done", "count": 2, "cached": True}
+    assert fake_gemini.calls == 1
+
+
+@pytest.mark.anyio
+async def test_endpoint_reports_upstream_errors(fake_gemini):
+    fake_gemini.fail_next(503)
+
+    events = await _stream_endpoint()
+
+    assert [event["type"] for event in events] == ["error"]
+    assert ai.gemini_upstream.breaker.consecutive_failures == 1
+
+
+@pytest.mark.anyio
+async def test_first_task_arrives_before_generation_finishes(fake_gemini, monkeypatch):
+    # خادم حقيقي حتى تصل الأجزاء تدريجياً (ASGITransport يجمع الرد كاملاً)
+    fake_gemini.tasks = DEFAULT_TASKS * 3
+    fake_gemini.chunk_size = 60
+    fake_gemini.chunk_delay = 0.05
+    registry = HTTPClientRegistry()
+    registry.register(UpstreamConfig(name="gemini"))
+    monkeypatch.setattr(ai, "http_clients", registry)
+
+    with serve(fake_gemini) as base:
+        monkeypatch.setattr(ai, "GEMINI_STREAM_URL", f"{base}/v1beta/models/fake:streamGenerateContent")
+        started = time.perf_counter()
+        arrivals = []
+        async for kind, _ in ai._stream_gemini("نص"):
+            assert kind == "task"
+            arrivals.append(time.perf_counter() - started)
+        await registry.aclose()
+
+    assert len(arrivals) == 6
+    assert arrivals[0] < arrivals[-1] / 2
@@ -0,0 +1,35 @@
+# tests/test_events.py
+import asyncio
+import json
+
+import pytest
+
+from app.events import EventHub, PostgresEventRelay
+
+
+@pytest.mark.anyio
+async def test_relay_outbox_drops_oldest_when_full():
+    relay = PostgresEventRelay(EventHub(), "postgresql://unused", outbox_size=2)
+    relay._loop = asyncio.get_running_loop()
+    relay._outbox = asyncio.Queue(maxsize=relay.outbox_size)
+
+    for index in range(3):
+        relay.send(1, ("timer.started", json.dumps({"index": index})))
+
+    pending = [json.loads(json.loads(relay._outbox.get_nowait())["m"])["index"] for _ in range(2)]
+    assert pending == [1, 2]
+    assert relay.stats()["dropped"] == 1
+
+
+@pytest.mark.anyio
+async def test_hub_delivers_to_every_connection_of_the_user():
+    hub = EventHub(queue_size=1)
+    first, second = hub.subscribe(1), hub.subscribe(1)
+    other = hub.subscribe(2)
+
+    hub.deliver(1, ("timer.stopped", "{}"))
+    hub.deliver(1, ("task.completed", "{}"))
+
+    assert first.get_nowait() == second.get_nowait() == ("task.completed", "{}")
+    assert other.empty()
+    assert hub.stats()["dropped"] == 2
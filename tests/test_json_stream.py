@@ -0,0 +1,63 @@
+# tests/test_json_stream.py
+import json
+
+import pytest
+
+from app.json_stream import JSONArrayStreamParser
+
+TASKS = [
+    {"name": "a", "description": "قوس } داخل النص", "estimatedHours": 1.5},
+    {"name": "b", "description": "اقتباس \"مهرب\" و [أقواس] و \\\\", "tags": [{"x": "}"}]},
+]
+
+
+def _feed_all(parser, text, size):
+    items = []
+    for start in range(0, len(text), size):
+        items += parser.feed(text[start:start + size])
+    return items
+
+
+@pytest.mark.parametrize("size", [1, 2, 7, 1000])
+def test_objects_are_emitted_across_chunk_boundaries(size):
+    parser = JSONArrayStreamParser()
+    assert _feed_all(parser, json.dumps(TASKS, ensure_ascii=False), size) == TASKS
+    assert parser.complete
+
+
+def test_each_object_is_emitted_as_soon_as_it_closes():
+    parser = JSONArrayStreamParser()
+    text = json.dumps(TASKS, ensure_ascii=False)
+    first_end = text.index("}, {") + 1
+
+    assert parser.feed(text[:first_end - 1]) == []
+    assert parser.feed(text[first_end - 1:first_end]) == [TASKS[0]]
+    assert not parser.complete
+
+
+@pytest.mark.parametrize("size", [1, 3, 1000])
+def test_top_level_strings_do_not_confuse_depth(size):
+    # نص من المستوى الأول يحتوي أقواساً وعلامة تنصيص مهربة
+    text = '["a]", "{b", "c\\"]", {"name": "x"}, "}", {"name": "y"}]'
+    parser = JSONArrayStreamParser()
+    assert _feed_all(parser, text, size) == [{"name": "x"}, {"name": "y"}]
+    assert parser.complete
+
+
+def test_markdown_fence_and_trailing_text_are_ignored():
+    text = 'Here is the "result":\n```json\n' + json.dumps(TASKS) + '\n```\n{"ignored": true}'
+    parser = JSONArrayStreamParser()
+    assert _feed_all(parser, text, 5) == TASKS
+    assert parser.complete
+
+
+def test_single_object_without_array():
+    parser = JSONArrayStreamParser()
+    assert parser.feed('{"name": "solo", "nested": {"k": "]"}}') == [{"name": "solo", "nested": {"k": "]"}}]
+    assert parser.complete
+
+
+def test_truncated_array_is_not_complete():
+    parser = JSONArrayStreamParser()
+    assert parser.feed('[{"name": "a"}, {"name": "b') == [{"name": "a"}]
+    assert not parser.complete
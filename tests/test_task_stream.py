@@ -0,0 +1,56 @@
+# tests/test_task_stream.py
+# SSE من البداية للنهاية: خادم uvicorn حقيقي، فتح /tasks/stream/sse ثم بدء مؤقت واستلام الحدث.
+import json
+from datetime import datetime
+
+import pytest
+
+from tests.conftest import requires_db, serve
+
+requires_db()
+
+import httpx
+
+from app import crud, schemas
+from app.auth_utils import create_user_access_token
+from app.main import app
+
+
+@pytest.fixture(scope="module")
+def live_server():
+    with serve(app) as base:
+        yield base
+
+
+def _read_event(lines, wanted: str) -> dict:
+    event_type = None
+    for line in lines:
+        if line.startswith("event: "):
+            event_type = line[len("event: "):]
+        elif line.startswith("data: ") and event_type == wanted:
+            return json.loads(line[len("data: "):])
+
+
+def test_sse_stream_receives_timer_started(live_server, db, user):
+    task = crud.create_user_task(db, schemas.TaskCreate(title="stream", due_date=datetime(2030, 1, 1)), user.id)
+    headers = {"Authorization": f"Bearer {create_user_access_token(user)}"}
+
+    with httpx.Client(base_url=live_server, headers=headers, timeout=10) as client:
+        with client.stream("GET", "/tasks/stream/sse") as stream:
+            assert stream.status_code == 200
+            assert stream.headers["content-type"].startswith("text/event-stream")
+            # الاشتراك يتم قبل إرسال الرؤوس، فالحدث التالي لن يفوتنا
+            response = client.post(f"/tasks/{task.id}/start_timer")
+            assert response.status_code == 200
+
+            event = _read_event(stream.iter_lines(), "timer.started")
+
+    assert event["type"] == "timer.started"
+    assert event["task"]["id"] == task.id
+    assert event["task"]["is_active"] is True
+
+
+def test_sse_stream_rejects_invalid_token(live_server):
+    with httpx.Client(base_url=live_server, timeout=10) as client:
+        response = client.get("/tasks/stream/sse", params={"token": "invalid"})
+    assert response.status_code == 401
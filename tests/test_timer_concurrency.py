@@ -0,0 +1,68 @@
+# tests/test_timer_concurrency.py
+# انتقالات المؤقت تحت التزامن: عدة طلبات بدء متوازية لنفس المستخدم، كل منها في جلسة مستقلة.
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pytest
+
+from tests.conftest import requires_db
+
+requires_db()
+
+from app import crud, models, schemas
+from app.database import SessionLocal
+
+WORKERS = 8
+
+
+def _create_tasks(db, user_id, count):
+    return [
+        crud.create_user_task(db, schemas.TaskCreate(title=f"task {index}", due_date=datetime(2030, 1, 1)), user_id).id
+        for index in range(count)
+    ]
+
+
+def _active_count(db, user_id):
+    return db.query(models.Task).filter(models.Task.owner_id == user_id, models.Task.is_active == True).count()
+
+
+def _run_together(calls):
+    barrier = threading.Barrier(len(calls))
+
+    def run(call):
+        barrier.wait()
+        with SessionLocal() as session:
+            return call(session)
+
+    with ThreadPoolExecutor(max_workers=len(calls)) as pool:
+        return list(pool.map(run, calls))
+
+
+def test_parallel_starts_for_one_user_allow_exactly_one(db, user):
+    task_ids = _create_tasks(db, user.id, WORKERS)
+
+    results = _run_together([lambda session, task_id=task_id: crud.start_task_timer(session, task_id, user.id) for task_id in task_ids])
+
+    started = [result for result in results if isinstance(result, models.Task)]
+    rejected = [result for result in results if isinstance(result, dict)]
+    assert len(started) == 1
+    assert len(rejected) == WORKERS - 1
+    assert all(result == {"error": "Another task is already running."} for result in rejected)
+    assert _active_count(db, user.id) == 1
+
+
+def test_parallel_start_stop_never_leaves_two_active(db, user):
+    task_ids = _create_tasks(db, user.id, 4)
+
+    for _ in range(5):
+        calls = []
+        for task_id in task_ids:
+            calls.append(lambda session, task_id=task_id: crud.start_task_timer(session, task_id, user.id))
+            calls.append(lambda session, task_id=task_id: crud.stop_task_timer(session, task_id, user.id))
+        _run_together(calls)
+        assert _active_count(db, user.id) <= 1
+
+    for task_id in task_ids:
+        crud.stop_task_timer(db, task_id, user.id)
+    assert _active_count(db, user.id) == 0
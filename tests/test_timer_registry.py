@@ -0,0 +1,51 @@
+# tests/test_timer_registry.py
+# كتابات المخزن الشبكي من crud لا يجب أن تحجب حلقة الأحداث (DB_ASYNC=1).
+import asyncio
+import threading
+
+import pytest
+
+from app.timer_registry import ActiveTimerRegistry, InProcessTimerBackend
+
+
+class RecordingBackend(InProcessTimerBackend):
+    blocking = True
+
+    def __init__(self):
+        super().__init__()
+        self.write_threads = []
+
+    def set(self, user_id, value):
+        self.write_threads.append(threading.current_thread().name)
+        super().set(user_id, value)
+
+
+@pytest.mark.anyio
+async def test_blocking_backend_writes_leave_the_event_loop():
+    backend = RecordingBackend()
+    registry = ActiveTimerRegistry(backend)
+
+    registry.record_none(1)
+    await asyncio.get_running_loop().run_in_executor(None, registry._writer.submit(lambda: None).result)
+
+    assert backend.write_threads == ["timer-registry_0"]
+    assert registry.lookup(1) == (True, None)
+
+
+def test_writes_off_the_event_loop_stay_synchronous():
+    backend = RecordingBackend()
+    registry = ActiveTimerRegistry(backend)
+
+    registry.record_none(1)
+
+    assert backend.write_threads == [threading.current_thread().name]
+
+
+def test_fill_does_not_overwrite_a_newer_transition():
+    registry = ActiveTimerRegistry(InProcessTimerBackend())
+    marker = registry.begin_fill(1)
+    registry.record_none(1)
+
+    registry._fill(1, marker, {"task": {"id": 7}})
+
+    assert registry.lookup(1) == (True, None)
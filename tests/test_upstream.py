@@ -0,0 +1,188 @@
+# tests/test_upstream.py
+# طبقة الاستدعاء الخارجي مقابل Gemini الوهمي مع حقن الأعطال: إعادة المحاولة، المهلة الكلية،
+# التحوّط، طلب التجربة في قاطع الدائرة (half-open) وميزانية token bucket.
+import asyncio
+import time
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+from app import upstream as upstream_module
+from app.http_clients import HTTPClientRegistry, UpstreamConfig
+from app.upstream import CircuitBreaker, TokenBucketLimiter, Upstream, UpstreamPolicy
+from tests.fake_gemini import DROP, FakeGemini
+
+URL = "http://fake/v1beta/models/fake:generateContent"
+PAYLOAD = {"contents": [{"parts": [{"text": "نص"}]}]}
+
+
+@pytest.fixture
+def fake():
+    return FakeGemini()
+
+
+@pytest.fixture
+def registry(fake, monkeypatch):
+    registry = HTTPClientRegistry()
+    registry.register(UpstreamConfig(name="gemini", transport=httpx.ASGITransport(app=fake)))
+    monkeypatch.setattr(upstream_module, "http_clients", registry)
+    return registry
+
+
+def _upstream(**policy) -> Upstream:
+    policy = {"base_delay": 0.01, "max_delay": 0.02, **policy}
+    return Upstream("gemini", UpstreamPolicy(**policy))
+
+
+def _sender(registry):
+    client = registry.get("gemini")
+
+    async def send() -> httpx.Response:
+        return await client.post(URL, json=PAYLOAD)
+
+    return send
+
+
+@pytest.mark.anyio
+async def test_transient_failures_are_retried(fake, registry):
+    upstream = _upstream(attempts=3)
+    fake.fail_next(503, DROP)
+
+    response = await upstream.call(_sender(registry))
+
+    assert response.status_code == 200
+    assert fake.calls == 3
+    assert upstream.retries == 2
+    assert upstream.breaker.state == "closed"
+
+
+@pytest.mark.anyio
+async def test_client_errors_are_returned_without_retry(fake, registry):
+    upstream = _upstream(attempts=3)
+    fake.fail_next(400)
+
+    response = await upstream.call(_sender(registry))
+
+    assert response.status_code == 400
+    assert fake.calls == 1
+
+
+@pytest.mark.anyio
+async def test_exhausted_retries_map_to_bad_gateway(fake, registry):
+    upstream = _upstream(attempts=2)
+    fake.fail_next(500, 500)
+
+    with pytest.raises(HTTPException) as error:
+        await upstream.call(_sender(registry))
+
+    assert error.value.status_code == 502
+    assert upstream.failures == 1
+
+
+@pytest.mark.anyio
+async def test_deadline_bounds_all_attempts(fake, registry):
+    upstream = _upstream(attempts=10, attempt_timeout=0.2, deadline=0.5)
+    fake.delay = 1.0
+
+    started = time.monotonic()
+    with pytest.raises(HTTPException) as error:
+        await upstream.call(_sender(registry))
+
+    assert error.value.status_code == 504
+    assert time.monotonic() - started < 0.8
+    assert fake.calls <= 3
+
+
+@pytest.mark.anyio
+async def test_slow_request_is_hedged(fake, registry):
+    stats = registry.upstream_stats("gemini")
+    for _ in range(5):
+        stats.record_response(0.02, False)
+    upstream = _upstream(hedge=True, hedge_min_samples=5, hedge_min_delay=0.05)
+    fake.delay_next(2.0)
+
+    started = time.monotonic()
+    response = await upstream.call(_sender(registry))
+
+    assert response.status_code == 200
+    assert time.monotonic() - started < 1.0
+    assert upstream.hedges == 1
+    assert upstream.hedge_wins == 1
+    assert fake.calls == 2
+
+
+@pytest.mark.anyio
+async def test_open_breaker_fails_fast_then_admits_one_probe(fake, registry):
+    upstream = _upstream(attempts=1, breaker_failures=2, breaker_reset_seconds=0.2)
+    send = _sender(registry)
+    fake.fail_next(503, 503)
+    for _ in range(2):
+        with pytest.raises(HTTPException):
+            await upstream.call(send)
+    assert upstream.breaker.state == "open"
+
+    with pytest.raises(HTTPException) as error:
+        await upstream.call(send)
+    assert error.value.status_code == 503
+    assert "Retry-After" in error.value.headers
+    assert fake.calls == 2
+
+    await asyncio.sleep(0.25)
+    # طلب تجربة واحد فقط أثناء half_open؛ الطلب المتزامن الثاني يُرفض فوراً
+    fake.delay = 0.1
+    results = await asyncio.gather(upstream.call(send), upstream.call(send), return_exceptions=True)
+
+    assert sorted(type(result).__name__ for result in results) == ["HTTPException", "Response"]
+    assert fake.calls == 3
+    assert upstream.breaker.state == "closed"
+
+
+def test_failed_probe_reopens_the_breaker(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr(upstream_module.time, "monotonic", lambda: clock[0])
+    breaker = CircuitBreaker(failures=1, reset_seconds=30)
+    breaker.record_failure()
+    assert not breaker.allow()
+
+    clock[0] += 30
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+    assert not breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+
+def test_token_bucket_allows_burst_then_refills(monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr(upstream_module.time, "monotonic", lambda: clock[0])
+    bucket = TokenBucketLimiter(rate=1.0, capacity=2)
+
+    assert bucket.consume("user:1") == 0
+    assert bucket.consume("user:1") == 0
+    assert bucket.consume("user:1") == pytest.approx(1.0)
+    # مفتاح آخر له ميزانيته الخاصة
+    assert bucket.consume("user:2") == 0
+
+    clock[0] += 1.0
+    assert bucket.consume("user:1") == 0
+    assert bucket.limited == 1
+
+
+def test_token_bucket_check_raises_429(monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr(upstream_module.time, "monotonic", lambda: clock[0])
+    bucket = TokenBucketLimiter(rate=0.5, capacity=1)
+    bucket.check("ip:1")
+
+    with pytest.raises(HTTPException) as limited:
+        bucket.check("ip:1")
+    assert limited.value.status_code == 429
+    assert limited.value.headers["Retry-After"] == "3"
+
+    with pytest.raises(HTTPException) as oversized:
+        bucket.check("ip:2", cost=5)
+    assert oversized.value.status_code == 429
+    assert oversized.value.headers is None